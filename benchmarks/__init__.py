@@ -0,0 +1 @@
+"""Offline benchmarks for the SSCMA client, device and rendering hot paths."""
@@ -0,0 +1,48 @@
+import re
+import sys
+import click
+
+from . import bench_client, bench_device, bench_flasher, bench_image, bench_import, bench_memory  # noqa: F401
+from .common import BENCHMARKS, report, compare, load, save
+
+
+@click.command()
+@click.option('--filter', '-k', 'pattern', default=None, help='Only run benchmark groups matching this regex')
+@click.option('--output', '-o', default=None, help='Write the results to this JSON file')
+@click.option('--compare', '-c', 'baseline', default=None, help='Compare the results with this JSON file')
+@click.option('--threshold', '-t', default=0.1, help='Relative slowdown reported as a regression')
+@click.option('--quick', '-q', is_flag=True, default=False, help='Run fewer iterations')
+@click.option('--list', 'list_only', is_flag=True, default=False, help='List the benchmark groups and exit')
+def main(pattern, output, baseline, threshold, quick, list_only):
+    if list_only:
+        for name in BENCHMARKS:
+            click.echo(name)
+        return
+
+    results = []
+    for name, func in BENCHMARKS.items():
+        if pattern is not None and not re.search(pattern, name):
+            continue
+        click.echo("running {}".format(name), err=True)
+        for r in func(quick=quick):
+            click.echo("{:<48} {:>12.3f} {}".format(r["name"], r["value"], r["unit"]))
+            results.append(r)
+
+    document = report(results)
+    if output is not None:
+        save(output, document)
+
+    if baseline is not None:
+        regressions = 0
+        click.echo("\n{:<48} {:>12} {:>12} {:>8}".format("name", "baseline", "current", "change"))
+        for name, old, new, change, regressed in compare(load(baseline), document, threshold):
+            regressions += regressed
+            click.echo("{:<48} {:>12.3f} {:>12.3f} {:>+7.1f}%{}".format(
+                name, old, new, change * 100, "  REGRESSION" if regressed else ""))
+        if regressions:
+            click.echo("\n{} regression(s) above {:.0f}%".format(regressions, threshold * 100))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import time
+
+from sscma.micro.client import Client, SerialClient, backoff_delay
+from sscma.micro.const import *
+from sscma.emulator import DeviceEmulator, PtyTransport
+
+from .common import benchmark, result, percentile
+
+FRAME_SIZES = [(0, 0), (160, 120), (320, 240), (640, 480)]
+CHUNK_SIZES = [64, 1024, 16384, 0]  # 0 feeds every frame at once
+
+
+def make_frame(width, height, boxes=3, binary=False):
+    """Builds a synthetic INVOKE frame, (0, 0) builds a result only frame."""
+    emulator = DeviceEmulator(width=max(width, 16), height=max(height, 16), boxes=boxes, seed=0)
+    if width == 0:
+        emulator._result_only = True
+    return emulator.event_frame(EVENT_INVOKE, binary=binary)
+
+
+def parse(stream, chunk_size, binary=False):
+    """Feeds a byte stream to a Client, returns the number of events."""
+    events = []
+    client = Client(on_event=events.append)
+    # as after a successful negotiate_binary
+    client._binary_images = binary
+    if chunk_size == 0:
+        client.on_recieve(stream)
+    else:
+        for i in range(0, len(stream), chunk_size):
+            client.on_recieve(stream[i:i + chunk_size])
+    return len(events)
+
+
+@benchmark("parse")
+def bench_parse(quick=False):
+    results = []
+    budget = 256 * 1024 if quick else 2 * 1024 * 1024
+    for (width, height), binary in [(size, False) for size in FRAME_SIZES] + \
+            [(size, True) for size in FRAME_SIZES if size != (0, 0)]:
+        frame = make_frame(width, height, binary=binary)
+        count = max(3, budget // len(frame))
+        prefix = "parse.{}x{}{}".format(width, height, ".binary" if binary else "")
+        results.append(result(prefix + ".frame_bytes", len(frame), "B", higher_is_better=False))
+        for chunk_size in CHUNK_SIZES:
+            if chunk_size == 0:
+                stream_count = count
+                stream = frame * count
+            else:
+                # small chunks rescan the buffer, keep the run bounded
+                stream_count = max(3, min(count, (budget // 8) // len(frame) if chunk_size < 1024 else count))
+                stream = frame * stream_count
+            start = time.perf_counter()
+            parsed = parse(stream, chunk_size, binary)
+            elapsed = time.perf_counter() - start
+            assert parsed == stream_count, "parsed {} of {} frames".format(parsed, stream_count)
+            name = "{}.chunk{}".format(prefix, chunk_size or "all")
+            results.append(result(name + ".fps", stream_count / elapsed, "frames/s",
+                                  frame_bytes=len(frame), chunk_size=chunk_size, frames=stream_count))
+            results.append(result(name + ".throughput", len(stream) / elapsed / 1e6, "MB/s",
+                                  frame_bytes=len(frame), chunk_size=chunk_size, frames=stream_count))
+    return results
+
+
+def roundtrip(client, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get(CMD_AT_ID)
+        timings.append(time.perf_counter() - start)
+        assert response is not None, "command timeout"
+    return timings
+
+
+@benchmark("roundtrip")
+def bench_roundtrip(quick=False):
+    count = 50 if quick else 500
+    results = []
+
+    emulator = DeviceEmulator()
+    client = Client(emulator.write)
+    emulator.on_write = client.on_recieve
+    timings = roundtrip(client, count)
+    for q in (50, 99):
+        results.append(result("roundtrip.loopback.p{}".format(q), percentile(timings, q) * 1e3, "ms",
+                              higher_is_better=False, commands=count))
+
+    emulator = DeviceEmulator()
+    transport = PtyTransport(emulator)
+    transport.start()
+    client = SerialClient(transport.port)
+    client.loop_start()
+    try:
+        timings = roundtrip(client, count)
+    finally:
+        client.loop_stop()
+        transport.stop()
+    for q in (50, 99):
+        results.append(result("roundtrip.pty.p{}".format(q), percentile(timings, q) * 1e3, "ms",
+                              higher_is_better=False, commands=count))
+    return results
+
+
+def reconnect_storm(clients, outage, delay, window=0.1):
+    """
+    Simulates clients reconnecting to a broker down for `outage` seconds.
+
+    Returns:
+    - (peak, attempts): largest number of attempts in a window once the
+      broker is back, and the attempts made by all clients.
+    """
+    arrivals = []
+    for _ in range(clients):
+        now, attempt = 0.0, 0
+        while True:
+            now += delay(attempt)
+            attempt += 1
+            arrivals.append(now)
+            if now >= outage:
+                break
+    buckets = {}
+    for arrival in arrivals:
+        if arrival >= outage:
+            bucket = int(arrival / window)
+            buckets[bucket] = buckets.get(bucket, 0) + 1
+    return max(buckets.values()), len(arrivals)
+
+
+@benchmark("reconnect")
+def bench_reconnect(quick=False):
+    results = []
+    clients = 500
+    cases = [
+        ("fixed", lambda attempt: 1.0),
+        ("exponential", lambda attempt: min(60.0, 2.0 ** attempt)),
+        ("jittered", lambda attempt: backoff_delay(attempt, 1.0, 60.0)),
+    ]
+    for name, delay in cases:
+        peak, attempts = reconnect_storm(clients, 10.0, delay)
+        results.append(result("reconnect.{}.peak".format(name), peak, "connects/100ms",
+                              higher_is_better=False, clients=clients))
+        results.append(result("reconnect.{}.attempts".format(name), attempts, "attempts",
+                              higher_is_better=False, clients=clients))
+    return results
@@ -0,0 +1,150 @@
+import json
+import time
+
+from contextlib import contextmanager
+
+from sscma.micro.device import Device
+from sscma.micro.const import *
+from sscma.emulator import DeviceEmulator, LoopbackTransport
+
+from .common import benchmark, result, percentile
+
+
+@contextmanager
+def make_device(on_monitor):
+    """Yields a Device initialized by an emulator, events are fed by the benchmark."""
+    transport = LoopbackTransport(DeviceEmulator(fps=0))
+    transport.start()
+    try:
+        device = Device(transport.client)
+        device.initialize()
+        device.on_monitor = on_monitor
+        yield device
+    finally:
+        transport.stop()
+
+
+def make_event(stream, width, height, boxes):
+    emulator = DeviceEmulator(width=width, height=height, boxes=boxes, seed=0)
+    return json.loads(emulator.event_frame(stream)[1:-1])
+
+
+def run(device, event, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        # _event_process replaces the image in place
+        device._event_process(dict(event, data=dict(event["data"])))
+    return count / (time.perf_counter() - start)
+
+
+@benchmark("device")
+def bench_device(quick=False):
+    results = []
+    count = 20 if quick else 200
+    for width, height in [(240, 240), (640, 480)]:
+        cases = [
+            ("dispatch", None, EVENT_INVOKE, 3),
+            ("reencode", lambda device, msg: None, EVENT_SAMPLE, 0),
+            ("annotate", lambda device, msg: None, EVENT_INVOKE, 3),
+            ("annotate10", lambda device, msg: None, EVENT_INVOKE, 10),
+        ]
+        for name, on_monitor, stream, boxes in cases:
+            event = make_event(stream, width, height, boxes)
+            with make_device(on_monitor) as device:
+                fps = run(device, event, count)
+            results.append(result("device.{}x{}.{}".format(width, height, name), fps, "frames/s",
+                                  boxes=boxes, frames=count))
+    return results
+
+
+def recover(device, emulator, frames, stalls):
+    """Stalls the stream of a device, returns the mean seconds it took to recover."""
+    from sscma.emulator import STALL_REINVOKE
+
+    for stall in range(stalls):
+        count = len(frames)
+        while len(frames) < count + 10:
+            time.sleep(0.01)
+        emulator.stall(STALL_REINVOKE)
+        while device.stats()["recovery"]["count"] <= stall:
+            time.sleep(0.01)
+    recovery = device.stats()["recovery"]
+    return recovery["sum"] / recovery["count"]
+
+
+@benchmark("stall")
+def bench_stall(quick=False):
+    """Time to recover a 30 fps stream from a stall, learnt timeout against the fixed one."""
+    from sscma.micro.client import SerialClient
+    from sscma.emulator import PtyTransport
+
+    results = []
+    for name, warmup in (("adaptive", Device._stall_warmup), ("fixed", float("inf"))):
+        emulator = DeviceEmulator(fps=30, width=64, height=64)
+        transport = PtyTransport(emulator)
+        transport.start()
+        frames = []
+        device = Device(SerialClient(transport.port))
+        device._stall_warmup = warmup
+        device.on_connect = lambda device: device.Invoke(-1)
+        device.on_monitor = lambda device, msg: frames.append(msg)
+        try:
+            device.loop_start()
+            seconds = recover(device, emulator, frames, 1 if quick or name == "fixed" else 5)
+        finally:
+            device.loop_stop()
+            transport.stop()
+        results.append(result("stall.30fps.{}.recovery".format(name), seconds * 1e3, "ms",
+                              higher_is_better=False, fps=30))
+    return results
+
+
+class StampedEmulator(DeviceEmulator):
+    """Emulator stamping its events with the time they were produced."""
+
+    def _event_data(self, stream, count):
+        data = super()._event_data(stream, count)
+        data["produced"] = time.time()
+        return data
+
+
+@benchmark("pace")
+def bench_pace(quick=False):
+    """End-to-end latency of a 60 fps MQTT stream consumed at 20 fps, free-running against host-paced."""
+    from sscma.micro.client import MQTTClient
+    from sscma.emulator import MQTTBroker, MQTTTransport
+
+    results = []
+    seconds = 2 if quick else 6
+    for name, params in (("free", {}), ("credits2", {"credits": 2}), ("fps15", {"target_fps": 15})):
+        broker = MQTTBroker()
+        broker.start()
+        emulator = StampedEmulator(fps=60, width=320, height=240)
+        transport = MQTTTransport(emulator, broker)
+        transport.start()
+        latencies = []
+
+        def on_monitor(device, msg):
+            latencies.append(time.time() - msg["produced"])
+            time.sleep(0.05)
+
+        device = Device(MQTTClient(host=broker.host, port=broker.port,
+                                   tx_topic=transport.rx_topic, rx_topic=transport.tx_topic), **params)
+        device.on_connect = lambda device: device.Invoke(-1)
+        device.on_monitor = on_monitor
+        try:
+            device.loop_start()
+            time.sleep(seconds)
+            count = len(latencies)
+        finally:
+            device.on_monitor = None
+            device.Break()
+            device.loop_stop()
+            transport.stop()
+            broker.stop()
+        # the second half, once a free-running backlog built up
+        tail = latencies[count // 2:count]
+        results.append(result("pace.60fps.{}.latency.p95".format(name), percentile(tail, 95) * 1e3, "ms",
+                              higher_is_better=False, **params))
+        results.append(result("pace.60fps.{}.fps".format(name), count / seconds, "frames/s", **params))
+    return results
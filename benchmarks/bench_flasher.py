@@ -0,0 +1,71 @@
+import os
+import time
+
+from sscma.emulator import BootloaderEmulator, PtyTransport
+from sscma.flashers.core import HimaxFlasher
+
+from .common import benchmark, result
+
+# line rate and per-packet handling time of the simulated bootloader
+BAUDRATE = 921600
+ACK_DELAY = 0.002
+
+
+def flash(data, mode, support_1k=True, offset=0, ack_timeout=1, reset_delay=0.5, **kwargs):
+    """
+    Flashes data to a simulated bootloader.
+
+    Args:
+    - ack_timeout: seconds the flasher waits for a lost ACK.
+    - reset_delay: seconds of the port toggle rebooting the device.
+    - kwargs: further arguments of the BootloaderEmulator, like error_rate.
+
+    Returns:
+    - elapsed: seconds of the whole write.
+    - transfer: seconds between the first and the last acknowledged packet.
+    - retries: packets the flasher sent again.
+    - bootloader: the BootloaderEmulator, holding the received images.
+    """
+    bootloader = BootloaderEmulator(support_1k=support_1k, baudrate=BAUDRATE, ack_delay=ACK_DELAY, **kwargs)
+    transport = PtyTransport(bootloader)
+    transport.start()
+    marks = []
+    try:
+        flasher = HimaxFlasher(transport.port, mode=mode, ack_timeout=ack_timeout, reset_delay=reset_delay)
+        start = time.perf_counter()
+        flasher.write(data, offset, callback=lambda written, total: marks.append(time.perf_counter()))
+        elapsed = time.perf_counter() - start
+    finally:
+        transport.stop()
+    assert bootloader.images and bootloader.images[-1][1][:len(data)] == data, "image corrupted"
+    return elapsed, marks[-1] - marks[0], flasher.retries, bootloader
+
+
+@benchmark("flasher")
+def bench_flasher(quick=False):
+    results = []
+    data = os.urandom(64 * 1024 if quick else 512 * 1024)
+    cases = [
+        ("xmodem", True, {}),
+        ("xmodem1k", True, {}),
+        ("xmodem1k", False, {}),
+        # a noisy line, a lost ACK costs the serial timeout
+        ("xmodem", True, dict(error_rate=0.02, drop_rate=0.005, seed=1)),
+        ("xmodem1k", True, dict(error_rate=0.02, drop_rate=0.005, seed=1)),
+        ("xmodem1k", True, dict(error_rate=0.02, drop_rate=0.005, seed=1, ack_timeout=0.1)),
+        ("xmodem1k", True, dict(reset_delay=0.1)),
+    ]
+    for mode, support_1k, options in cases:
+        elapsed, transfer, retries, _ = flash(data, mode, support_1k, **options)
+        name = "flasher.{}{}".format(mode, "" if support_1k else ".fallback")
+        if "error_rate" in options:
+            name += ".lossy"
+        if "ack_timeout" in options:
+            name += ".ack_timeout{}".format(options["ack_timeout"])
+        if "reset_delay" in options:
+            name += ".reset{}".format(options["reset_delay"])
+        params = dict(bytes=len(data), baudrate=BAUDRATE, ack_delay=ACK_DELAY, **options)
+        results.append(result(name + ".throughput", len(data) / transfer / 1024, "KB/s", **params))
+        results.append(result(name + ".total", elapsed, "s", higher_is_better=False, **params))
+        results.append(result(name + ".retries", retries, "packets", higher_is_better=False, **params))
+    return results
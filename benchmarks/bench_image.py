@@ -0,0 +1,61 @@
+import base64
+
+import cv2
+import numpy as np
+
+from sscma.utils.image import image_from_base64, image_to_base64
+from sscma.emulator import DeviceEmulator
+
+from .common import benchmark, result, measure
+
+
+@benchmark("image")
+def bench_image(quick=False):
+    results = []
+    repeat = 3 if quick else 7
+    for width, height in [(240, 240), (640, 480), (1280, 720)]:
+        encoded = DeviceEmulator(width=width, height=height)._image
+        decoded = base64.b64decode(encoded)
+        image = image_from_base64(encoded)
+        size = "{}x{}".format(width, height)
+
+        cases = [
+            ("b64decode", lambda: base64.b64decode(encoded)),
+            ("b64encode", lambda: base64.b64encode(decoded)),
+            ("imdecode", lambda: cv2.imdecode(np.frombuffer(decoded, np.uint8), cv2.IMREAD_COLOR)),
+            ("image_from_base64", lambda: image_from_base64(encoded)),
+            ("image_to_base64.jpg", lambda: image_to_base64(image, ".jpg")),
+            ("image_to_base64.png", lambda: image_to_base64(image, ".png")),
+        ]
+        for name, func in cases:
+            seconds = measure(func, number=10, repeat=repeat)
+            results.append(result("image.{}.{}".format(size, name), seconds * 1e3, "ms",
+                                  higher_is_better=False, jpeg_bytes=len(decoded)))
+    return results
+
+
+@benchmark("codec")
+def bench_codec(quick=False):
+    """Compares the JPEG backends installed, at every decode scale."""
+    from sscma.utils import codec
+
+    results = []
+    repeat = 3 if quick else 7
+    batch = 16
+    for width, height in [(640, 480), (1280, 720)]:
+        jpeg = base64.b64decode(DeviceEmulator(width=width, height=height)._image)
+        size = "{}x{}".format(width, height)
+        for name in codec.available_codecs():
+            backend = codec.get_codec(name)
+            image = backend.decode(jpeg)
+            cases = [("decode.{}".format(scale), lambda scale=scale: backend.decode(jpeg, scale))
+                     for scale in codec.SCALES]
+            cases += [
+                ("encode", lambda: backend.encode(image)),
+                ("decode_batch{}".format(batch), lambda: codec.decode_batch([jpeg] * batch, codec=name, workers=4)),
+            ]
+            for case, func in cases:
+                seconds = measure(func, number=5, repeat=repeat)
+                results.append(result("codec.{}.{}.{}".format(size, name, case), seconds * 1e3, "ms",
+                                      higher_is_better=False, jpeg_bytes=len(jpeg)))
+    return results
@@ -0,0 +1,33 @@
+import sys
+import statistics
+import subprocess
+
+from .common import benchmark, result
+
+# what a fresh interpreter imports, from the package to a CLI subcommand
+IMPORTS = [
+    ("sscma", "import sscma"),
+    ("micro", "from sscma.micro import Device, SerialClient"),
+    ("flashers", "from sscma.flashers import HimaxFlasher"),
+    ("cli", "from sscma.cli.cli import cli"),
+    ("cli.flasher", "from sscma.cli.cli import cli; cli.get_command(None, 'flasher')"),
+    ("cli.client", "from sscma.cli.cli import cli; cli.get_command(None, 'client')"),
+]
+
+
+def import_time(code):
+    """Seconds a fresh interpreter spends running code, the interpreter startup excluded."""
+    script = "import time\nstart = time.perf_counter()\n{}\nprint(time.perf_counter() - start)".format(code)
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    return float(output)
+
+
+@benchmark("import")
+def bench_import(quick=False):
+    results = []
+    repeat = 3 if quick else 10
+    for name, code in IMPORTS:
+        import_time(code)  # warm up the bytecode and file system caches
+        seconds = statistics.median(import_time(code) for _ in range(repeat))
+        results.append(result("import.{}".format(name), seconds * 1000, "ms", higher_is_better=False))
+    return results
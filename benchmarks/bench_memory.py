@@ -0,0 +1,40 @@
+import gc
+import tracemalloc
+
+from sscma.micro.client import Client
+
+from .common import benchmark, result
+from .bench_client import make_frame
+from .bench_device import make_device
+
+
+def peak_bytes(func):
+    """Peak Python heap allocated by func, buffers owned by PIL/OpenCV are not traced."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@benchmark("memory")
+def bench_memory(quick=False):
+    results = []
+    for width, height in [(240, 240), (640, 480)]:
+        frame = make_frame(width, height)
+        size = "{}x{}".format(width, height)
+
+        client = Client()
+        client.on_event = lambda event: None
+        peak = peak_bytes(lambda: client.on_recieve(frame))
+        results.append(result("memory.{}.parse".format(size), peak / 1024, "KiB",
+                              higher_is_better=False, frame_bytes=len(frame)))
+
+        with make_device(lambda device, msg: None) as device:
+            client = Client(on_event=device._event_process)
+            peak = peak_bytes(lambda: client.on_recieve(frame))
+        results.append(result("memory.{}.annotate".format(size), peak / 1024, "KiB",
+                              higher_is_better=False, frame_bytes=len(frame)))
+    return results
@@ -0,0 +1,117 @@
+import json
+import time
+import platform
+import statistics
+from typing import Callable, Dict, List  # noqa: F401
+
+import sscma
+from sscma.micro.metrics import percentile  # noqa: F401
+
+BENCHMARKS = {}  # type: Dict[str, Callable]
+
+
+def benchmark(name):
+    """
+    Registers a benchmark.
+
+    The decorated function receives a `quick` flag and returns a list of
+    results built with `result`.
+
+    Args:
+    - name: name of the benchmark group.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+def result(name, value, unit, higher_is_better=True, **params):
+    """
+    Builds a single benchmark result.
+
+    Args:
+    - name: unique name of the measurement.
+    - value: measured value.
+    - unit: unit of the value.
+    - higher_is_better: whether a larger value is an improvement.
+    - params: parameters of the measurement, stored for reference.
+    """
+    return {
+        "name": name,
+        "value": value,
+        "unit": unit,
+        "higher_is_better": higher_is_better,
+        "params": params,
+    }
+
+
+def measure(func, number=1, repeat=5):
+    """
+    Times a function.
+
+    Args:
+    - func: function to time, called without arguments.
+    - number: calls per timed run.
+    - repeat: timed runs.
+
+    Returns:
+    - seconds: median seconds per call over the runs.
+    """
+    func()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return statistics.median(timings)
+
+
+def report(results):
+    """Builds the JSON document of a benchmark run."""
+    return {
+        "meta": {
+            "sscma": sscma.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {r["name"]: r for r in results},
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compares two benchmark reports.
+
+    Args:
+    - baseline: report of the reference run.
+    - current: report of the new run.
+    - threshold: relative change considered a regression.
+
+    Returns:
+    - rows: list of (name, baseline, current, change, regressed) tuples where
+      change is the relative improvement, negative for slowdowns.
+    """
+    rows = []
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None or not old["value"]:
+            continue
+        change = (new["value"] - old["value"]) / old["value"]
+        if not new.get("higher_is_better", True):
+            change = -change
+        rows.append((name, old["value"], new["value"], change, change < -threshold))
+    return rows
+
+
+def load(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save(path, document):
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
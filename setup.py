@@ -30,6 +30,9 @@ setuptools.setup(
         'click',
         'opencv-python',
     ],
+    extras_require={
+        'jpeg': ['simplejpeg'],
+    },
     classifiers=[
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python :: 3',
@@ -41,6 +44,9 @@ setuptools.setup(
     entry_points={
         'console_scripts': [
             'sscma.cli = sscma.cli.cli:main',
-        ]
+        ],
+        'sscma.flashers': [
+            'himax = sscma.flashers.core:HimaxFlasher',
+        ],
     }
 )
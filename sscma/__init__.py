@@ -1,4 +1,12 @@
-from . import micro
-from . import flashers
-from . import utils
-__version__ = "0.5.7"
\ No newline at end of file
+import importlib
+
+__version__ = "0.5.7"
+
+# subpackages are imported on first use
+_SUBPACKAGES = ('micro', 'flashers', 'utils')
+
+
+def __getattr__(name):
+    if name in _SUBPACKAGES:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
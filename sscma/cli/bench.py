@@ -0,0 +1,343 @@
+
+import os
+import json
+import time
+import logging
+import click
+
+from threading import Thread, Event, Lock
+
+from sscma.micro.client import Client, SerialClient, MQTTClient
+from sscma.micro.device import Device
+from sscma.micro.const import *
+from sscma.micro.metrics import percentile
+
+logging.basicConfig(level=logging.WARNING)
+
+PERCENTILES = (50, 90, 99)
+
+
+def _distribution(values, scale=1e3):
+    summary = {"p{}".format(q): percentile(values, q) * scale for q in PERCENTILES}
+    summary["max"] = max(values) * scale if values else 0.0
+    return summary
+
+
+class Recorder:
+    """
+    Collects the frame timings and command round-trips of one device.
+
+    Attributes:
+    - name: name of the device in the report.
+    - client: client the device is reached through.
+    - frames: number of frames received since start.
+    """
+
+    def __init__(self, name, client, probe_interval=1.0):
+        """
+        Initializes the Recorder class.
+
+        Args:
+        - name: name of the device in the report.
+        - client: client the device is reached through.
+        - probe_interval: seconds between two round-trip probes, 0 disables them.
+        """
+        self.name = name
+        self.client = client
+        self.frames = 0
+
+        self._probe_interval = probe_interval
+        self._intervals = []
+        self._sizes = []
+        self._rtts = []
+        self._last = None
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+        self._stats = None
+        self._start = 0.0
+
+    def start(self):
+        """Reset the counters and start probing."""
+        with self._lock:
+            self.frames = 0
+            self._intervals = []
+            self._sizes = []
+            self._last = None
+        self._stats = self.client.stats()
+        self._start = time.perf_counter()
+        if self._probe_interval:
+            self._stopped.clear()
+            self._thread = Thread(target=self._probe_thread, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop probing."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def frame(self, size=0):
+        """
+        Record a frame received now.
+
+        Args:
+        - size: bytes of the image the frame carries.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            if self._last is not None:
+                self._intervals.append(now - self._last)
+            self._last = now
+            self._sizes.append(size)
+            self.frames += 1
+
+    def event(self, event):
+        """Record an invoke or sample event as a frame, the other events are ignored."""
+        if EVENT_INVOKE in event["name"] or EVENT_SAMPLE in event["name"]:
+            image = event["data"].get("image") if event["code"] == CMD_OK else None
+            self.frame(len(image) if image else 0)
+
+    def monitor(self, device, reply):
+        """Record a frame once on_monitor got it decoded and annotated."""
+        self.frame(len(reply.get("raw_image") or ""))
+
+    def _probe_thread(self):
+        # a query answered while the device streams gives the loaded link latency
+        while not self._stopped.is_set():
+            start = time.perf_counter()
+            if self.client.get(CMD_AT_ID) is not None:
+                self._rtts.append(time.perf_counter() - start)
+            self._stopped.wait(max(0, self._probe_interval - (time.perf_counter() - start)))
+
+    @property
+    def last_rtt(self):
+        """Return the latest round-trip time in seconds."""
+        return self._rtts[-1] if self._rtts else None
+
+    def bytes(self):
+        """Return the bytes received since start."""
+        return self.client.stats()["bytes_received"] - self._stats["bytes_received"]
+
+    def report(self, elapsed):
+        """
+        Builds the report of the device.
+
+        Args:
+        - elapsed: seconds the benchmark ran.
+
+        Returns:
+        - report: frame rate, inter-frame interval and jitter percentiles,
+          byte rate, image size percentiles, round-trip percentiles and client
+          error counters.
+        """
+        with self._lock:
+            intervals = list(self._intervals)
+            sizes = list(self._sizes)
+            frames = self.frames
+        # jitter is the deviation of every interval from the median one
+        median = percentile(intervals, 50)
+        stats = self.client.stats()
+        received = stats["bytes_received"] - self._stats["bytes_received"]
+        return {
+            "frames": frames,
+            "fps": frames / elapsed if elapsed else 0.0,
+            "bytes": received,
+            "bytes_per_second": received / elapsed if elapsed else 0.0,
+            "interval_ms": _distribution(intervals),
+            "jitter_ms": _distribution([abs(interval - median) for interval in intervals]),
+            "image_bytes": _distribution(sizes, scale=1),
+            "rtt_ms": dict(_distribution(self._rtts), count=len(self._rtts)),
+            "parse_failures": stats["parse_failures"] - self._stats["parse_failures"],
+            "buffer_resyncs": stats["buffer_resyncs"] - self._stats["buffer_resyncs"],
+            "retries": stats["retries"] - self._stats["retries"],
+            "timeouts": stats["timeouts"] - self._stats["timeouts"],
+        }
+
+
+def _record(recorder, process):
+    # frames are timed as the client parses them, before the device processes them
+    def on_event(event):
+        recorder.event(event)
+        process(event)
+    return on_event
+
+
+def _replay(client, data, chunk_size, stop):
+    # the capture is fed in chunks as the transport would deliver it, looping until stopped
+    while not stop.is_set():
+        for offset in range(0, len(data), chunk_size):
+            client.on_recieve(data[offset:offset + chunk_size])
+            if stop.is_set():
+                break
+
+
+@click.command()
+@click.option('--broker', '-B', default=None, help='Specify the MQTT broker address')
+@click.option('--username', '-U', default=None, help='Specify the MQTT username')
+@click.option('--password', '-P', default=None, help='Specify the MQTT password')
+@click.option('--device', '-D', multiple=True, help='Specify the Device ID, repeat for several devices')
+@click.option('--port', '-p', multiple=True, help='Specify the Port to connect to, repeat for several serial devices')
+@click.option('--baudrate', '-b', default=921600, help='Specify the Baudrate for the serial connection')
+@click.option('--emulator', '-e', default=0, help='Specify the number of emulated devices to run over pseudo terminals')
+@click.option('--emulator_fps', default=30.0, help='Specify the frame rate of the emulated devices')
+@click.option('--replay', '-r', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Specify a capture of raw bytes received from a device to decode as fast as possible')
+@click.option('--chunk_size', default=4096, help='Specify the size of the chunks a capture is replayed in')
+@click.option('--sample', is_flag=True, default=False, help='Enable the Sample mode, default is Invoke mode')
+@click.option('--result_only', is_flag=True, default=False, help='Invoke without receiving images')
+@click.option('--annotate', is_flag=True, default=False,
+              help='Time frames after they are decoded and annotated for on_monitor, default is as they are parsed')
+@click.option('--duration', '-t', default=10.0, help='Specify the seconds to run, 0 runs until the frame count or Ctrl-C')
+@click.option('--frames', '-n', default=0, help='Specify the frames to receive from every device before stopping')
+@click.option('--interval', '-i', default=1.0, help='Specify the seconds between two live summaries')
+@click.option('--probe_interval', default=1.0, help='Specify the seconds between two round-trip probes, 0 disables them')
+@click.option('--connect_timeout', default=10.0, help='Specify the seconds to wait for the devices to be ready')
+@click.option('--output', '-o', default=None, help='Specify the file to write the JSON report to, default is stdout')
+def bench(broker, username, password, device, port, baudrate, emulator, emulator_fps, replay, chunk_size,
+          sample, result_only, annotate, duration, frames, interval, probe_interval, connect_timeout, output):
+    """Measure the throughput and latency of the link to devices."""
+    if duration <= 0 and frames <= 0 and replay is not None:
+        raise click.UsageError("a replay needs --duration or --frames")
+
+    transports = []
+    devices = {}
+    recorders = {}
+    stop = Event()
+    replay_thread = None
+
+    try:
+        if replay is not None:
+            with open(replay, "rb") as f:
+                data = f.read()
+            client = Client()
+            recorders[os.path.basename(replay)] = Recorder(os.path.basename(replay), client, probe_interval=0)
+            client.on_event = recorders[os.path.basename(replay)].event
+        else:
+            clients = {}
+            if emulator:
+                from sscma.emulator import DeviceEmulator, PtyTransport
+                for index in range(emulator):
+                    transport = PtyTransport(DeviceEmulator(id="emulator{}".format(index), fps=emulator_fps))
+                    transport.start()
+                    transports.append(transport)
+                    clients["emulator{}".format(index)] = SerialClient(transport.port, baudrate)
+
+            if broker is not None:
+                shared = None
+                for device_id in device or (None,):
+                    shared = MQTTClient(host=broker, port=int(port[0]) if port else 1883,
+                                        tx_topic="sscma/v0/{}/rx".format(device_id),
+                                        rx_topic="sscma/v0/{}/tx".format(device_id),
+                                        shared=shared, username=username, password=password)
+                    clients[str(device_id)] = shared
+            elif port or not emulator:
+                for name in port or (None,):
+                    clients[os.path.basename(name) if name else str(name)] = SerialClient(name, baudrate)
+
+            ready = {name: Event() for name in clients}
+
+            def _connected(name):
+                # the device hooks the client on every connection, the recorder goes in front of it
+                if not annotate:
+                    clients[name].on_event = _record(recorders[name], clients[name].on_event)
+                ready[name].set()
+
+            for name, client in clients.items():
+                devices[name] = dev = Device(client)
+                recorders[name] = Recorder(name, client, probe_interval=probe_interval)
+                if annotate:
+                    # includes the host cost of decoding, annotating and encoding every frame
+                    dev.on_monitor = recorders[name].monitor
+                dev.on_connect = lambda dev, name=name: _connected(name)
+
+            click.echo("Waiting for {} device(s) to be ready".format(len(devices)), err=True)
+            threads = [Thread(target=dev.loop_start, daemon=True) for dev in devices.values()]
+            for thread in threads:
+                thread.start()
+            deadline = time.monotonic() + connect_timeout
+            for name, event in ready.items():
+                if not event.wait(max(0, deadline - time.monotonic())):
+                    raise click.ClickException("device {} is not ready".format(name))
+
+            for dev in devices.values():
+                if sample:
+                    dev.Sample(-1)
+                else:
+                    dev.Invoke(-1, show=not result_only)
+
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for recorder in recorders.values():
+            recorder.start()
+        if replay is not None:
+            replay_thread = Thread(target=_replay, args=(client, data, chunk_size, stop), daemon=True)
+            replay_thread.start()
+
+        last = {name: (start, 0, 0) for name in recorders}
+        try:
+            while True:
+                now = time.perf_counter()
+                remaining = [duration - (now - start)] if duration > 0 else []
+                remaining.append(interval - (now - max(t for t, _, _ in last.values())))
+                time.sleep(max(0.01, min(remaining + [0.1])))
+
+                now = time.perf_counter()
+                if duration > 0 and now - start >= duration:
+                    break
+                if frames > 0 and all(recorder.frames >= frames for recorder in recorders.values()):
+                    break
+
+                for name, recorder in recorders.items():
+                    then, count, received = last[name]
+                    if now - then < interval:
+                        continue
+                    current = (now, recorder.frames, recorder.bytes())
+                    rtt = recorder.last_rtt
+                    click.echo("{}: {:.1f} fps, {:.1f} KB/s, rtt {}".format(
+                        name,
+                        (current[1] - count) / (now - then),
+                        (current[2] - received) / (now - then) / 1024,
+                        "{:.1f} ms".format(rtt * 1e3) if rtt is not None else "-"), err=True)
+                    last[name] = current
+        except KeyboardInterrupt:
+            pass
+
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        stop.set()
+        for recorder in recorders.values():
+            recorder.stop()
+
+        reports = {name: recorder.report(elapsed) for name, recorder in recorders.items()}
+        for name, dev in devices.items():
+            stats = dev.stats()
+            reports[name].update(reinvokes=stats["reinvokes"], resamples=stats["resamples"], resets=stats["resets"])
+
+        report = {
+            "mode": "replay" if replay is not None else "sample" if sample else "invoke",
+            "duration": elapsed,
+            "cpu": {"seconds": cpu, "percent": cpu / elapsed * 100 if elapsed else 0.0},
+            "total": {
+                "frames": sum(r["frames"] for r in reports.values()),
+                "fps": sum(r["fps"] for r in reports.values()),
+                "bytes_per_second": sum(r["bytes_per_second"] for r in reports.values()),
+            },
+            "devices": reports,
+        }
+        text = json.dumps(report, indent=2)
+        if output is not None:
+            with open(output, "w") as f:
+                f.write(text + "\n")
+            click.echo("Report written to {}".format(output), err=True)
+        else:
+            click.echo(text)
+    finally:
+        stop.set()
+        if replay_thread is not None:
+            replay_thread.join()
+        for dev in devices.values():
+            dev.loop_stop()
+        for transport in transports:
+            transport.stop()
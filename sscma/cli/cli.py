@@ -1,15 +1,37 @@
+import importlib
+
 import click
 
-from sscma.cli.flahser import flasher
-from sscma.cli.client import client
+# subcommands are imported when invoked, so each one only loads its own
+# dependencies
+COMMANDS = {
+    'flasher': 'sscma.cli.flahser:flasher',
+    'client': 'sscma.cli.client:client',
+    'bench': 'sscma.cli.bench:bench',
+}
+
+
+class LazyGroup(click.Group):
+    """A click group importing its subcommands on first use."""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
 
-@click.group()
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name not in self.commands and name in self.lazy_commands:
+            module, attribute = self.lazy_commands[name].split(':')
+            self.add_command(getattr(importlib.import_module(module), attribute), name)
+        return super().get_command(ctx, name)
+
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
 def cli():
     pass
 
-cli.add_command(flasher)
-cli.add_command(client)
-
 def main():
     cli()
 
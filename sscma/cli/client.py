@@ -2,13 +2,14 @@
 import os
 import time
 import logging
-import cv2
 import click
 
+from threading import Thread
+
 from sscma.micro.client import SerialClient, MQTTClient
 from sscma.micro.device import Device
 from sscma.micro.const import *
-from sscma.utils.image import  image_from_base64
+from sscma.utils.writer import FrameWriter
 
 logging.basicConfig(level=logging.WARNING)
 
@@ -16,99 +17,133 @@ logging.basicConfig(level=logging.WARNING)
 @click.option('--broker', '-B', default=None, help='Specify the MQTT broker address')
 @click.option('--username', '-U', default=None, help='Specify the MQTT username')
 @click.option('--password', '-P', default=None, help='Specify the MQTT password')
-@click.option('--device', '-D', default=None, help='Specify the Device ID')
-@click.option('--port', '-p', default=None, help='Specify the Port to connect to')
+@click.option('--device', '-D', multiple=True, help='Specify the Device ID, repeat for several devices')
+@click.option('--port', '-p', multiple=True, help='Specify the Port to connect to, repeat for several serial devices')
 @click.option('--baudrate',  '-b', default=921600, help='Specify the Baudrate for the serial connection')
 @click.option('--sample', is_flag=True,  default=False, help='Enable the Sample mode, default is Invoke mode')
 @click.option('--save', '-s', is_flag=True, default=False, help='Enable the save mode')
 @click.option('--save_dir', '-o', default="save", help="Specify the Directory for saveing images")
+@click.option('--save_workers', default=2, help='Specify the number of background threads writing images')
+@click.option('--save_queue', default=64, help='Specify the number of images waiting to be written before dropping frames')
+@click.option('--display_fps', default=15, help='Specify the maximum refresh rate of the display')
 @click.option('--headless', '-h', is_flag=True,  help='Run the program without displaying the images')
 @click.option('--verbose', '-v', is_flag=True, help='Show detailed information during processin')
-def client(broker, username, password, device, port, baudrate, sample, save, save_dir, headless, verbose):
+def client(broker, username, password, device, port, baudrate, sample, save, save_dir, save_workers, save_queue, display_fps, headless, verbose):
+    writer = None
+    display = None
+    devices = {}
     try:
-        
+
         try:
-            if int(save) > 0:
-                if not os.path.exists(os.path.join(save_dir)):
-                    os.mkdir(os.path.join(save_dir))
-                if not os.path.exists(os.path.join(save_dir, 'raw')):
-                    os.mkdir(os.path.join(save_dir, 'raw'))
-            if int(save) > 1:
-                if not os.path.exists(os.path.join(save_dir, 'annotated')):
-                    os.mkdir(os.path.join(save_dir, 'annotated'))
+            if save:
+                os.makedirs(os.path.join(save_dir, 'raw'), exist_ok=True)
+                os.makedirs(os.path.join(save_dir, 'annotated'), exist_ok=True)
+                writer = FrameWriter(save_dir, workers=save_workers, queue_size=save_queue)
         except Exception as e:
             click.echo("Error: {}".format(e))
             return
-            
-        
+
+
         if broker is not None:
-            tx_topic = "sscma/v0/{}/rx".format(device)
-            rx_topic = "sscma/v0/{}/tx".format(device)
-            if port is None:
-                port = '1883'
-            client = MQTTClient(host=broker, port=int(port), tx_topic=tx_topic,
-                            rx_topic=rx_topic, username=username, password=password)
+            # every device shares the connection of the first one
+            shared = None
+            for device_id in device or (None,):
+                tx_topic = "sscma/v0/{}/rx".format(device_id)
+                rx_topic = "sscma/v0/{}/tx".format(device_id)
+                shared = MQTTClient(host=broker, port=int(port[0]) if port else 1883, tx_topic=tx_topic,
+                                    rx_topic=rx_topic, shared=shared, username=username, password=password)
+                devices[str(device_id)] = Device(shared)
         else:
-            client = SerialClient(port, baudrate)
-            
-        
-        device = Device(client)
-        
-        def on_monitor(device, msg):
-            
-                 
-            if verbose or headless:
-                data = msg
-                del data["image"]
-                click.echo(data)
-               
-            if not headless or save:
-                try:
-                    if "image" in msg:
-                        frame = image_from_base64(msg["image"])
-                        if save:
-                            timestamp = int(time.time() * 1000) 
-                            file_name = f"{save_dir}/image_{timestamp}.jpg"
-                            cv2.imwrite(file_name, frame)
-                        if not headless:
-                            cv2.imshow("image", frame)
-                            if cv2.waitKey(1) & 0xFF == 27:
-                                device.loop_stop()
-                except Exception as e:
-                    return
-            
-            
+            for name in port or (None,):
+                devices[os.path.basename(name) if name else str(name)] = Device(SerialClient(name, baudrate))
+
+        if not headless:
+            from sscma.cli.display import TiledDisplay
+            display = TiledDisplay(devices.keys(), fps=display_fps)
+
+        def monitor(name):
+            # multiple devices are told apart by a prefix in file names
+            prefix = "{}_".format(name) if len(devices) > 1 else ""
+
+            def on_monitor(device, msg):
+
+                if verbose or headless:
+                    data = {k: v for k, v in msg.items() if k not in ("image", "raw_image")}
+                    click.echo(data if len(devices) == 1 else "{}: {}".format(name, data))
+
+                if save and "image" in msg:
+                    # the writer decodes base64 and writes the JPEGs as they are
+                    file_name = "{}image_{}.jpg".format(prefix, int(time.time() * 1000))
+                    if isinstance(msg.get("raw_image"), (bytes, bytearray)):
+                        # binary frames, no base64 round trip
+                        writer.submit(os.path.join('raw', file_name), msg["raw_image"])
+                    elif "raw_image" in msg:
+                        writer.submit_base64(os.path.join('raw', file_name), msg["raw_image"])
+                    writer.submit_base64(os.path.join('annotated', file_name), msg["image"])
+
+                if display is not None and "image" in msg:
+                    display.update(name, msg["image"])
+
+            return on_monitor
+
         def on_connect(device):
-            click.echo("Device connected")
-            if not headless:
-                click.echo("\nEnter'ESC' to exit\n")
+            click.echo("Device connected: {}".format(device.info.id))
             if sample:
                 device.Sample(-1)
             else:
                 device.Invoke(-1)
-            
+
         def on_disconnect(device):
             click.echo("Device disconnected")
-            
+
         def on_log(device, log):
             click.echo(log)
 
-            
-        device.on_connect = on_connect
-        device.on_disconnect = on_disconnect
-        device.on_monitor = on_monitor
-        device.on_log = on_log
+        for name, dev in devices.items():
+            dev.on_connect = on_connect
+            dev.on_disconnect = on_disconnect
+            dev.on_monitor = monitor(name)
+            dev.on_log = on_log
         click.echo("Waiting for device to be ready")
-        device.loop_start()
-        
+
+        # handshakes of several devices run concurrently
+        threads = [Thread(target=dev.loop_start) for dev in devices.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        dropped = 0
+
+        def keep_running():
+            nonlocal dropped
+            if writer is not None and writer.dropped > dropped:
+                click.echo("Warning: disk can not keep up, {} frames dropped".format(writer.dropped - dropped))
+                dropped = writer.dropped
+            if not any(dev.is_alive() for dev in devices.values()):
+                click.echo("Exited")
+                return False
+            return True
+
         try:
-            while True:
-                time.sleep(2)
-                if not device.is_alive():
-                    click.echo("Exited")
-                    break
+            if display is not None:
+                click.echo("\nEnter'ESC' to exit\n")
+                # devices are served by their own threads, the window by the main one as macOS requires
+                display.run(keep_running)
+            else:
+                while keep_running():
+                    time.sleep(2)
         except KeyboardInterrupt:
-            device.loop_stop()
+            pass
+        for dev in devices.values():
+            if dev.is_alive():
+                dev.loop_stop()
     except Exception as e:
         click.echo("Error: {}".format(e))
         return
+    finally:
+        if display is not None:
+            display.stop()
+        if writer is not None:
+            writer.close()
+            click.echo("Saved {} images to {}, {} frames dropped".format(writer.written, save_dir, writer.dropped))
@@ -0,0 +1,132 @@
+import math
+import time
+import base64
+from threading import Event, Lock
+
+import cv2
+import numpy as np
+
+from sscma.utils import codec
+
+
+class TiledDisplay:
+    """
+    Shows the latest frame of several devices as a mosaic.
+
+    Receivers only hand over the encoded frame from their own threads,
+    decoding and drawing happen in run at a capped rate, so a slow display
+    never blocks reception and frames superseded before the next refresh are
+    never decoded. HighGUI windows only work from the main thread on macOS,
+    run is meant to be called from it on every platform.
+    """
+
+    def __init__(self, names, title="sscma", fps=15, tile_width=480, tile_height=360):
+        """
+        Initializes the TiledDisplay class.
+
+        Args:
+        - names: the tiles, in display order.
+        - title: window title.
+        - fps: maximum refresh rate.
+        - tile_width: width of a tile in pixels.
+        - tile_height: height of a tile in pixels.
+        """
+        self._names = list(names)
+        self._title = title
+        self._interval = 1.0 / fps
+        self._tile_size = (tile_width, tile_height)
+
+        cols = math.ceil(math.sqrt(len(self._names)))
+        rows = math.ceil(len(self._names) / cols)
+        self._grid = (rows, cols)
+
+        self._latest = {}  # name -> (sequence, base64 jpeg)
+        self._lock = Lock()
+        self._sequence = 0
+
+        self.closed = Event()
+        self._running = False
+
+    def update(self, name, image):
+        """
+        Replaces the frame of a tile.
+
+        Args:
+        - name: the tile.
+        - image: base64 encoded JPEG.
+        """
+        with self._lock:
+            self._sequence += 1
+            self._latest[name] = (self._sequence, image)
+
+    def stop(self):
+        """Make run return, from any thread."""
+        self._running = False
+
+    def _tile(self, name, image):
+        width, height = self._tile_size
+        tile = np.zeros((height, width, 3), dtype=np.uint8)
+        if image is not None:
+            scale = min(width / image.shape[1], height / image.shape[0])
+            w, h = max(1, int(image.shape[1] * scale)), max(1, int(image.shape[0] * scale))
+            x, y = (width - w) // 2, (height - h) // 2
+            tile[y:y + h, x:x + w] = cv2.resize(image, (w, h), interpolation=cv2.INTER_AREA)
+        cv2.putText(tile, str(name), (8, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        return tile
+
+    def run(self, poll=None):
+        """
+        Shows the frames until ESC is pressed, stop is called or poll returns False.
+
+        Blocks the calling thread, which should be the main thread.
+
+        Args:
+        - poll: called after every refresh, None to run until ESC or stop.
+        """
+        self._running = True
+        try:
+            self._refresh(poll)
+        finally:
+            self._running = False
+            cv2.destroyWindow(self._title)
+            cv2.waitKey(1)
+
+    def _refresh(self, poll):
+        rows, cols = self._grid
+        width, height = self._tile_size
+        mosaic = np.zeros((rows * height, cols * width, 3), dtype=np.uint8)
+        shown = {}  # name -> sequence drawn
+
+        for index, name in enumerate(self._names):
+            y, x = divmod(index, cols)
+            mosaic[y * height:(y + 1) * height, x * width:(x + 1) * width] = self._tile(name, None)
+
+        while self._running:
+            start = time.monotonic()
+            with self._lock:
+                latest = dict(self._latest)
+
+            for index, name in enumerate(self._names):
+                if name not in latest or shown.get(name) == latest[name][0]:
+                    continue
+                sequence, encoded = latest[name]
+                jpeg = base64.b64decode(encoded)
+                shown[name] = sequence
+                try:
+                    # tiles are smaller than frames, skip the detail they can not show
+                    image = codec.decode(jpeg, codec.preview_scale(jpeg, width, height))
+                except ValueError:
+                    continue
+                y, x = divmod(index, cols)
+                mosaic[y * height:(y + 1) * height, x * width:(x + 1) * width] = self._tile(name, image)
+
+            cv2.imshow(self._title, mosaic)
+            if cv2.waitKey(1) & 0xFF == 27:
+                self.closed.set()
+                break
+            if poll is not None and not poll():
+                break
+
+            delay = self._interval - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
@@ -1,6 +1,10 @@
+import os
+import sys
 import traceback
 import click
-from sscma.flashers import FLASHERS
+from tqdm import tqdm
+from sscma.flashers import FLASHERS, Bundle, BundleImage, ParallelFlasher, Source, find_ports
+from sscma.flashers.base import flasher_options
 
 
 def get_flasher_by_port(com=None):
@@ -51,37 +55,111 @@ def get_flasher_by_port(com=None):
     
     return selected_flasher, selected_port.device
 
+def flash_parallel(ports, baudrate, bundle, sn, skip_identical, **kwargs):
+    """Flash every port at once and return a result per port."""
+    bars = {}
+    for position, (_, port) in enumerate(ports):
+        bars[port] = tqdm(total=0, desc=os.path.basename(port), position=position, unit='B',
+                          unit_scale=True, unit_divisor=1024, ncols=80)
+
+    def callback(port, written, total):
+        bar = bars[port]
+        if bar.total != total:
+            bar.reset(total=total)
+        bar.update(written - bar.n)
+
+    try:
+        return ParallelFlasher(ports, baudrate=baudrate, **kwargs).write_bundle(
+            bundle, callback=callback, sn=sn, skip_identical=skip_identical)
+    finally:
+        for bar in bars.values():
+            bar.close()
+
+
 @click.command()
-@click.option('--port', '-p', default=None, help='Port to connect to')
-@click.option('--file', '-f', default=None, help='File to write to the device')
+@click.option('--port', '-p', multiple=True, help='Port to connect to, repeat to flash several ports at once')
+@click.option('--all', '-a', 'all_ports', is_flag=True, default=False, help='Flash every port a flasher matches at once')
+@click.option('--file', '-f', default=None, help='File to write to the device, .gz files and archive.zip#member are decompressed on the fly')
+@click.option('--bundle', default=None, help='Bundle manifest or archive of images to write in one session')
 @click.option('--baudrate',  '-b', default=921600, help='Baud rate for the serial connection')
 @click.option('--offset', '-o', default='0x00', help='Offset to write the file to')
 @click.option('--sn', '-s', is_flag=True, default=False, help='Write serial number')
-def flasher(port, baudrate, file, offset, sn):
+@click.option('--xmodem1k', is_flag=True, default=False, help='Send 1K packets, falling back to 128 bytes if rejected')
+@click.option('--skip_identical', is_flag=True, default=False, help='Skip bundle images whose version the device already runs')
+def flasher(port, all_ports, baudrate, file, bundle, offset, sn, xmodem1k, skip_identical):
     
-    if sn is False and file is None:
+    # only asked of the flashers when set, the default ones send 128 byte packets
+    options = {'mode': 'xmodem1k'} if xmodem1k else {}
+    
+    if sn is False and file is None and bundle is None:
         click.echo("No operation specified. Exiting.")
         exit(0)
     
+    # the file, the bundle and the serial number are written in one session
+    images = []
+    try:
+        if file is not None:
+            source = Source.parse(file)
+            images.append(BundleImage(source.name, int(offset, 16), source))
+        if bundle is not None:
+            bundle = Bundle.load(bundle)
+            images.extend(bundle.images)
+        session = Bundle(images, bundle.name, bundle.version) if bundle is not None else Bundle(images)
+    except (OSError, ValueError) as e:
+        click.echo("Error: {}".format(e))
+        sys.exit(1)
+    
+    if all_ports or len(port) > 1:
+        # non-interactive, the exit code tells whether every port passed
+        if all_ports:
+            ports = find_ports()
+        else:
+            matched = {device: Flasher for Flasher, device in find_ports()}
+            ports = [(matched.get(device, FLASHERS[0]), device) for device in port]
+        if len(ports) == 0:
+            click.echo("No device found. Exiting.")
+            sys.exit(1)
+        
+        click.echo(("Flashing {} device(s): {}").format(len(ports), ", ".join(device for _, device in ports)))
+        
+        results = flash_parallel(ports, baudrate, session, sn, skip_identical, **options)
+        
+        for result in results:
+            if result.ok:
+                click.echo(("PASS {} {:.1f}s{}{}").format(
+                    result.port, result.elapsed,
+                    " SN: {}".format(result.value) if result.value else "",
+                    " skipped: {}".format(", ".join(image.name for image in result.skipped)) if result.skipped else ""))
+            else:
+                click.echo(("FAIL {} {:.1f}s {}").format(result.port, result.elapsed, result.error))
+        failed = sum(1 for result in results if not result.ok)
+        click.echo(("{} passed, {} failed").format(len(results) - failed, failed))
+        sys.exit(1 if failed else 0)
+    
     try:
-        Flasher, device = get_flasher_by_port(port)
+        Flasher, device = get_flasher_by_port(port[0] if port else None)
         
         if Flasher is None or device is None:
             click.echo("No device found. Exiting.")
             return
         
-        flasher = Flasher(device, baudrate=baudrate)
+        flasher = Flasher(device, baudrate=baudrate, **flasher_options(Flasher, options))
         
+        click.echo(("Found device {}. Writing to device...").format(device))
         if file is not None:
-            with open(file, 'rb') as file:
-                data = file.read()
-                click.echo(("Found device {}. Writing file to device...").format(device))
-                click.echo(("File: {}").format(file.name))
-                click.echo(("Offset: {}").format(offset))
-                flasher.write(data, offset=int(offset, 16))
+            click.echo(("File: {}").format(file))
+            click.echo(("Offset: {}").format(offset))
+        if bundle is not None:
+            click.echo(("Bundle: {} {}").format(bundle.name, bundle.version))
+            for image in bundle.images:
+                click.echo(("  {} at {}").format(image.name, hex(image.offset)))
+        
+        number, skipped = flasher.write_bundle(session, sn=sn, skip_identical=skip_identical)
+        
+        for image in skipped:
+            click.echo(("Skipped {}, already on the device").format(image.name))
         
         if sn:            
-            number = flasher.write_sn()
             click.echo(("Serial number: {}").format(number))
             
        
@@ -0,0 +1,5 @@
+"""SSCMA device emulator"""
+from .device import DeviceEmulator, STALL_REINVOKE, STALL_BREAK, STALL_RESET
+from .broker import MQTTBroker
+from .transport import PtyTransport, MQTTTransport, LoopbackTransport
+from .bootloader import BootloaderEmulator
@@ -0,0 +1,42 @@
+import time
+import click
+
+from sscma.emulator import DeviceEmulator, MQTTBroker, PtyTransport, MQTTTransport
+
+
+@click.command()
+@click.option('--id', 'device_id', default="emulator0", help='Device ID reported by the emulator')
+@click.option('--fps', default=10.0, help='Event rate of INVOKE/SAMPLE streams, 0 for unlimited')
+@click.option('--width', default=240, help='Width of the synthetic image')
+@click.option('--height', default=240, help='Height of the synthetic image')
+@click.option('--boxes', default=3, help='Number of boxes in every INVOKE event')
+@click.option('--mqtt', is_flag=True, default=False, help='Serve through a local MQTT broker instead of a pty')
+@click.option('--mqtt_port', default=1883, help='Port of the local MQTT broker')
+def emulator(device_id, fps, width, height, boxes, mqtt, mqtt_port):
+    device = DeviceEmulator(id=device_id, fps=fps, width=width, height=height, boxes=boxes)
+
+    broker = None
+    if mqtt:
+        broker = MQTTBroker(port=mqtt_port)
+        broker.start()
+        transport = MQTTTransport(device, broker)
+        click.echo("MQTT broker: 127.0.0.1:{}".format(broker.port))
+        click.echo("Device ID: {}".format(device_id))
+    else:
+        transport = PtyTransport(device)
+        click.echo("Serial port: {}".format(transport.port))
+
+    transport.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transport.stop()
+        if broker is not None:
+            broker.stop()
+
+
+if __name__ == '__main__':
+    emulator()
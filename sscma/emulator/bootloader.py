@@ -0,0 +1,246 @@
+import time
+import random
+import struct
+import logging
+import binascii
+from threading import Thread, Condition
+from typing import Optional  # noqa: F401
+
+_LOGGER = logging.getLogger(__name__)
+
+SOH = b'\x01'
+STX = b'\x02'
+EOT = b'\x04'
+ACK = b'\x06'
+NAK = b'\x15'
+CAN = b'\x18'
+CRC = b'C'
+
+MENU = (b"\r\n===== Himax bootloader =====\r\n"
+        b"1. Xmodem download and burn FW image\r\n"
+        b"2. Reboot\r\n")
+PROMPT = b"\r\nDo you want to end file transmission and reboot system? (y/n)\r\n"
+
+
+class BootloaderEmulator:
+    """
+    Emulates the XMODEM bootloader driven by HimaxFlasher.
+
+    Sending '1' shows the menu, a second '1' starts an XMODEM-CRC download.
+    Every file is followed by a prompt, 'n' receives another file and 'y'
+    ends the session. A 128 byte file starting with the C0 5A marker sets
+    the flash offset of the next file.
+
+    Line errors are injected at random: a corrupted packet is answered with
+    NAK, a dropped ACK leaves the host waiting until it sends the packet again.
+
+    Attributes:
+    - on_write: Function that is called with the bytes sent by the bootloader.
+    - images: list of (offset, data) received, data includes the XMODEM padding.
+    - packets: number of accepted packets by packet size.
+    - sessions: number of completed sessions.
+    - naks: number of packets answered with NAK, injected errors included.
+    - drops: number of ACK dropped.
+    """
+
+    def __init__(self,
+                 on_write=None,
+                 support_1k: bool = True,
+                 ack_delay: float = 0.0,
+                 baudrate: Optional[int] = None,
+                 c_interval: float = 0.1,
+                 jitter: float = 0.0,
+                 error_rate: float = 0.0,
+                 drop_rate: float = 0.0,
+                 seed: Optional[int] = None,
+                 ) -> None:
+        """
+        Initializes the BootloaderEmulator class.
+
+        Args:
+        - on_write: Function that is called with the bytes sent by the bootloader.
+        - support_1k: whether 1024 byte (STX) packets are accepted, otherwise
+          they are answered with NAK.
+        - ack_delay: seconds spent handling a packet before it is acknowledged.
+        - baudrate: simulated line rate, every packet is delayed by its
+          transmission time, None disables the delay.
+        - c_interval: seconds between two 'C' sent while waiting for a file.
+        - jitter: up to this many seconds are randomly added to ack_delay.
+        - error_rate: probability of a packet being received corrupted.
+        - drop_rate: probability of the ACK of a packet being lost.
+        - seed: seed of the error injection, for reproducible runs.
+        """
+        self._on_write = on_write
+        self.support_1k = support_1k
+        self.ack_delay = ack_delay
+        self.baudrate = baudrate
+        self.c_interval = c_interval
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+
+        self.images = []
+        self.packets = {128: 0, 1024: 0}
+        self.sessions = 0
+        self.naks = 0
+        self.drops = 0
+
+        self._random = random.Random(seed)
+
+        self._buffer = bytearray()
+        self._condition = Condition()
+        self._running = False
+        self._thread = None
+
+    @property
+    def on_write(self):
+        """
+        If implemented, this function will be called with the bytes sent by the bootloader.
+        """
+        return self._on_write
+
+    @on_write.setter
+    def on_write(self, value):
+        self._on_write = value
+
+    def write(self, data: bytes):
+        """
+        Feeds bytes sent by the host to the bootloader.
+
+        Args:
+        - data: bytes received from the host.
+        """
+        with self._condition:
+            self._buffer += data
+            self._condition.notify()
+
+    def start(self):
+        """Start the bootloader thread."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the bootloader thread."""
+        self._running = False
+        with self._condition:
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _send(self, data):
+        if self._on_write is not None:
+            self._on_write(data)
+
+    def _read(self, size, timeout):
+        """Read up to size bytes, waiting at most timeout seconds for all of them."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while len(self._buffer) < size and self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def _purge(self, quiet=0.05):
+        """Discard bytes until the line is quiet."""
+        while self._running and self._read(4096, quiet):
+            pass
+
+    def _run(self):
+        while self._running:
+            # wait for a key press, then for the menu choice
+            if self._read(1, 0.1) != b'1':
+                continue
+            self._send(MENU)
+            while self._running and self._read(1, 0.1) != b'1':
+                pass
+            self._session()
+
+    def _session(self):
+        offset = 0
+        while self._running:
+            data = self._receive()
+            if data is None:
+                return
+
+            if len(data) == 128 and data[:2] == b'\xc0\x5a' and data[10:12] == b'\x5a\xc0':
+                offset = struct.unpack('<I', data[2:6])[0]
+            else:
+                self.images.append((offset, data))
+                offset = 0
+
+            self._send(PROMPT)
+            answer = b''
+            while self._running and answer not in (b'y', b'n'):
+                answer = self._read(1, 0.1)
+            if answer == b'y':
+                self.sessions += 1
+                return
+
+    def _receive(self):
+        """Receive a file over XMODEM-CRC, return None when the transfer is cancelled."""
+        head = b''
+        while self._running and head not in (SOH, STX):
+            self._send(CRC)
+            head = self._read(1, self.c_interval)
+
+        data = bytearray()
+        sequence = 1
+        while self._running:
+            if head == EOT:
+                self._send(ACK)
+                return bytes(data)
+            if head == CAN:
+                return None
+            if head not in (SOH, STX):
+                head = self._read(1, 10)
+                if not head:
+                    return None
+                continue
+
+            size = 128 if head == SOH else 1024
+            if head == STX and not self.support_1k:
+                # unknown header, wait for the line to be quiet and ask again
+                self._purge()
+                self._send(NAK)
+                head = self._read(1, 10)
+                continue
+
+            packet = self._read(size + 4, 1)
+            if self.baudrate:
+                time.sleep((size + 5) * 10 / self.baudrate)
+            if self.ack_delay or self.jitter:
+                time.sleep(self.ack_delay + self._random.uniform(0, self.jitter))
+
+            if len(packet) < size + 4 or packet[0] != 0xFF - packet[1] \
+                    or binascii.crc_hqx(packet[2:2 + size], 0) != struct.unpack('>H', packet[2 + size:])[0]:
+                self._purge()
+                self.naks += 1
+                self._send(NAK)
+            elif self.error_rate and self._random.random() < self.error_rate:
+                self.naks += 1
+                self._send(NAK)
+            elif packet[0] == sequence:
+                data += packet[2:2 + size]
+                sequence = (sequence + 1) & 0xFF
+                self.packets[size] += 1
+                if self.drop_rate and self._random.random() < self.drop_rate:
+                    self.drops += 1
+                else:
+                    self._send(ACK)
+            elif packet[0] == (sequence - 1) & 0xFF:
+                # the ACK of the previous packet was lost
+                self._send(ACK)
+            else:
+                self._send(CAN * 2)
+                return None
+
+            head = self._read(1, 10)
+        return None
@@ -0,0 +1,271 @@
+import socket
+import struct
+import logging
+from threading import Thread, Lock
+
+_LOGGER = logging.getLogger(__name__)
+
+# MQTT 3.1.1 control packet types
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+PUBREC = 0x50
+PUBREL = 0x60
+PUBCOMP = 0x70
+SUBSCRIBE = 0x80
+SUBACK = 0x90
+UNSUBSCRIBE = 0xA0
+UNSUBACK = 0xB0
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+
+def topic_matches(topic_filter, topic):
+    """
+    Checks whether a topic matches an MQTT topic filter.
+
+    Args:
+    - topic_filter: filter which may contain `+` and `#` wildcards.
+    - topic: the topic name of a published message.
+
+    Returns:
+    - matched: True if the topic matches the filter.
+    """
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length > 0:
+            byte |= 0x80
+        encoded.append(byte)
+        if length == 0:
+            return bytes(encoded)
+
+
+def _encode_string(value):
+    value = value.encode("utf-8")
+    return struct.pack("!H", len(value)) + value
+
+
+class _Connection:
+    """A client connected to the broker."""
+
+    def __init__(self, broker, sock, address):
+        self.broker = broker
+        self.sock = sock
+        self.address = address
+        self.subscriptions = set()
+        self._lock = Lock()
+
+    def send(self, packet_type, body=b''):
+        with self._lock:
+            self.sock.sendall(bytes([packet_type]) + _encode_length(len(body)) + body)
+
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed")
+            data += chunk
+        return data
+
+    def _recv_packet(self):
+        header = self._recv_exact(1)[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = self._recv_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return header, self._recv_exact(length) if length else b''
+
+    def serve(self):
+        try:
+            while True:
+                header, body = self._recv_packet()
+                packet_type = header & 0xF0
+
+                if packet_type == CONNECT:
+                    self.send(CONNACK, b'\x00\x00')
+                elif packet_type == PUBLISH:
+                    qos = (header >> 1) & 0x03
+                    size = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + size].decode("utf-8")
+                    offset = 2 + size
+                    if qos > 0:
+                        packet_id = body[offset:offset + 2]
+                        offset += 2
+                        self.send(PUBACK if qos == 1 else PUBREC, packet_id)
+                    self.broker.publish(topic, body[offset:])
+                elif packet_type == PUBREL:
+                    self.send(PUBCOMP, body[:2])
+                elif packet_type == SUBSCRIBE:
+                    packet_id, offset, granted = body[:2], 2, b''
+                    while offset < len(body):
+                        size = struct.unpack("!H", body[offset:offset + 2])[0]
+                        topic_filter = body[offset + 2:offset + 2 + size].decode("utf-8")
+                        offset += 2 + size + 1
+                        self.subscriptions.add(topic_filter)
+                        # every subscription is granted QoS 0
+                        granted += b'\x00'
+                    self.send(SUBACK, packet_id + granted)
+                elif packet_type == UNSUBSCRIBE:
+                    packet_id, offset = body[:2], 2
+                    while offset < len(body):
+                        size = struct.unpack("!H", body[offset:offset + 2])[0]
+                        self.subscriptions.discard(
+                            body[offset + 2:offset + 2 + size].decode("utf-8"))
+                        offset += 2 + size
+                    self.send(UNSUBACK, packet_id)
+                elif packet_type == PINGREQ:
+                    self.send(PINGRESP)
+                elif packet_type == DISCONNECT:
+                    break
+        except (ConnectionError, OSError) as ex:
+            _LOGGER.debug("broker connection {} closed:{}".format(self.address, ex))
+        finally:
+            self.broker._remove(self)
+            self.sock.close()
+
+
+class MQTTBroker:
+    """
+    Minimal in-process MQTT 3.1.1 broker.
+
+    It only implements what the SSCMA clients need: CONNECT, PUBLISH with
+    QoS 0/1/2 from clients, SUBSCRIBE with wildcards, UNSUBSCRIBE and PINGREQ.
+    Messages are always delivered with QoS 0 and nothing is retained.
+    In-process subscribers can be attached with `subscribe`.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        """
+        Initializes the MQTTBroker class.
+
+        Args:
+        - host: address to listen on.
+        - port: port to listen on, 0 selects a free port.
+        """
+        self.host = host
+        self.port = port
+        self._socket = None
+        self._thread = None
+        self._connections = []
+        self._callbacks = []
+        self._lock = Lock()
+
+    def start(self):
+        """Start listening for connections."""
+        if self._socket is not None:
+            return
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen()
+        self.port = self._socket.getsockname()[1]
+        self._thread = Thread(target=self._accept_thread, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the broker and close all connections."""
+        if self._socket is None:
+            return
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self._socket = None
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def subscribe(self, topic_filter, callback):
+        """
+        Attaches an in-process subscriber.
+
+        Args:
+        - topic_filter: filter which may contain `+` and `#` wildcards.
+        - callback: function called with (topic, payload) for every matching message.
+        """
+        with self._lock:
+            self._callbacks.append((topic_filter, callback))
+
+    def unsubscribe(self, callback):
+        """
+        Detaches an in-process subscriber.
+
+        Args:
+        - callback: the function passed to `subscribe`.
+        """
+        with self._lock:
+            self._callbacks = [(f, c) for f, c in self._callbacks if c != callback]
+
+    def publish(self, topic, payload):
+        """
+        Delivers a message to every matching subscriber.
+
+        Args:
+        - topic: the topic name.
+        - payload: the message payload.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            connections = list(self._connections)
+            callbacks = list(self._callbacks)
+
+        for topic_filter, callback in callbacks:
+            if topic_matches(topic_filter, topic):
+                callback(topic, payload)
+
+        body = None
+        for connection in connections:
+            if any(topic_matches(f, topic) for f in list(connection.subscriptions)):
+                if body is None:
+                    body = _encode_string(topic) + payload
+                try:
+                    connection.send(PUBLISH, body)
+                except OSError:
+                    pass
+
+    def _remove(self, connection):
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+
+    def _accept_thread(self):
+        while self._socket is not None:
+            try:
+                sock, address = self._socket.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection = _Connection(self, sock, address)
+            with self._lock:
+                self._connections.append(connection)
+            Thread(target=connection.serve, daemon=True).start()
@@ -0,0 +1,512 @@
+import io
+import re
+import csv
+import json
+import time
+import struct
+import base64
+import random
+import logging
+from threading import Thread, Event, Lock
+from typing import Optional  # noqa: F401
+
+from sscma.micro.const import *
+
+_LOGGER = logging.getLogger(__name__)
+
+# host action recovering an injected stall, see DeviceEmulator.stall
+STALL_REINVOKE = 0
+STALL_BREAK = 1
+STALL_RESET = 2
+
+_COMMAND_RE = re.compile(
+    r'^AT\+(?:(?P<tag>[^@=?]+)@)?(?P<cmd>[A-Z0-9_]+)(?P<op>\?|=(?P<args>.*))?$')
+
+
+def _parse_args(args):
+    """
+    Splits the arguments of an AT set command.
+
+    Args:
+    - args: the raw argument string, e.g. '"ssid",0,"password"'.
+
+    Returns:
+    - values: list of argument strings with quotes removed.
+    """
+    if not args:
+        return []
+    return next(csv.reader([args], skipinitialspace=True))
+
+
+class DeviceEmulator:
+    """
+    Emulates an SSCMA-Micro device speaking the AT protocol.
+
+    Host bytes are fed through `write`, frames produced by the emulated device
+    are delivered through `on_write`. INVOKE/SAMPLE events are streamed from a
+    background thread at the configured rate.
+
+    Attributes:
+    - on_write: Function that is called with every frame sent by the device.
+    - fps: Event rate of INVOKE/SAMPLE streams, 0 streams as fast as possible.
+    - width: Width of the synthetic image.
+    - height: Height of the synthetic image.
+    - boxes: Number of boxes in every INVOKE event.
+    - binary: Whether AT+BINIMG=1 is accepted, images are then sent in
+      binary frames instead of base64 in JSON.
+    """
+
+    def __init__(self,
+                 on_write=None,
+                 id="emulator0",
+                 name="sscma_emulator",
+                 software="v2024.01.01",
+                 hardware="1",
+                 fps: float = 10.0,
+                 width: int = 240,
+                 height: int = 240,
+                 boxes: int = 3,
+                 classes=None,
+                 quality: int = 80,
+                 seed: Optional[int] = None,
+                 binary: bool = True,
+                 ) -> None:
+        """
+        Initializes the DeviceEmulator class.
+
+        Args:
+        - on_write: Function that is called with every frame sent by the device.
+        - id: Device ID reported by AT+ID?.
+        - name: Device name reported by AT+NAME?.
+        - software: Software version reported by AT+VER?.
+        - hardware: Hardware version reported by AT+VER?.
+        - fps: Event rate of INVOKE/SAMPLE streams, 0 streams as fast as possible.
+        - width: Width of the synthetic image.
+        - height: Height of the synthetic image.
+        - boxes: Number of boxes in every INVOKE event.
+        - classes: Class names of the emulated model.
+        - quality: JPEG quality of the synthetic image.
+        - seed: Seed of the random generator used for synthetic results.
+        - binary: Whether binary image frames can be negotiated, devices
+          without the feature answer AT+BINIMG with an error.
+        """
+        self._on_write = on_write
+
+        self.id = id
+        self.name = name
+        self.version = {"at_api": "v0",
+                        "software": software, "hardware": hardware}
+
+        self.fps = fps
+        self.boxes = boxes
+        self.binary = binary
+        self.binary_images = False
+        self.classes = classes if classes is not None else ["person", "car", "dog"]
+        self._quality = quality
+        self._random = random.Random(seed)
+
+        self.tscore = 60
+        self.tiou = 55
+        self.wifi = {
+            "status": WIFI_NO_JOINED,
+            "in4_info": {"ip": "0.0.0.0", "netmask": "0.0.0.0", "gateway": "0.0.0.0"},
+            "in6_info": {"ip": ":::::::", "prefix": ":::::::", "gateway": ":::::::"},
+            "config": {"name_type": 0, "name": "", "security": 0, "password": ""},
+        }
+        self.mqttserver = {
+            "status": MQTT_NO_CONNECTED,
+            "config": {"client_id": "sscma_{}".format(id), "address": "", "port": 0,
+                       "username": "", "password": "", "use_ssl": 0},
+        }
+        self.mqttpubsub = {
+            "config": {"pub_topic": "sscma/v0/{}/tx".format(id), "pub_qos": 0,
+                       "sub_topic": "sscma/v0/{}/rx".format(id), "sub_qos": 0},
+        }
+
+        self._commands = {
+            CMD_AT_ID: self._cmd_id,
+            CMD_AT_NAME: self._cmd_name,
+            CMD_AT_VERSION: self._cmd_version,
+            CMD_AT_INFO: self._cmd_info,
+            CMD_AT_INVOKE: self._cmd_invoke,
+            CMD_AT_SAMPLE: self._cmd_sample,
+            CMD_AT_TSCORE: self._cmd_tscore,
+            CMD_AT_TIOU: self._cmd_tiou,
+            CMD_AT_WIFI: self._cmd_wifi,
+            CMD_AT_MQTTSERVER: self._cmd_mqttserver,
+            CMD_AT_MQTTPUBSUB: self._cmd_mqttpubsub,
+            CMD_AT_BREAK: self._cmd_break,
+            CMD_AT_RESET: self._cmd_reset,
+            CMD_AT_STATS: self._cmd_stat,
+        }
+        if binary:
+            self._commands[CMD_AT_BINARY] = self._cmd_binary
+
+        self._rx_buffer = b''
+        self._write_lock = Lock()
+        self._stream_lock = Lock()
+
+        self._stream = None  # EVENT_INVOKE or EVENT_SAMPLE
+        self._remaining = 0
+        self._result_only = False
+        self._wakeup = Event()
+        self._running = False
+        self._thread = None
+
+        self._image = None
+        self._jpeg = None
+        self.set_image_size(width, height)
+
+        # number of frames sent since start
+        self.frames = 0
+        # command clearing an injected stall, see stall()
+        self._stalled = None
+        self.boot_count = 1
+        self._perf = [0, 0, 0]
+
+    @property
+    def on_write(self):
+        """
+        This function will be called with every frame sent by the device.
+        """
+        return self._on_write
+
+    @on_write.setter
+    def on_write(self, value):
+        """
+        Sets the on_write function.
+
+        Args:
+        - value: The function to be set as the on_write function.
+        """
+        self._on_write = value
+
+    @property
+    def streaming(self) -> bool:
+        """Return True if an INVOKE or SAMPLE stream is active."""
+        return self._stream is not None
+
+    def set_image_size(self, width, height):
+        """
+        Renders the synthetic JPEG image sent with events.
+
+        Args:
+        - width: Width of the image.
+        - height: Height of the image.
+        """
+        from PIL import Image, ImageDraw
+
+        image = Image.new("RGB", (width, height), (32, 32, 32))
+        draw = ImageDraw.Draw(image)
+        step = max(8, min(width, height) // 8)
+        for x in range(0, width, step):
+            for y in range(0, height, step):
+                color = COLORS[(x // step + y // step) % len(COLORS)]
+                draw.rectangle([x, y, x + step // 2, y + step // 2], fill=color)
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=self._quality)
+
+        self.width = width
+        self.height = height
+        self._jpeg = buf.getvalue()
+        self._image = base64.b64encode(self._jpeg).decode("utf-8")
+
+    def start(self):
+        """Start the event stream thread."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = Thread(target=self._stream_thread, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the event stream thread."""
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def write(self, data: bytes):
+        """
+        Feeds bytes sent by the host to the device.
+
+        Args:
+        - data: bytes received from the host.
+        """
+        self._rx_buffer += data
+        while True:
+            index = self._rx_buffer.find(b'\n')
+            if index < 0:
+                break
+            line = self._rx_buffer[:index].strip(b'\r\n ')
+            self._rx_buffer = self._rx_buffer[index + 1:]
+            if line:
+                self.execute(line.decode("utf-8", errors="replace"))
+
+    def execute(self, line: str):
+        """
+        Executes a single AT command line.
+
+        Args:
+        - line: the command line without the trailing CRLF.
+        """
+        match = _COMMAND_RE.match(line)
+        if match is None or match.group("cmd") not in self._commands:
+            _LOGGER.debug("emulator unknown command:{}".format(line))
+            self._send(CMD_TYPE_LOG, LOG_AT, CMD_EINVAL, line)
+            return
+
+        tag, cmd, op = match.group("tag"), match.group("cmd"), match.group("op")
+        name = "{}@{}".format(tag, cmd) if tag else cmd
+        if op == "?":
+            name += "?"
+            args = None
+        elif op is not None:
+            args = _parse_args(match.group("args"))
+        else:
+            args = []
+
+        try:
+            code, data = self._commands[cmd](op == "?", args)
+        except (ValueError, IndexError) as ex:
+            _LOGGER.debug("emulator invalid arguments:{} {}".format(line, ex))
+            code, data = CMD_EINVAL, None
+        self._send(CMD_TYPE_RESPONSE, name, code, data)
+
+    @staticmethod
+    def _frame(type, name, code, data):
+        return b'\r' + json.dumps(
+            {"type": type, "name": name, "code": code, "data": data}).encode("utf-8") + b'\n'
+
+    def _binary_frame(self, type, name, code, data):
+        """Build a binary frame, the image is sent as JPEG bytes after the JSON."""
+        data = dict(data)
+        del data["image"]
+        payload = json.dumps({"type": type, "name": name, "code": code, "data": data}).encode("utf-8")
+        return BINARY_PREFIX + struct.pack("<II", len(payload), len(self._jpeg)) + payload + self._jpeg
+
+    def event_frame(self, stream=EVENT_INVOKE, count=1, binary=False):
+        """
+        Builds a synthetic event frame without sending it.
+
+        Args:
+        - stream: EVENT_INVOKE or EVENT_SAMPLE.
+        - count: event counter.
+        - binary: build a binary frame instead of a JSON one.
+
+        Returns:
+        - frame: the frame bytes as sent on the wire.
+        """
+        data = self._event_data(stream, count)
+        if binary and "image" in data:
+            return self._binary_frame(CMD_TYPE_EVENT, stream, CMD_OK, data)
+        return self._frame(CMD_TYPE_EVENT, stream, CMD_OK, data)
+
+    def _send(self, type, name, code, data):
+        """
+        Sends a frame to the host.
+
+        Args:
+        - type: frame type, one of CMD_TYPE_RESPONSE, CMD_TYPE_EVENT and CMD_TYPE_LOG.
+        - name: frame name.
+        - code: result code.
+        - data: frame data.
+        """
+        if self.binary_images and type == CMD_TYPE_EVENT and "image" in data:
+            frame = self._binary_frame(type, name, code, data)
+        else:
+            frame = self._frame(type, name, code, data)
+        with self._write_lock:
+            if self._on_write is not None:
+                self._on_write(frame)
+
+    def _start_stream(self, stream, count, result_only=False):
+        with self._stream_lock:
+            self._stream = stream if count != 0 else None
+            self._remaining = count
+            self._result_only = result_only
+        self._wakeup.set()
+
+    def _cmd_id(self, query, args):
+        return CMD_OK, self.id
+
+    def _cmd_name(self, query, args):
+        return CMD_OK, self.name
+
+    def _cmd_version(self, query, args):
+        return CMD_OK, self.version
+
+    def _cmd_info(self, query, args):
+        info = {
+            "uuid": 1,
+            "name": "Emulated Detection",
+            "version": "1.0.0",
+            "catagory": "Object Detection",
+            "model_type": "TFLite",
+            "algoritm": "YOLO",
+            "description": "Synthetic model of the SSCMA emulator",
+            "image": "",
+            "author": "SSCMA",
+            "token": "",
+            "classes": self.classes,
+        }
+        return CMD_OK, {"crc16_maxim": 0,
+                        "info": base64.b64encode(json.dumps(info).encode("utf-8")).decode("utf-8")}
+
+    def stall(self, cure=STALL_REINVOKE):
+        """
+        Stops the event stream as a stuck firmware would, until the host recovers it.
+
+        Args:
+        - cure: what recovers the stream, STALL_REINVOKE a new INVOKE or
+          SAMPLE, STALL_BREAK an AT+BREAK first, STALL_RESET an AT+RST.
+        """
+        self._stalled = cure
+
+    @property
+    def stalled(self) -> bool:
+        """Whether an injected stall still holds the stream."""
+        return self._stalled is not None
+
+    def _cmd_invoke(self, query, args):
+        if query:
+            return CMD_OK, 1 if self._stream == EVENT_INVOKE else 0
+        count = int(args[0])
+        result_only = len(args) > 2 and int(args[2]) == 1
+        if self._stalled == STALL_REINVOKE:
+            self._stalled = None
+        self._start_stream(EVENT_INVOKE, count, result_only)
+        return CMD_OK, {
+            "model": {"id": 1, "type": 0, "address": 0x400000, "size": 0},
+            "algorithm": {"type": 3, "category": 1, "input_from": 1,
+                          "config": {"tscore": self.tscore, "tiou": self.tiou}},
+            "sensor": {"id": 1, "type": 1, "state": 1, "opt_id": 0,
+                       "opt_detail": "{}x{} Auto".format(self.width, self.height)},
+        }
+
+    def _cmd_sample(self, query, args):
+        if query:
+            return CMD_OK, 1 if self._stream == EVENT_SAMPLE else 0
+        if self._stalled == STALL_REINVOKE:
+            self._stalled = None
+        self._start_stream(EVENT_SAMPLE, int(args[0]))
+        return CMD_OK, {"sensor": {"id": 1, "type": 1, "state": 1, "opt_id": 0,
+                                   "opt_detail": "{}x{} Auto".format(self.width, self.height)}}
+
+    def _cmd_tscore(self, query, args):
+        if not query:
+            self.tscore = int(args[0])
+        return CMD_OK, self.tscore
+
+    def _cmd_tiou(self, query, args):
+        if not query:
+            self.tiou = int(args[0])
+        return CMD_OK, self.tiou
+
+    def _cmd_wifi(self, query, args):
+        if not query:
+            self.wifi["config"].update(
+                {"name": args[0], "security": int(args[1]), "password": args[2]})
+            self.wifi["status"] = WIFI_JOINED if args[0] else WIFI_NO_JOINED
+            self.wifi["in4_info"]["ip"] = "192.168.1.100" if args[0] else "0.0.0.0"
+        return CMD_OK, self.wifi
+
+    def _cmd_mqttserver(self, query, args):
+        if not query:
+            self.mqttserver["config"].update(
+                {"client_id": args[0], "address": args[1], "port": int(args[2]),
+                 "username": args[3], "password": args[4], "use_ssl": int(args[5])})
+            self.mqttserver["status"] = MQTT_CONNECTED if args[1] else MQTT_NO_CONNECTED
+        return CMD_OK, self.mqttserver
+
+    def _cmd_mqttpubsub(self, query, args):
+        if not query:
+            self.mqttpubsub["config"].update(
+                {"pub_topic": args[0], "pub_qos": int(args[1]),
+                 "sub_topic": args[2], "sub_qos": int(args[3])})
+        return CMD_OK, self.mqttpubsub
+
+    def _cmd_break(self, query, args):
+        if self._stalled == STALL_BREAK:
+            # the next INVOKE or SAMPLE restarts the stream
+            self._stalled = STALL_REINVOKE
+        self._start_stream(None, 0)
+        return CMD_OK, int(time.monotonic() * 1000)
+
+    def _cmd_binary(self, query, args):
+        if not query:
+            self.binary_images = bool(int(args[0]))
+        return CMD_OK, 1 if self.binary_images else 0
+
+    def _cmd_reset(self, query, args):
+        self._stalled = None
+        self._start_stream(None, 0)
+        self._rx_buffer = b''
+        self.binary_images = False
+        self.boot_count += 1
+        return CMD_OK, None
+
+    def _cmd_stat(self, query, args):
+        return CMD_OK, {"boot_count": self.boot_count, "is_ready": 1,
+                        "perf": self._perf, "load": 100 if self.streaming else 5}
+
+    def _event_data(self, stream, count):
+        """Build the data of a synthetic INVOKE/SAMPLE event."""
+        data = {"count": count}
+        if stream == EVENT_INVOKE:
+            rand = self._random
+            boxes = []
+            for _ in range(self.boxes):
+                w = rand.randint(self.width // 8, self.width // 2)
+                h = rand.randint(self.height // 8, self.height // 2)
+                boxes.append([rand.randint(w // 2, self.width - w // 2),
+                              rand.randint(h // 2, self.height - h // 2),
+                              w, h,
+                              rand.randint(self.tscore, 99),
+                              rand.randrange(len(self.classes))])
+            self._perf = [rand.randint(5, 8), rand.randint(40, 60), rand.randint(0, 2)]
+            data["perf"] = self._perf
+            data["boxes"] = boxes
+            data["resolution"] = [self.width, self.height]
+            if not self._result_only:
+                data["image"] = self._image
+        else:
+            data["image"] = self._image
+        return data
+
+    def _stream_thread(self):
+        count = 0
+        deadline = time.monotonic()
+        while self._running:
+            with self._stream_lock:
+                stream = self._stream
+            if stream is None or self._stalled is not None:
+                self._wakeup.wait(0.1)
+                self._wakeup.clear()
+                deadline = time.monotonic()
+                continue
+
+            if self.fps > 0:
+                deadline += 1.0 / self.fps
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    # a new command interrupts the wait
+                    if self._wakeup.wait(delay):
+                        self._wakeup.clear()
+                        deadline = time.monotonic()
+                        continue
+                else:
+                    deadline = time.monotonic()
+
+            with self._stream_lock:
+                if self._stream != stream:
+                    continue
+                if self._remaining > 0:
+                    self._remaining -= 1
+                    if self._remaining == 0:
+                        self._stream = None
+
+            count += 1
+            self.frames += 1
+            self._send(CMD_TYPE_EVENT, stream, CMD_OK, self._event_data(stream, count))
@@ -0,0 +1,154 @@
+import os
+import select
+import logging
+from threading import Thread
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PtyTransport:
+    """
+    Exposes an emulated device as a pseudo terminal.
+
+    The slave side behaves like a serial port, its path is available as
+    `port` and can be opened with `SerialClient` or pyserial.
+    """
+
+    def __init__(self, emulator):
+        """
+        Initializes the PtyTransport class.
+
+        Args:
+        - emulator: the DeviceEmulator to expose.
+        """
+        import pty
+        import tty
+
+        self._emulator = emulator
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        # a host that stopped reading must not block stop on a full terminal
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._running = False
+        self._thread = None
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view and self._running:
+            try:
+                view = view[os.write(self._master, view):]
+            except BlockingIOError:
+                select.select([], [self._master], [], 0.1)
+
+    def _read_thread(self):
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            if data:
+                self._emulator.write(data)
+
+    def start(self):
+        """Start serving the emulator on the pseudo terminal."""
+        if self._running:
+            return
+        self._emulator.on_write = self._write
+        self._running = True
+        self._emulator.start()
+        self._thread = Thread(target=self._read_thread, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving and close the pseudo terminal."""
+        self._running = False
+        self._emulator.stop()
+        self._emulator.on_write = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class LoopbackTransport:
+    """
+    Connects an emulated device to a Client of the same process.
+
+    Commands are executed and answered synchronously in the thread writing
+    them, without a port or a broker, the Client is available as `client`.
+    """
+
+    def __init__(self, emulator, **kwargs):
+        """
+        Initializes the LoopbackTransport class.
+
+        Args:
+        - emulator: the DeviceEmulator to connect.
+        - kwargs: further arguments of the Client constructor.
+        """
+        from sscma.micro.client import Client
+
+        self._emulator = emulator
+        self.client = Client(emulator.write, **kwargs)
+
+    def start(self):
+        """Start the emulator, answering the client."""
+        self._emulator.on_write = self.client.on_recieve
+        self._emulator.start()
+
+    def stop(self):
+        """Stop the emulator."""
+        self._emulator.stop()
+        self._emulator.on_write = None
+
+
+class MQTTTransport:
+    """
+    Exposes an emulated device through an MQTTBroker.
+
+    Commands are read from `sscma/v0/<id>/rx` and frames are published to
+    `sscma/v0/<id>/tx`, the topics used by the SSCMA firmware.
+    """
+
+    def __init__(self, emulator, broker, tx_topic=None, rx_topic=None):
+        """
+        Initializes the MQTTTransport class.
+
+        Args:
+        - emulator: the DeviceEmulator to expose.
+        - broker: the MQTTBroker to attach to.
+        - tx_topic: topic the device publishes frames to.
+        - rx_topic: topic the device receives commands from.
+        """
+        self._emulator = emulator
+        self._broker = broker
+        self.tx_topic = tx_topic or "sscma/v0/{}/tx".format(emulator.id)
+        self.rx_topic = rx_topic or "sscma/v0/{}/rx".format(emulator.id)
+
+    def _on_message(self, topic, payload):
+        self._emulator.write(payload)
+
+    def _write(self, data):
+        self._broker.publish(self.tx_topic, data)
+
+    def start(self):
+        """Start serving the emulator on the broker."""
+        self._emulator.on_write = self._write
+        self._broker.subscribe(self.rx_topic, self._on_message)
+        self._emulator.start()
+
+    def stop(self):
+        """Stop serving the emulator."""
+        self._broker.unsubscribe(self._on_message)
+        self._emulator.stop()
+        self._emulator.on_write = None
@@ -1,3 +1,30 @@
-from sscma.flashers.core import HimaxFlasher
+import importlib
 
-FLASHERS = [HimaxFlasher]
\ No newline at end of file
+# attributes are imported on first use, so importing a module of the package
+# does not pull in serial, xmodem and tqdm
+_EXPORTS = {
+    'HimaxFlasher': 'sscma.flashers.core',
+    'ParallelFlasher': 'sscma.flashers.parallel',
+    'FlashResult': 'sscma.flashers.parallel',
+    'find_ports': 'sscma.flashers.parallel',
+    'Bundle': 'sscma.flashers.bundle',
+    'BundleImage': 'sscma.flashers.bundle',
+    'Source': 'sscma.flashers.source',
+    'load_flashers': 'sscma.flashers.registry',
+}
+
+
+def __getattr__(name):
+    if name == 'FLASHERS':
+        from sscma.flashers.registry import load_flashers
+        value = load_flashers()
+    elif name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS) + ['FLASHERS'])
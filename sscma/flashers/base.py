@@ -1,10 +1,40 @@
+import inspect
+import logging
 from abc import ABC, abstractmethod
 
+from sscma.flashers.source import image_size, open_image
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _accepts(method, name):
+    """Tell whether method takes a keyword argument called name."""
+    parameters = inspect.signature(method).parameters
+    return name in parameters or any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values())
+
+
+def flasher_options(Flasher, options):
+    """Return the options among options the constructor of Flasher accepts.
+
+    Flashers registered by other packages are not required to take the
+    options of the built-in ones, such as mode, the others are dropped.
+    """
+    parameters = inspect.signature(Flasher).parameters
+    if any(parameter.kind == parameter.VAR_KEYWORD for parameter in parameters.values()):
+        return dict(options)
+    accepted = {name: value for name, value in options.items() if name in parameters}
+    for name in options.keys() - accepted.keys():
+        _LOGGER.warning("{} does not take the {} option, ignored".format(Flasher.__name__, name))
+    return accepted
+
 class BaseFlasher(ABC):
     """Base class for all programmers.
 
     All programmers must implement the methods defined in this class.
     """
+
+    # set by the programmers whose write takes a Source or a stream as well as bytes
+    streaming = False
     
     @abstractmethod
     def __init__(self, *args, **kwargs):
@@ -33,15 +63,70 @@ class BaseFlasher(ABC):
         pass
     
     @abstractmethod
-    def write(self, data, offset=0):
+    def write(self, data, offset=0, callback=None):
         """Write data to the programmer.
 
+        callback(written, total) is called with the number of bytes written
+        so far, when omitted the progress is shown on the terminal.
+
         This method should be overridden by the subclass.
         """
         pass
     
+    def write_images(self, images, callback=None, sn=False):
+        """Write several images, then a new serial number if sn is set.
+
+        images is a list of (offset, data) written in order, data being bytes,
+        a Source or a seekable binary stream. callback(written, total) gets the
+        progress over all of them, when the write and write_sn of the flasher
+        take a callback. Images are read into bytes first, unless streaming is
+        set. Returns the serial number, None when sn is not set.
+
+        Flashers able to write them in a single session override this.
+        """
+        sizes = [image_size(data) for _, data in images]
+        total = sum(sizes)
+        done = 0
+        for (offset, data), size in zip(images, sizes):
+            if not self.streaming and not isinstance(data, (bytes, bytearray)):
+                with open_image(data) as (stream, _):
+                    data = stream.read(size)
+            if callback is not None and _accepts(self.write, "callback"):
+                progress = lambda written, _: callback(done + written, total)
+                self.write(data, offset, callback=progress)
+            else:
+                self.write(data, offset)
+            done += size
+        if sn:
+            if callback is not None and _accepts(self.write_sn, "callback"):
+                return self.write_sn(callback=callback)
+            return self.write_sn()
+    
+    def identify(self):
+        """Query the firmware running on the device.
+
+        Returns (DeviceInfo, ModelInfo), None for what can not be told.
+        Flashers able to talk to the firmware override this.
+        """
+        return None, None
+    
+    def write_bundle(self, bundle, callback=None, sn=False, skip_identical=False):
+        """Write the images of a bundle, then a new serial number if sn is set.
+
+        With skip_identical, the images the device already runs are not
+        written, the bootloader is not entered at all when none is left.
+        Returns the serial number and the list of skipped BundleImage.
+        """
+        images, skipped = bundle.images, []
+        if skip_identical:
+            images, skipped = bundle.plan(*self.identify())
+        number = None
+        if images or sn:
+            number = self.write_images([(image.offset, image.source) for image in images], callback, sn=sn)
+        return number, skipped
+    
     @abstractmethod
-    def write_sn(self):
+    def write_sn(self, callback=None):
         """Write serial number to the programmer.
 
         This method should be overridden by the subclass.
@@ -0,0 +1,187 @@
+import os
+import json
+import zipfile
+from typing import Dict, List, Optional  # noqa: F401
+
+from sscma.flashers.source import Source
+
+MANIFEST = "bundle.json"
+
+
+class BundleImage:
+    """
+    An image of a bundle.
+
+    Attributes:
+    - name: file name of the image in the bundle.
+    - offset: flash offset the image is written to.
+    - source: the Source the image is read from.
+    - software: firmware software version the image holds, if known.
+    - hardware: hardware version the firmware targets, if known.
+    - model: uuid and version of the model the image holds, if known.
+    """
+
+    def __init__(self, name, offset, source, software=None, hardware=None, model=None):
+        self.name = name
+        self.offset = offset
+        self.source = source
+        self.software = software
+        self.hardware = hardware
+        self.model = model or {}
+
+    def __repr__(self):
+        return "BundleImage(name={}, offset={}, size={})".format(
+            self.name,
+            hex(self.offset),
+            self.size
+        )
+
+    @property
+    def size(self) -> int:
+        """Size of the uncompressed image in bytes."""
+        return self.source.size
+
+    def read(self) -> bytes:
+        """Return the content of the image."""
+        return self.source.read()
+
+    def installed(self, info=None, model=None) -> bool:
+        """
+        Tells whether a device already runs this image.
+
+        Only images with a known version can be told installed, every field
+        given in the manifest must match the one reported by the device.
+
+        Args:
+        - info: DeviceInfo reported by the device, with AT+VER.
+        - model: ModelInfo reported by the device, with AT+INFO.
+        """
+        expected = []
+        if self.software is not None or self.hardware is not None:
+            if info is None or info.version is None:
+                return False
+            expected += [(self.software, info.software), (self.hardware, info.hardware)]
+        if self.model:
+            if model is None:
+                return False
+            expected += [(self.model.get("uuid"), model.uuid), (self.model.get("version"), model.version)]
+        if not expected:
+            return False
+        return all(wanted is None or str(wanted) == str(actual) for wanted, actual in expected)
+
+
+class Bundle:
+    """
+    A set of images flashed together in one bootloader session.
+
+    A bundle is either a JSON manifest, listing image files relative to it,
+    or a zip archive holding a bundle.json manifest next to the images.
+    Image files may be gzip compressed. The optional software, hardware and
+    model fields tell the version an image holds, so devices already running
+    it can skip it:
+
+        {
+            "name": "grove_vision_ai_v2",
+            "version": "v2024.01.01",
+            "images": [
+                {"file": "firmware.img", "offset": "0x0",
+                 "software": "v2024.01.01", "hardware": "1"},
+                {"file": "model.tflite", "offset": "0x400000",
+                 "model": {"uuid": "60086", "version": "1.0.0"}}
+            ]
+        }
+
+    Attributes:
+    - name: name of the bundle.
+    - version: version of the bundle.
+    - images: list of BundleImage, in writing order.
+    - metadata: the whole manifest.
+    """
+
+    def __init__(self, images, name=None, version=None, metadata=None):
+        self.images = images
+        self.name = name
+        self.version = version
+        self.metadata = metadata or {}
+
+        ordered = sorted(self.images, key=lambda image: image.offset)
+        for previous, image in zip(ordered, ordered[1:]):
+            if previous.offset + previous.size > image.offset:
+                raise ValueError("images {} and {} overlap".format(previous.name, image.name))
+
+    def __repr__(self):
+        return "Bundle(name={}, version={}, images={})".format(
+            self.name,
+            self.version,
+            self.images
+        )
+
+    @property
+    def size(self) -> int:
+        """Total size of the images in bytes."""
+        return sum(image.size for image in self.images)
+
+    def segments(self):
+        """Return the images as (offset, Source), in writing order."""
+        return [(image.offset, image.source) for image in self.images]
+
+    def plan(self, info=None, model=None):
+        """
+        Splits the images between the ones to write and the ones a device already runs.
+
+        Args:
+        - info: DeviceInfo reported by the device, None if unknown.
+        - model: ModelInfo reported by the device, None if unknown.
+
+        Returns:
+        - (pending, skipped): lists of BundleImage, in writing order.
+        """
+        pending, skipped = [], []
+        for image in self.images:
+            (skipped if image.installed(info, model) else pending).append(image)
+        return pending, skipped
+
+    @staticmethod
+    def load(path) -> "Bundle":
+        """
+        Loads a bundle from a JSON manifest or a zip archive.
+
+        Args:
+        - path: path of the manifest or the archive.
+
+        Raises:
+        - ValueError: the manifest is invalid or images overlap.
+        """
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                try:
+                    manifest = json.loads(archive.read(MANIFEST).decode("utf-8"))
+                except KeyError:
+                    raise ValueError("{} has no {}".format(path, MANIFEST))
+
+            def locate(name):
+                return Source(path, name)
+        else:
+            with open(path, "r") as f:
+                manifest = json.load(f)
+            root = os.path.dirname(os.path.abspath(path))
+
+            def locate(name):
+                file = os.path.join(root, name)
+                if not os.path.isfile(file):
+                    raise ValueError("{} not found".format(file))
+                return Source(file)
+
+        if not isinstance(manifest.get("images"), list) or not manifest["images"]:
+            raise ValueError("{} lists no images".format(path))
+
+        images = []
+        for entry in manifest["images"]:
+            if "file" not in entry:
+                raise ValueError("image without file in {}".format(path))
+            offset = entry.get("offset", 0)
+            offset = int(offset, 0) if isinstance(offset, str) else int(offset)
+            images.append(BundleImage(entry["file"], offset, locate(entry["file"]),
+                                      entry.get("software"), entry.get("hardware"), entry.get("model")))
+
+        return Bundle(images, manifest.get("name"), manifest.get("version"), manifest)
@@ -4,10 +4,16 @@ import serial
 import logging
 import secrets
 
-from tqdm import tqdm
-from xmodem import XMODEM
+from xmodem import XMODEM, NAK, CRC
 
 from sscma.flashers.base import BaseFlasher
+from sscma.flashers.expect import Expect
+from sscma.flashers.source import open_image, image_size
+
+PACKET_SIZES = {'xmodem': 128, 'xmodem1k': 1024}
+
+# flash offset of the serial number
+SN_OFFSET = 0x003DF000
 
 def fnv_hash(id_full):
     hash_value = 0x811c9dc5
@@ -18,22 +24,53 @@ def fnv_hash(id_full):
     return hash_value & 0xFFFFFFFF 
 
 
+def serial_number_image():
+    """Return a new serial number and the image to write at SN_OFFSET."""
+    random_bytes = secrets.token_bytes(4 * 1024)
+    sn = str(hex(fnv_hash(random_bytes[:16])))
+    return sn, random_bytes
+
+
+class PacketSizeRejected(Exception):
+    """The bootloader does not accept the packet size."""
+
+
 class HimaxFlasher(BaseFlasher):
     
     _NAME = "Himax Flasher"
     
+    streaming = True
+    
     _USB = [{"vid": 0x1A86, "pid": 0x55D2},
             {"vid": 0x1A86, "pid": 0x55D3}]
     
-    def __init__(self, port, baudrate=921600, timeout=1):
+    # failed attempts of the first 1K packet before falling back to 128 bytes
+    _FALLBACK_ERRORS = 3
+    
+    _MENU = b'Xmodem download and burn FW image'
+    _PROMPT = b'Do you want to end file transmission and reboot system'
+    # seconds between two 'C' of the bootloader waiting for a file, with margin
+    _POLL_INTERVAL = 1.5
+    
+    def __init__(self, port, baudrate=921600, timeout=1, mode='xmodem', reset_delay=0.5, ack_timeout=60):
+        if mode not in PACKET_SIZES:
+            raise ValueError("Invalid mode specified: {}".format(mode))
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
+        self.mode = mode
+        # seconds the port stays closed, then open, to reboot the device
+        self.reset_delay = reset_delay
+        # seconds to wait for the ACK of a packet before sending it again
+        self.ack_timeout = ack_timeout
+        # packets sent again since the flasher was created
+        self.retries = 0
         self.serial = serial.Serial()
         self.serial.port = self.port
         self.serial.baudrate = self.baudrate
         self.serial.timeout = self.timeout
         self.xmodem = XMODEM(self.getc, self.putc, mode='xmodem')
+        self.expect = Expect(self.serial)
         self.log = logging.getLogger('sscma.flasher')
         
         #logging.getLogger('xmodem.XMODEM').setLevel(logging.CRITICAL + 1)
@@ -61,131 +98,215 @@ class HimaxFlasher(BaseFlasher):
         return self.serial.write(data) or None
     
     
-    def wait_for_bootloader(self, timeout=5000):
-        rbuf = b''
+    def identify(self):
+        """Query the firmware running on the device over its AT interface.
         
-        self.serial.timeout = 0.01
-        while True:
-            self.serial.write(b'1')
-            rbuf += self.serial.read(128)
-            if 'Xmodem download and burn FW image'.encode() in rbuf:
-                rbuf = b''
-                self.serial.write(b'1')
-                break
-            timeout -= 10
-            if timeout <= 0:
-                raise Exception('Timeout waiting for burn mode')
+        Returns (DeviceInfo, ModelInfo), (None, None) if the device does not answer.
+        """
+        from sscma.micro.client import SerialClient
+        from sscma.micro.device import Device
+        
+        try:
+            client = SerialClient(self.port, self.baudrate)
+        except serial.SerialException as ex:
+            self.log.debug('identify {} failed: {}'.format(self.port, ex))
+            return None, None
+        try:
+            client.loop_start()
+            device = Device(client)
+            info = device._fetch_info()
+            if info is None:
+                return None, None
+            model = device._fetch_model()
+            # the dummy model of an unanswered query has no uuid
+            return info, model if model.uuid else None
+        finally:
+            client.loop_stop()
+            client.disconnect()
+    
+    def send(self, data, callback, total):
+        """Send a stream over XMODEM, in 1K packets if the bootloader accepts them.
+        
+        callback(written, total) is called with the bytes acknowledged so far.
+        """
+        start = data.tell()
+        timeout = self.serial.timeout
+        replay = []
+        
+        modes = [self.mode] if self.mode == 'xmodem' else [self.mode, 'xmodem']
+        for mode in modes:
+            packet_size = PACKET_SIZES[mode]
+            fallback = mode != modes[-1]
+            started = []
+            errors = [0]
+            
+            def getc(size, timeout=1):
+                # the start character is only sent once, it is replayed on fallback
+                if replay:
+                    return replay.pop()
+                data = self.getc(size, timeout)
+                if not started and data in (NAK, CRC):
+                    started.append(data)
+                    if fallback:
+                        # a bootloader ignoring 1K packets is detected quickly
+                        self.serial.timeout = 2
+                return data
+            
+            def callback_written(total_packets, success_count, error_count):
+                # error_count grows by one per failed attempt of a packet
+                if error_count > errors[0]:
+                    self.retries += 1
+                errors[0] = error_count if error_count > errors[0] else 0
+                if fallback and success_count == 0 and error_count >= self._FALLBACK_ERRORS:
+                    raise PacketSizeRejected()
+                if success_count == 1:
+                    self.serial.timeout = timeout
+                callback(min(success_count * packet_size, total), total)
+            
+            try:
+                data.seek(start)
+                return XMODEM(getc, self.putc, mode=mode).send(
+                    data, retry=60, timeout=60, quiet=False, callback=callback_written)
+            except PacketSizeRejected:
+                self.log.warning('{} byte packets rejected, falling back to 128 bytes'.format(packet_size))
+                self.serial.timeout = timeout
+                replay = started
+                # later transfers go straight to the working packet size
+                self.mode = modes[-1]
+        
+        return False
+    
+    def wait_for_bootloader(self, timeout=5000):
+        # press '1' until the menu shows up, then choose the download
+        self.expect.clear()
+        self.expect.expect(self._MENU, timeout / 1000, send=b'1', interval=0.01,
+                           error='Timeout waiting for burn mode')
+        self.serial.write(b'1')
             
     def wait_for_flash(self, timeout=5000):
-        self.serial.timeout = 0.01
+        # the bootloader polls 'C' about once a second when it waits for a
+        # file, a 'C' in other text is not followed by a second one
+        deadline = time.monotonic() + timeout / 1000
         while True:
-            if self.serial.read(1) == b'C':
-                time.sleep(1)
-                if self.serial.read(1) == b'C':
-                    break
-            timeout -= 10
-            if timeout <= 0:
-                raise Exception('Timeout waiting for flash')
+            self.expect.expect(b'C', deadline - time.monotonic(), error='Timeout waiting for flash')
+            remaining = deadline - time.monotonic()
+            if self.expect.read(1, min(self._POLL_INTERVAL, max(0, remaining))) == b'C':
+                return
+            if time.monotonic() >= deadline:
+                raise TimeoutError('Timeout waiting for flash')
+
+    def reset_input_buffer(self):
+        """Discard the bytes received, including the ones kept by expect."""
+        self.serial.reset_input_buffer()
+        self.expect.clear()
         
     def wait_for_config_done(self, timeout=5000):
-        rbuf = b''
-        self.serial.timeout = 0.01
-        while True:
-            rbuf += self.serial.read(128)
-            if 'Do you want to end file transmission and reboot system'.encode() in rbuf:
-                rbuf = b''
-                self.serial.write(b'n')
-                break
-            timeout -= 10
-            if timeout <= 0:
-                raise Exception('Timeout waiting for config')
+        self.expect.expect(self._PROMPT, timeout / 1000, error='Timeout waiting for config')
+        self.serial.write(b'n')
             
     def wait_for_flash_done(self, timeout=10000):
-        rbuf = b''
-        self.serial.timeout = 0.01
-        while True:
-            rbuf += self.serial.read(128)
-            if 'Do you want to end file transmission and reboot system'.encode() in rbuf:
-                rbuf = b''
-                self.serial.write(b'y')
-                break
-            timeout -= 10
-            if timeout <= 0:
-                raise Exception('Timeout waiting for completion')
+        self.expect.expect(self._PROMPT, timeout / 1000, error='Timeout waiting for completion')
+        self.serial.write(b'y')
     
     
-    def write(self, data, offset=0x00):
+    def write(self, data, offset=0x00, callback=None):
         
-        self.serial.open()
+        self.write_images([(offset, data)], callback)
         
-        self.wait_for_bootloader()
+    def write_images(self, images, callback=None, sn=False):
+        """Write several images in a single bootloader session.
         
-        self.wait_for_flash()
-        time.sleep(1)
-        self.serial.reset_input_buffer()
+        images is a list of (offset, data) written in order, data being bytes,
+        a Source or a seekable binary stream. A new serial number is written
+        last when sn is set and returned.
+        """
+        if sn:
+            number, data = serial_number_image()
+            images = list(images) + [(SN_OFFSET, data)]
         
-    
-        if (offset != 0):
-            config = bytearray(128)
-            config[0] = 0xC0
-            config[1] = 0x5A
-            config[2] = (offset >> 0) & 0xFF
-            config[3] = (offset >> 8) & 0xFF
-            config[4] = (offset >> 16) & 0xFF
-            config[5] = (offset >> 24) & 0xFF
-            config[6] = 0x00
-            config[7] = 0x00
-            config[8] = 0x00
-            config[9] = 0x00
-            config[10] = 0x5A
-            config[11] = 0xC0
-            for i in range(12, 128):
-                config[i] = 0xFF
-            config = io.BytesIO(config)
-            self.serial.timeout = 2
-            status = self.xmodem.send(config, quiet=True)
-        
-            if not status:
-                raise Exception('Failed to send config')
-            
-            self.wait_for_config_done()
-            
-            time.sleep(1)
-            
-        data = io.BytesIO(data)
+        self.serial.open()
+        try:
+            self._write_images(images, callback)
+        finally:
+            self.serial.close()
         
-        progress_bar = tqdm(total=len(data.getbuffer()), unit='B',
-                            unit_scale=True, unit_divisor=1024, ncols=80)
+        return number if sn else None
+        
+    def send_config(self, offset):
+        """Set the flash offset of the next image."""
+        config = bytearray(128)
+        config[0] = 0xC0
+        config[1] = 0x5A
+        config[2] = (offset >> 0) & 0xFF
+        config[3] = (offset >> 8) & 0xFF
+        config[4] = (offset >> 16) & 0xFF
+        config[5] = (offset >> 24) & 0xFF
+        config[6] = 0x00
+        config[7] = 0x00
+        config[8] = 0x00
+        config[9] = 0x00
+        config[10] = 0x5A
+        config[11] = 0xC0
+        for i in range(12, 128):
+            config[i] = 0xFF
+        config = io.BytesIO(config)
+        self.serial.timeout = 2
+        self.reset_input_buffer()
+        status = self.xmodem.send(config, quiet=True)
     
-        def callback_written(total_packets, success_count, error_count):
-            progress_bar.update(total_packets * 128 - progress_bar.n)
+        if not status:
+            raise Exception('Failed to send config')
         
-        self.serial.timeout = 60
-        self.serial.reset_input_buffer()
-        status = self.xmodem.send(data, retry=60, timeout=60, quiet=False, callback=callback_written)
+        self.wait_for_config_done()
         
-        if status:
-            self.wait_for_flash_done()
-
+    def _write_images(self, images, callback):
         
-        self.serial.close()
-        time.sleep(0.5)
-        self.serial.open()
-        time.sleep(0.5)
-        self.serial.close()
+        self.wait_for_bootloader()
         
-        progress_bar.close()
+        self.wait_for_flash()
+        # XMODEM starts on the next 'C'
+        self.reset_input_buffer()
         
+        total = sum(image_size(data) for _, data in images)
         
-    def write_sn(self):
-        random_bytes = secrets.token_bytes(4 * 1024)
-        sn = str(hex(fnv_hash(random_bytes[:16])))
-        self.write(random_bytes, 0x003DF000)
-        return sn
+        progress_bar = None
+        if callback is None:
+            # tqdm is slow to import, only load it for the terminal progress
+            from tqdm import tqdm
+            progress_bar = tqdm(total=total, unit='B',
+                                unit_scale=True, unit_divisor=1024, ncols=80)
+            callback = lambda written, total: progress_bar.update(written - progress_bar.n)
         
- 
+        try:
+            done = 0
+            for index, (offset, data) in enumerate(images):
+                if (offset != 0):
+                    self.send_config(offset)
+                
+                self.serial.timeout = self.ack_timeout
+                self.reset_input_buffer()
+                with open_image(data) as (stream, size):
+                    status = self.send(stream, lambda written, size: callback(done + written, total), size)
+                
+                if not status:
+                    raise Exception('Failed to send data')
+                done += size
+                
+                # answer 'n' while images remain, 'y' ends the session
+                if index < len(images) - 1:
+                    self.wait_for_config_done()
+                else:
+                    self.wait_for_flash_done()
+        finally:
+            if progress_bar is not None:
+                progress_bar.close()
         
-            
-            
-            
-            
\ No newline at end of file
+        # toggle the port to reboot the device
+        self.serial.close()
+        time.sleep(self.reset_delay)
+        self.serial.open()
+        time.sleep(self.reset_delay)
+        
+        
+    def write_sn(self, callback=None):
+        return self.write_images([], callback, sn=True)
@@ -0,0 +1,132 @@
+import time
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Expect:
+    """
+    Waits for patterns in the bytes received from a serial port.
+
+    Reads return as soon as bytes are available and every wait has a real
+    monotonic deadline. Received bytes are kept in a bounded rolling window,
+    only the bytes not scanned yet are searched, and the bytes following a
+    match are kept for the next wait.
+    """
+
+    def __init__(self, serial, window=4096, poll=0.01):
+        """
+        Initializes the Expect class.
+
+        Args:
+        - serial: an open pyserial port.
+        - window: maximum number of bytes kept, older bytes are discarded.
+        - poll: longest time a single read blocks, in seconds.
+        """
+        self.serial = serial
+        self.window = window
+        self.poll = poll
+        self._buffer = bytearray()
+        self._scanned = 0
+
+    def clear(self):
+        """Discard the bytes received so far."""
+        self._buffer.clear()
+        self._scanned = 0
+
+    def _read(self, timeout):
+        # setting the timeout of an open port reconfigures it, only do it on change
+        if self.serial.timeout != timeout:
+            self.serial.timeout = timeout
+        data = self.serial.read(max(1, self.serial.in_waiting))
+        if data:
+            self._buffer += data
+            if len(self._buffer) > self.window:
+                overflow = len(self._buffer) - self.window
+                del self._buffer[:overflow]
+                self._scanned = max(0, self._scanned - overflow)
+
+    def read(self, size, timeout):
+        """
+        Reads the next bytes, the ones kept after the last match first.
+
+        Args:
+        - size: number of bytes to read.
+        - timeout: seconds to wait.
+
+        Returns:
+        - data: the bytes read, fewer than size if the time ran out.
+        """
+        deadline = time.monotonic() + timeout
+        serial_timeout = self.serial.timeout
+        try:
+            while len(self._buffer) < size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._read(min(self.poll, remaining))
+        finally:
+            if self.serial.timeout != serial_timeout:
+                self.serial.timeout = serial_timeout
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._scanned = 0
+        return data
+
+    def _search(self, patterns):
+        # a pattern may straddle the bytes scanned by the previous search
+        longest = max(len(pattern) for pattern in patterns)
+        start = max(0, self._scanned - longest + 1)
+        found = None
+        for index, pattern in enumerate(patterns):
+            position = self._buffer.find(pattern, start)
+            if position >= 0 and (found is None or position < found[1]):
+                found = (index, position, len(pattern))
+        self._scanned = len(self._buffer)
+        return found
+
+    def expect(self, patterns, timeout, send=None, interval=None, error=None):
+        """
+        Waits until one of the patterns is received.
+
+        Args:
+        - patterns: bytes, or a list of bytes to wait for.
+        - timeout: seconds to wait.
+        - send: bytes written before waiting, and again every interval.
+        - interval: seconds between two writes of send.
+        - error: message of the TimeoutError.
+
+        Returns:
+        - index: index of the pattern received first.
+
+        Raises:
+        - TimeoutError: none of the patterns was received in time.
+        """
+        if isinstance(patterns, (bytes, bytearray)):
+            patterns = [patterns]
+        deadline = time.monotonic() + timeout
+        # without send, reads only wait for the deadline
+        next_send = time.monotonic() if send is not None else float("inf")
+        serial_timeout = self.serial.timeout
+        try:
+            while True:
+                now = time.monotonic()
+                if send is not None and now >= next_send:
+                    self.serial.write(send)
+                    next_send = now + interval if interval else float("inf")
+
+                found = self._search(patterns)
+                if found is not None:
+                    index, position, length = found
+                    del self._buffer[:position + length]
+                    self._scanned = 0
+                    return index
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise TimeoutError(error or "Timeout waiting for {}".format(patterns))
+
+                self._read(max(0, min(self.poll, remaining, next_send - now)))
+        finally:
+            if self.serial.timeout != serial_timeout:
+                self.serial.timeout = serial_timeout
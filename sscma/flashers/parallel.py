@@ -0,0 +1,171 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from sscma.flashers.base import flasher_options
+from sscma.flashers.core import HimaxFlasher
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FlashResult:
+    """
+    Outcome of a flashing operation on one port.
+
+    Attributes:
+    - port: the port flashed.
+    - ok: whether the operation succeeded.
+    - elapsed: seconds the operation took.
+    - error: the error message on failure.
+    - value: the value returned by the operation, the serial number for write_sn.
+    - skipped: the BundleImage not written as the device already runs them.
+    """
+
+    def __init__(self, port, ok, elapsed, error=None, value=None, skipped=None):
+        self.port = port
+        self.ok = ok
+        self.elapsed = elapsed
+        self.error = error
+        self.value = value
+        self.skipped = skipped or []
+
+    def __repr__(self):
+        return "FlashResult(port={}, ok={}, elapsed={:.1f}, error={})".format(
+            self.port,
+            self.ok,
+            self.elapsed,
+            self.error
+        )
+
+
+def find_ports(flashers=None):
+    """
+    Lists the serial ports a flasher matches.
+
+    Args:
+    - flashers: flasher classes to match, defaults to every known flasher.
+
+    Returns:
+    - ports: list of (flasher class, port device) in port order.
+    """
+    from serial.tools.list_ports import comports
+    from sscma.flashers import FLASHERS
+
+    matched = []
+    for port in sorted(comports(), key=lambda port: port.device):
+        for flasher in flashers or FLASHERS:
+            if flasher.match(port):
+                matched.append((flasher, port.device))
+                break
+    return matched
+
+
+class ParallelFlasher:
+    """
+    Flashes several ports concurrently, with one worker thread per port.
+
+    A failure on a port never stops the other ones, every port gets a
+    FlashResult.
+    """
+
+    def __init__(self, ports, baudrate=921600, flasher=HimaxFlasher, workers=None, **kwargs):
+        """
+        Initializes the ParallelFlasher class.
+
+        Args:
+        - ports: port devices, or (flasher class, port device) tuples as
+          returned by find_ports.
+        - baudrate: baudrate of the serial connections.
+        - flasher: flasher class of ports given without one.
+        - workers: maximum number of ports flashed at once, defaults to all.
+        - kwargs: further arguments of the flasher constructor.
+        """
+        self.ports = [port if isinstance(port, tuple) else (flasher, port) for port in ports]
+        self.baudrate = baudrate
+        self.workers = workers or max(1, len(self.ports))
+        self.options = kwargs
+
+    def _run(self, operation, callback):
+        def job(Flasher, port):
+            start = time.monotonic()
+            try:
+                flasher = Flasher(port, baudrate=self.baudrate, **flasher_options(Flasher, self.options))
+                progress = None
+                if callback is not None:
+                    progress = lambda written, total: callback(port, written, total)
+                value = operation(flasher, progress)
+                return FlashResult(port, True, time.monotonic() - start, value=value)
+            except Exception as ex:
+                _LOGGER.debug("flash {} failed:{}".format(port, ex))
+                return FlashResult(port, False, time.monotonic() - start, error=str(ex) or type(ex).__name__)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(job, Flasher, port) for Flasher, port in self.ports]
+            return [future.result() for future in futures]
+
+    def write(self, data, offset=0, callback=None):
+        """
+        Writes data to every port.
+
+        Args:
+        - data: bytes or a Source to write, streams can not be shared by ports.
+        - offset: flash offset to write the data to.
+        - callback: called as callback(port, written, total) from the worker
+          threads as the data is written.
+
+        Returns:
+        - results: a FlashResult per port, in port order.
+        """
+        return self._run(lambda flasher, progress: flasher.write_images([(offset, data)], progress), callback)
+
+    def write_images(self, images, callback=None, sn=False):
+        """
+        Writes several images to every port, in a single session per port.
+
+        Args:
+        - images: list of (offset, data), written in order, data being bytes
+          or a Source.
+        - callback: called as callback(port, written, total) from the worker
+          threads as the images are written.
+        - sn: also write a new serial number to every port.
+
+        Returns:
+        - results: a FlashResult per port, in port order, the serial number in value.
+        """
+        return self._run(lambda flasher, progress: flasher.write_images(images, progress, sn=sn), callback)
+
+    def write_bundle(self, bundle, callback=None, sn=False, skip_identical=False):
+        """
+        Writes the images of a bundle to every port, in a single session per port.
+
+        Args:
+        - bundle: the Bundle to write.
+        - callback: called as callback(port, written, total) from the worker
+          threads as the images are written.
+        - sn: also write a new serial number to every port.
+        - skip_identical: do not write the images a port already runs, each
+          port is queried on its own.
+
+        Returns:
+        - results: a FlashResult per port, in port order, the serial number in
+          value and the images not written in skipped.
+        """
+        results = self._run(lambda flasher, progress: flasher.write_bundle(
+            bundle, progress, sn=sn, skip_identical=skip_identical), callback)
+        for result in results:
+            if result.ok:
+                result.value, result.skipped = result.value
+        return results
+
+    def write_sn(self, callback=None):
+        """
+        Writes a new serial number to every port.
+
+        Args:
+        - callback: called as callback(port, written, total) from the worker
+          threads as the serial number is written.
+
+        Returns:
+        - results: a FlashResult per port, in port order, the serial number in value.
+        """
+        return self._run(lambda flasher, progress: flasher.write_images([], progress, sn=True), callback)
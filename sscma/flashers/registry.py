@@ -0,0 +1,41 @@
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+# entry point group flasher plugins register their BaseFlasher subclass in
+GROUP = 'sscma.flashers'
+
+
+def _entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return list(pkg_resources.iter_entry_points(group))
+    points = entry_points()
+    if hasattr(points, 'select'):
+        return list(points.select(group=group))
+    return list(points.get(group, []))
+
+
+def load_flashers():
+    """Return the flasher classes, the built-in HimaxFlasher first, then the plugins by name.
+
+    Plugins are installed packages declaring an entry point in the
+    'sscma.flashers' group, a plugin failing to load is skipped.
+    """
+    from sscma.flashers.core import HimaxFlasher
+
+    flashers = [HimaxFlasher]
+    for entry_point in sorted(_entry_points(GROUP), key=lambda entry_point: entry_point.name):
+        try:
+            flasher = entry_point.load()
+        except Exception as ex:
+            _LOGGER.warning('Flasher {} not loaded: {}'.format(entry_point.name, ex))
+            continue
+        if flasher not in flashers:
+            flashers.append(flasher)
+    return flashers
@@ -0,0 +1,139 @@
+import io
+import os
+import gzip
+import mmap
+import struct
+import zipfile
+from contextlib import contextmanager
+
+
+class Source:
+    """
+    A firmware image read on demand from a file, a gzip file or a zip member.
+
+    Plain files are memory-mapped, compressed ones are decompressed while
+    they are read. Every call to `open` returns a new stream, so a Source can
+    be written to several ports at once.
+
+    Attributes:
+    - path: path of the file or the archive.
+    - member: name of the zip member, None for other files.
+    - size: size of the uncompressed image in bytes.
+    """
+
+    def __init__(self, path, member=None):
+        """
+        Initializes the Source class.
+
+        Args:
+        - path: path of the file or the archive.
+        - member: name of the member of a zip archive, optional if the
+          archive holds a single file.
+
+        Raises:
+        - ValueError: the archive member can not be found.
+        """
+        self.path = path
+        self.member = member
+        self._compressed = False
+
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                if member is None:
+                    files = [info for info in archive.infolist() if not info.is_dir()]
+                    if len(files) != 1:
+                        raise ValueError("{} holds {} files, select one with {}#<member>".format(
+                            path, len(files), path))
+                    self.member = files[0].filename
+                try:
+                    self.size = archive.getinfo(self.member).file_size
+                except KeyError:
+                    raise ValueError("{} has no {}".format(path, self.member))
+        elif member is not None:
+            raise ValueError("{} is not a zip archive".format(path))
+        else:
+            with open(path, "rb") as f:
+                self._compressed = f.read(2) == b"\x1f\x8b"
+                if self._compressed:
+                    # ISIZE, the uncompressed size modulo 2^32, ends the file
+                    f.seek(-4, os.SEEK_END)
+                    self.size = struct.unpack("<I", f.read(4))[0]
+                else:
+                    self.size = os.fstat(f.fileno()).st_size
+
+    def __repr__(self):
+        return "Source(path={}, member={}, size={})".format(
+            self.path,
+            self.member,
+            self.size
+        )
+
+    @property
+    def name(self) -> str:
+        """Name of the image."""
+        return self.member or os.path.basename(self.path)
+
+    @staticmethod
+    def parse(spec) -> "Source":
+        """
+        Builds a Source from a path, `archive.zip#member` selects a zip member.
+
+        Args:
+        - spec: the path.
+        """
+        if not os.path.exists(spec) and "#" in spec:
+            path, member = spec.rsplit("#", 1)
+            return Source(path, member)
+        return Source(spec)
+
+    def open(self):
+        """Return a new seekable binary stream of the uncompressed image."""
+        if self.member is not None:
+            # the file stays open until the member stream is closed
+            with zipfile.ZipFile(self.path) as archive:
+                return archive.open(self.member)
+        if self._compressed:
+            return gzip.open(self.path, "rb")
+        if self.size == 0:
+            return io.BytesIO()
+        with open(self.path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self) -> bytes:
+        """Return the whole uncompressed image."""
+        with self.open() as stream:
+            return stream.read()
+
+
+@contextmanager
+def open_image(data):
+    """
+    Opens an image given as bytes, a Source or a seekable binary stream.
+
+    Yields:
+    - (stream, size): a stream positioned at the start of the image and the
+      number of bytes it holds.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield io.BytesIO(data), len(data)
+    elif isinstance(data, Source):
+        stream = data.open()
+        try:
+            yield stream, data.size
+        finally:
+            stream.close()
+    else:
+        yield data, image_size(data)
+
+
+def image_size(data) -> int:
+    """Return the size of an image given as bytes, a Source or a seekable stream."""
+    if isinstance(data, Source):
+        return data.size
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return len(data)
+    start = data.tell()
+    data.seek(0, os.SEEK_END)
+    size = data.tell() - start
+    data.seek(start)
+    return size
@@ -3,4 +3,8 @@ from .const import *
 from .client import Client, SerialClient, MQTTClient
 from .exceptions import DeviceException, PayloadDecodeException, DeviceInfoUnavailableException, DeviceError, RecoverableError, UnsupportedFeatureException
 from .device import Device
+from .discovery import Discovery, DiscoveredDevice, discover
+from .framebus import FramePublisher, FrameSubscriber, Frame
 from .info import DeviceInfo, ModelInfo, WiFiInfo, MQTTInfo
+from .metrics import PrometheusExporter, render_prometheus
+from .trace import Tracer, RingBufferSink, ChromeTraceSink
@@ -1,12 +1,17 @@
-import re
 import json
+import struct
 import string
 import random
+import time
 import logging
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from threading import Thread, Event, Lock, current_thread
-from typing import List, Optional  # noqa: F401
+from typing import Dict, List, Optional  # noqa: F401
 
 from .const import *
+from .metrics import Counter, Histogram, Meter
+from .trace import STAGE_RECEIVE, STAGE_EXTRACT, STAGE_JSON, STAGE_DISPATCH
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -59,6 +64,8 @@ class Client:
 
     _timeout: int = 1
     _try_count: int = 3
+    # larger binary frames are taken for corrupted headers
+    _max_binary_size: int = 16 * 1024 * 1024
 
     def __init__(self,
                  on_write=None,
@@ -86,9 +93,22 @@ class Client:
 
         self._msg_buffer = b''
         self._listeners: List[Listener] = []
+        self._binary_images = False
 
         self._lock = Lock()
 
+        self._bytes_received = Counter()
+        self._byte_rate = Meter()
+        self._frames = Counter()
+        self._parse_failures = Counter()
+        self._buffer_resyncs = Counter()
+        self._retries = Counter()
+        self._timeouts = Counter()
+        self._command_latency: Dict[str, Histogram] = {}
+
+        self._tracer = None
+        self._receive_start = 0.0
+
     @property
     def on_write(self):
         """
@@ -106,6 +126,11 @@ class Client:
         """
         self._on_write = value
 
+    @property
+    def name(self) -> str:
+        """Name of the client, unique in the process, labels its metrics."""
+        return "{}-{:x}".format(type(self).__name__, id(self))
+
     @property
     def on_event(self):
         """
@@ -140,6 +165,23 @@ class Client:
         """
         self._on_log = value
 
+    @property
+    def tracer(self):
+        """
+        If set, the Tracer timestamping the stages of every received frame.
+        """
+        return self._tracer
+
+    @tracer.setter
+    def tracer(self, value):
+        """
+        Sets the tracer.
+
+        Args:
+        - value: a Tracer, or None to disable tracing.
+        """
+        self._tracer = value
+
     def _send(self, msg):
         """
         Sends a message to the device using the on_write function.
@@ -175,11 +217,15 @@ class Client:
         - response: The response received from the device.
         """
         listener = Listener(command, Event(), None)
+        start = time.perf_counter()
 
         for i in range(self._try_count):
             _LOGGER.debug(
                 "send_command:{} try:{}/{}".format(command, i+1, self._try_count))
 
+            if i > 0:
+                self._retries.inc()
+
             if wait_event:
                 listener.event.clear()
                 self._listeners.append(listener)
@@ -199,6 +245,14 @@ class Client:
 
         if listener.response is None and wait_event:
             _LOGGER.debug("send_command:{} timeout".format(command))
+            self._timeouts.inc()
+        elif wait_event:
+            # strip the tag, AT+TAG@ID? is accounted as ID?
+            name = listener.name.split("@")[-1]
+            histogram = self._command_latency.get(name)
+            if histogram is None:
+                histogram = self._command_latency.setdefault(name, Histogram())
+            histogram.observe(time.perf_counter() - start)
 
         return listener.response
 
@@ -266,6 +320,53 @@ class Client:
 
         return self.send_command(command, wait_event, timeout)
 
+    @property
+    def binary_images(self) -> bool:
+        """
+        True when the device sends images in binary frames, see negotiate_binary.
+        """
+        return self._binary_images
+
+    def negotiate_binary(self, timeout=0.5) -> bool:
+        """
+        Asks the device to send images in binary frames instead of base64 in JSON.
+
+        Devices without the feature reject the command and keep sending
+        base64 images, which are still accepted in binary mode.
+
+        Args:
+        - timeout: seconds to wait for each try of the command.
+
+        Returns:
+        - accepted: whether the device sends binary frames from now on.
+        """
+        # frames are told apart before the answer arrives
+        self._binary_images = True
+        response = self.set(CMD_AT_BINARY, 1, timeout=timeout)
+        self._binary_images = response is not None and response.get("code") == CMD_OK
+        _LOGGER.debug("binary images:{}".format(self._binary_images))
+        return self._binary_images
+
+    def stats(self) -> Dict:
+        """
+        Returns the runtime metrics of the client.
+
+        Returns:
+        - stats: the client name, counters, the receive byte rate and the
+          round-trip time histograms by command name.
+        """
+        return {
+            "name": self.name,
+            "bytes_received": self._bytes_received.value,
+            "byte_rate": self._byte_rate.rate(),
+            "frames": self._frames.value,
+            "parse_failures": self._parse_failures.value,
+            "buffer_resyncs": self._buffer_resyncs.value,
+            "retries": self._retries.value,
+            "timeouts": self._timeouts.value,
+            "commands": {name: histogram.snapshot()
+                         for name, histogram in list(self._command_latency.items())},
+        }
 
     def on_recieve(self, msg):
         """
@@ -276,6 +377,51 @@ class Client:
         """
         self._recieve_handler(msg)
 
+    def _split_frames(self):
+        """
+        Cuts the complete frames out of the receive buffer, in order.
+
+        Returns:
+        - frames: list of (resync, frame, image) where resync tells bytes were
+          dropped before the frame, frame is the JSON bytes and image the
+          JPEG bytes of a binary frame, None for JSON frames.
+        """
+        buffer = self._msg_buffer
+        frames = []
+        position = 0
+        while True:
+            start = buffer.find(RESPONSE_PREFIX, position)
+            if self._binary_images:
+                # JPEG bytes may hold a JSON prefix, binary frames are cut by length
+                binary = buffer.find(BINARY_PREFIX, position)
+                if binary >= 0 and (start < 0 or binary < start):
+                    header = binary + BINARY_HEADER_SIZE
+                    if len(buffer) < header:
+                        break
+                    json_size, image_size = struct.unpack_from("<II", buffer, binary + len(BINARY_PREFIX))
+                    if json_size + image_size > self._max_binary_size:
+                        self._parse_failures.inc()
+                        position = binary + 1
+                        continue
+                    end = header + json_size + image_size
+                    if len(buffer) < end:
+                        break
+                    frames.append((binary > position, buffer[header:header + json_size],
+                                   buffer[header + json_size:end]))
+                    position = end
+                    continue
+            if start < 0:
+                break
+            end = buffer.find(RESPONSE_SUFFIX, start)
+            if end < 0:
+                break
+            end += len(RESPONSE_SUFFIX)
+            frames.append((start > position, buffer[start:end], None))
+            position = end
+        if position:
+            self._msg_buffer = buffer[position:]
+        return frames
+
     def _recieve_handler(self, msg):
         """
         Handles messages received from the device
@@ -283,16 +429,43 @@ class Client:
         Args:
         - msg: message received from the device.
         """
+        self._bytes_received.inc(len(msg))
+        self._byte_rate.mark(len(msg))
+
+        tracer = self._tracer
+        if tracer is not None:
+            received = tracer.clock()
+            if not self._msg_buffer:
+                self._receive_start = received
+
         self._msg_buffer += msg
 
-        matches = re.findall(b'\r{.*}\n', self._msg_buffer)
+        frames = self._split_frames()
 
-        if matches is None or len(matches) == 0:
+        if len(frames) == 0:
             return
 
-        for match in matches:
+        if tracer is not None:
+            extracted = tracer.clock()
+
+        for resync, frame, image in frames:
+            self._frames.inc()
+            if resync:
+                # bytes before the frame were dropped
+                self._buffer_resyncs.inc()
+            if tracer is not None:
+                tracer.begin()
+                tracer.record(STAGE_RECEIVE, self._receive_start, received)
+                tracer.record(STAGE_EXTRACT, received, extracted)
+                start = tracer.clock()
             try:
-                paylod = json.loads(match.decode('utf-8'))
+                paylod = json.loads(frame.decode('utf-8'))
+                if image is not None:
+                    paylod["data"]["image"] = image
+                if tracer is not None:
+                    tracer.name(paylod.get("name"))
+                    tracer.record(STAGE_JSON, start)
+                    start = tracer.clock()
                 # response frame
                 if "type" in paylod and paylod["type"] == CMD_TYPE_RESPONSE:
                     if "name" in paylod:
@@ -321,18 +494,22 @@ class Client:
                                 self._on_log(paylod)
 
             except Exception as ex:
+                self._parse_failures.inc()
                 _LOGGER.debug("payload decode exception:{}".format(ex))
             finally:
-                self._msg_buffer = self._msg_buffer[self._msg_buffer.find(
-                    RESPONSE_SUFFIX)+2:]
+                if tracer is not None:
+                    tracer.record(STAGE_DISPATCH, start)
+                    tracer.end()
+                    # the remaining bytes arrived with this chunk
+                    self._receive_start = received
 
 
 class SerialClient(Client):
-    import serial as serial
 
     def __init__(self, port, baudrate=921600, timeout=0.1, **kwargs):
+        import serial
 
-        self._serial = self.serial.Serial(
+        self._serial = serial.Serial(
             port, baudrate, timeout=timeout,  **kwargs)
         self._running = False
         self._thread = None
@@ -360,6 +537,10 @@ class SerialClient(Client):
     def is_connected(self):
         return self._serial.is_open
 
+    @property
+    def name(self):
+        return self._serial.port
+
     def loop_start(self):
         if not self._serial.is_open:
             self._serial.open()
@@ -380,52 +561,331 @@ class SerialClient(Client):
             self._thread = None
 
 
+def backoff_delay(attempt, minimum=1.0, maximum=60.0):
+    """
+    Returns a reconnect delay with exponential backoff and full jitter.
+
+    The delay is drawn uniformly below a cap doubling at every attempt, so
+    clients losing the same broker spread their reconnects instead of all
+    retrying at once.
+
+    Args:
+    - attempt: number of reconnects tried since the last connection, from 0.
+    - minimum: cap of the first attempt in seconds.
+    - maximum: largest cap in seconds.
+    """
+    return random.uniform(0, min(maximum, minimum * 2 ** min(attempt, 32)))
+
+
 class MQTTClient(Client):
-    import paho.mqtt.client as mqtt
 
-    def __init__(self, host="localhost", port=1883, tx_topic="#", rx_topic="#", **kwargs):
+    def __init__(self, host="localhost", port=1883, tx_topic="#", rx_topic="#", shared=None,
+                 qos=0, keepalive=60, max_inflight=20, queue_size=64, queue_ttl=10.0,
+                 reconnect_min=1.0, reconnect_max=60.0, **kwargs):
+        """
+        Initializes the MQTTClient class.
+
+        Args:
+        - host: MQTT broker address.
+        - port: MQTT broker port.
+        - tx_topic: topic commands are published to.
+        - rx_topic: topic frames are received from.
+        - shared: another MQTTClient whose broker connection is reused, host,
+          port, credentials and connection settings are then ignored.
+        - qos: QoS of the published commands and of the subscriptions.
+        - keepalive: seconds between keepalive pings, a lost broker is
+          noticed after 1.5 times as long.
+        - max_inflight: QoS 1 and 2 messages sent and not acknowledged yet.
+        - queue_size: commands kept while the broker is unreachable, sent
+          again on reconnect, the oldest are dropped first.
+        - queue_ttl: seconds after which a kept command is dropped.
+        - reconnect_min: cap in seconds of the first reconnect delay.
+        - reconnect_max: largest reconnect delay in seconds.
+
+        Nothing is sent on the network before loop_start, which connects in
+        the background. `ready` and `on_ready` tell when the connection is up,
+        commands sent before are kept in the offline queue.
+        """
 
-        self._client = self.mqtt.Client(self.mqtt.CallbackAPIVersion.VERSION2)
         self._tx_topic = tx_topic
         self._rx_topic = rx_topic
-        self._client.on_message = self.__on_recieve
-        self._client.on_connect = self.__on_connect
         self._host = host
         self._port = port
-
-        for key in kwargs:
-            if key == "username":
-                if kwargs["username"] is not None:
-                    self._client.username_pw_set(
-                        kwargs["username"], kwargs["password"])
-                break
-
-        self._client.connect(self._host, self._port, 120)
-        super().__init__(lambda msg: self._client.publish(
-            self._tx_topic, msg, qos=0))
-
+        self._qos = qos
+        self._keepalive = keepalive
+        # attach to the client owning the connection
+        self._owner = shared._owner or shared if shared is not None else None
+        self._shared = []
+        self._loop_users = 0
+        self._loop_lock = Lock()
+        self._ready = Future()
+        self._on_ready = None
+
+        if self._owner is not None:
+            self._client = self._owner._client
+            self._client.message_callback_add(self._rx_topic, self.__on_recieve)
+            self._owner._attach(self)
+        else:
+            import paho.mqtt.client as mqtt
+
+            # commands sent while the broker is unreachable, as (time, topic, payload)
+            self._queue = deque()
+            self._queue_size = queue_size
+            self._queue_ttl = queue_ttl
+            self._queue_lock = Lock()
+            self._reconnect_min = reconnect_min
+            self._reconnect_max = reconnect_max
+            self._reconnect_attempt = 0
+            # set while the connection is closed on purpose
+            self._stopping = False
+            self._disconnect_time = None
+            self._connect_start = None
+            self._connect_time = None
+
+            self._connects = Counter()
+            self._disconnects = Counter()
+            self._queued = Counter()
+            self._queue_dropped = Counter()
+            self._queue_expired = Counter()
+            self._reconnect_time = Histogram()
+            self._resubscribe_time = Histogram()
+            self._drain_time = Histogram()
+
+            self._client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+            self._client.on_message = self.__on_recieve
+            self._client.on_connect = self.__on_connect
+            self._client.on_disconnect = self.__on_disconnect
+            self._client.on_connect_fail = self.__on_connect_fail
+            self._client.max_inflight_messages_set(max_inflight)
+            self._client.reconnect_delay_set(reconnect_min, reconnect_max)
+
+            for key in kwargs:
+                if key == "username":
+                    if kwargs["username"] is not None:
+                        self._client.username_pw_set(
+                            kwargs["username"], kwargs["password"])
+                    break
+
+        super().__init__(lambda msg: (self._owner or self)._publish(self._tx_topic, msg, self._qos))
+
+    def _attach(self, client):
+        """Registers a client sharing this connection."""
+        with self._loop_lock:
+            if client in self._shared:
+                return
+            self._shared.append(client)
+        if self._client.is_connected():
+            self._client.subscribe(client._rx_topic, client._qos)
+            client._set_ready()
+
+    def _detach(self, client):
+        """Unregisters a client sharing this connection."""
+        with self._loop_lock:
+            if client not in self._shared:
+                return
+            self._shared.remove(client)
+            # messages no callback matches would reach the owner
+            used = any(other._rx_topic == client._rx_topic for other in [self] + self._shared)
+        if not used and self._client.is_connected():
+            self._client.unsubscribe(client._rx_topic)
+
+    def _set_ready(self):
+        """Reports the connection is up, resolving `ready` the first time."""
+        if not self._ready.done():
+            self._ready.set_result(self)
+        if self._on_ready is not None:
+            self._on_ready(self)
+
+    def _publish(self, topic, payload, qos):
+        """Publishes a message, or keeps it until the broker is reachable again."""
+        with self._queue_lock:
+            if not self._client.is_connected():
+                # identical commands, such as two AT+BREAK, are all kept, queue_size bounds them
+                if len(self._queue) >= self._queue_size > 0:
+                    self._queue.popleft()
+                    self._queue_dropped.inc()
+                if self._queue_size > 0:
+                    self._queue.append((time.monotonic(), topic, payload, qos))
+                    self._queued.inc()
+                return
+        self._client.publish(topic, payload, qos=qos)
+
+    def _drain(self):
+        """Sends the commands kept while the broker was unreachable."""
+        start = time.perf_counter()
+        with self._queue_lock:
+            now = time.monotonic()
+            while self._queue:
+                queued, topic, payload, qos = self._queue.popleft()
+                if now - queued > self._queue_ttl:
+                    # the caller gave up long ago
+                    self._queue_expired.inc()
+                    continue
+                self._client.publish(topic, payload, qos=qos)
+        self._drain_time.observe(time.perf_counter() - start)
 
     def __on_recieve(self, client, userdata, msg):
         self.on_recieve(msg.payload)
 
     def __on_connect(self, client, userdata, flags, rc, _):
-        self._client.subscribe(self._rx_topic)
+        if rc.is_failure:
+            self.__on_connect_fail(client, userdata)
+            return
+        self._connects.inc()
+        if self._connect_time is None and self._connect_start is not None:
+            self._connect_time = time.monotonic() - self._connect_start
+        if self._disconnect_time is not None:
+            self._reconnect_time.observe(time.monotonic() - self._disconnect_time)
+            self._disconnect_time = None
+        self._reconnect_attempt = 0
+
+        start = time.perf_counter()
+        self._client.subscribe(self._rx_topic, self._qos)
+        with self._loop_lock:
+            shared = list(self._shared)
+        for client in shared:
+            self._client.subscribe(client._rx_topic, client._qos)
+        self._resubscribe_time.observe(time.perf_counter() - start)
+        self._drain()
+
+        # from the network thread, callbacks must not wait for responses
+        for client in [self] + shared:
+            client._set_ready()
+
+    def __on_disconnect(self, client, userdata, flags, rc, properties):
+        self._disconnects.inc()
+        if self._stopping or not rc.is_failure:
+            # asked for locally, nothing to reconnect
+            return
+        if self._disconnect_time is None:
+            self._disconnect_time = time.monotonic()
+        self._schedule_reconnect()
 
+    def __on_connect_fail(self, client, userdata):
+        self._schedule_reconnect()
 
+    def _schedule_reconnect(self):
+        """Sets the delay of the next reconnect attempt of the network loop."""
+        delay = backoff_delay(self._reconnect_attempt, self._reconnect_min, self._reconnect_max)
+        self._reconnect_attempt += 1
+        _LOGGER.debug("mqtt reconnect in {:.2f}s attempt:{}".format(delay, self._reconnect_attempt))
+        # paho waits the minimum delay first, after the delay is set again
+        self._client.reconnect_delay_set(delay, max(delay, self._reconnect_max))
+
+    def stats(self) -> Dict:
+        """
+        Returns the runtime metrics of the client.
+
+        Returns:
+        - stats: the metrics of Client.stats, and in "mqtt" the name of the
+          client owning the connection, the connection counters, the offline queue and the reconnect, resubscribe and
+          queue drain time histograms, shared by the clients of a connection.
+        """
+        stats = super().stats()
+        owner = self._owner or self
+        with owner._queue_lock:
+            queue_length = len(owner._queue)
+        stats["mqtt"] = {
+            "connection": owner.name,
+            "connected": owner._client.is_connected(),
+            "connect_time": owner._connect_time,
+            "connects": owner._connects.value,
+            "disconnects": owner._disconnects.value,
+            "reconnect_attempt": owner._reconnect_attempt,
+            "queue_length": queue_length,
+            "queued": owner._queued.value,
+            "queue_dropped": owner._queue_dropped.value,
+            "queue_expired": owner._queue_expired.value,
+            "reconnect_time": owner._reconnect_time.snapshot(),
+            "resubscribe_time": owner._resubscribe_time.snapshot(),
+            "drain_time": owner._drain_time.snapshot(),
+        }
+        return stats
 
     @property
     def is_connected(self):
         return self._client.is_connected()
 
+    @property
+    def name(self):
+        owner = self._owner or self
+        return "mqtt://{}:{}/{}".format(owner._host, owner._port, self._rx_topic)
+
+    @property
+    def ready(self) -> Future:
+        """
+        Future resolved with the client once it is first connected and subscribed.
+        """
+        return self._ready
+
+    @property
+    def on_ready(self):
+        """
+        Return the on_ready callback, called with the client on every
+        connection, from the network thread.
+        """
+        return self._on_ready
+
+    @on_ready.setter
+    def on_ready(self, value):
+        """Set the on_ready callback."""
+        self._on_ready = value
+
+    def wait_ready(self, timeout=None) -> bool:
+        """
+        Waits for the client to be connected.
+
+        Args:
+        - timeout: seconds to wait, None waits forever.
+
+        Returns:
+        - ready: whether the client is connected.
+        """
+        try:
+            self._ready.result(timeout)
+        except FutureTimeoutError:
+            pass
+        return self.is_connected
+
     def connect(self):
-        self._client.connect(self._host, self._port, 120)
+        if self._owner is not None:
+            if not self._client.is_connected():
+                self._owner.connect()
+            return
+        self._client.connect(self._host, self._port, self._keepalive)
 
     def disconnect(self):
+        if self._owner is not None:
+            return
+        self._stopping = True
         self._client.disconnect()
 
     def loop_start(self):
-        self._client.loop_start()
+        # the network loop runs as long as one client of the connection needs it
+        owner = self._owner or self
+        if self._owner is not None:
+            # attached again after a loop_stop
+            self._client.message_callback_add(self._rx_topic, self.__on_recieve)
+            owner._attach(self)
+        with owner._loop_lock:
+            owner._loop_users += 1
+            if owner._loop_users == 1:
+                # the network loop connects, and reconnects with backoff
+                owner._connect_start = time.monotonic()
+                owner._stopping = False
+                self._client.connect_async(owner._host, owner._port, owner._keepalive)
+                self._client.loop_start()
 
     def loop_stop(self):
+        owner = self._owner or self
+        if self._owner is not None:
+            # a stopped client receives nothing more from the shared connection
+            self._client.message_callback_remove(self._rx_topic)
+            owner._detach(self)
+        with owner._loop_lock:
+            owner._loop_users = max(0, owner._loop_users - 1)
+            if owner._loop_users > 0:
+                return
+            owner._stopping = True
         self._client.loop_stop()
-        self._client.disconnect()
\ No newline at end of file
+        self._client.disconnect()
@@ -10,6 +10,11 @@ from typing import Final, Tuple
 RESPONSE_PREFIX: Final[str] = b"\r{"
 RESPONSE_SUFFIX: Final[str] = b"}\n"
 
+# binary frames carry an event and its JPEG image without base64:
+# prefix, JSON length and image length (little-endian uint32), JSON, image
+BINARY_PREFIX: Final[bytes] = b"\r\x00BIN"
+BINARY_HEADER_SIZE: Final[int] = len(BINARY_PREFIX) + 8
+
 # command types
 CMD_PREFIX: Final[str] = "AT+"
 
@@ -38,6 +43,7 @@ CMD_AT_MODEL: Final[str] = "MODEL"
 CMD_AT_SENSORS: Final[str] = "SENSORS"
 COMMADN_AT_ACTION: Final[str] = "ACTION"
 CMD_AT_LED: Final[str] = "LED"
+CMD_AT_BINARY: Final[str] = "BINIMG"
 
 # command error codes
 CMD_OK: Final[int] = 0
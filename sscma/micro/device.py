@@ -4,14 +4,15 @@ import json
 import time
 import base64
 import logging
-from typing import Optional  # noqa: F401
-from PIL import Image, ImageDraw, ImageFont, ImageFile
+from typing import Dict, Optional  # noqa: F401
 
 from .const import *
 from .client import Client
 from .info import DeviceInfo, ModelInfo, WiFiInfo, MQTTInfo
+from .metrics import DEVICES, Counter, Ewma, Histogram, Meter, TimeSeries
+from .trace import STAGE_DECODE, STAGE_ANNOTATE, STAGE_ENCODE, STAGE_CALLBACK
 
-from threading import Timer, Thread, current_thread
+from threading import Condition, Timer, Thread, current_thread
 
 import traceback
 
@@ -26,15 +27,45 @@ class Device:
     _heartbeat = 2
     _timeout = 5
     _keepalive = 60
+    _stat_interval = 0
+    _perf_capacity = 512
+    # a stream is stalled after stall_factor expected frame intervals
+    _stall_factor = 3.0
+    _stall_min = 0.1
+    # frame intervals learnt before the fixed timeout is replaced
+    _stall_warmup = 5
+    # host-paced continuous invoke, frames granted ahead and frame rate
+    _credits = 0
+    _target_fps = 0
+
+    # watchdog actions, escalated while a stream stays stalled
+    RECOVERY_ACTIONS = ("reinvoke", "restart", "reset")
+
+    # on-device timing fields, in milliseconds
+    PERF_FIELDS = ("preprocess", "inference", "postprocess")
 
     def __init__(self,
                  client: Client = None,
                  timeout: int = _timeout,
                  keepalive: int = _keepalive,
-                 heartbeat: int = _heartbeat
+                 heartbeat: int = _heartbeat,
+                 stat_interval: float = _stat_interval,
+                 perf_capacity: int = _perf_capacity,
+                 binary_images: bool = False,
+                 image_scale: int = 1,
+                 stall_factor: float = _stall_factor,
+                 stall_min: float = _stall_min,
+                 credits: int = _credits,
+                 target_fps: float = _target_fps
                  ) -> None:
 
         self._client = client
+        # ask the device for binary image frames when it connects
+        self._binary_images = binary_images
+        # on_monitor images are decoded and annotated at 1/image_scale of their size
+        if image_scale not in (1, 2, 4, 8):
+            raise ValueError("image_scale must be 1, 2, 4 or 8")
+        self._image_scale = image_scale
 
         self._info: Optional[DeviceInfo] = None
         self._model: Optional[ModelInfo] = None
@@ -56,6 +87,10 @@ class Device:
         self._on_disconnect = None
         self._on_monitor = None
         self._on_log = None
+        self._on_change = None
+
+        # last info of each kind reported to on_change
+        self._known = {}
 
         self._wifi_changed = False
         self._mqtt_changed = False
@@ -67,16 +102,61 @@ class Device:
         self._last_alive_time = time.time()
 
         self._timer = None
-        
+        # set by loop_stop, ends the initialize retries
+        self._stopped = False
 
         self._daemon_thread = None
         self._deamon = False
 
+        self._frames = Counter()
+        self._frame_rate = Meter()
+        self._reinvokes = Counter()
+        self._resamples = Counter()
+        self._resets = Counter()
+        self._callback_time = Histogram()
+
+        # stall watchdog, learns the frame interval of the stream
+        self._stall_factor = stall_factor
+        self._stall_min = stall_min
+        self._intervals = Ewma()
+        self._last_frame_time = None
+        self._stall_start = None
+        self._stall_level = 0
+        self._stalls = Counter()
+        self._restarts = Counter()
+        self._recovery_time = Histogram()
+
+        # Invoke(-1) is granted credits frames at a time, or one frame per
+        # 1 / target_fps, as on_monitor consumes them, see _pace
+        if credits < 0 or target_fps < 0:
+            raise ValueError("credits and target_fps must not be negative")
+        self._credits = credits
+        self._target_fps = target_fps
+        self._pace_condition = Condition()
+        self._pace_generation = 0
+        self._pacing = False
+        self._outstanding = 0
+        self._grants = Counter()
+
+        self._tracer = None
+        self._publisher = None
+
+        # on-device performance, polled with AT+STAT and parsed from INVOKE events
+        self._stat_interval = stat_interval
+        self._last_stat_time = 0
+        self._perf = TimeSeries(perf_capacity)
+
+        DEVICES.add(self)
+
     def daemon(self):
         """Device daemon."""
         self._deamon = True
         while self._deamon:
-            time.sleep(self._heartbeat)
+            wait = self._heartbeat
+            if self._status & (DeviceStatus.SAMPLING | DeviceStatus.INVOKING):
+                # look at a stream often enough to notice a stall in time
+                wait = min(wait, max(self._stall_min, self.stall_timeout) / 4)
+            time.sleep(wait)
             
             # if device is ready, check if device is lost
             if self._status & DeviceStatus.READY and time.time() - self._last_alive_time > self._keepalive:
@@ -89,20 +169,146 @@ class Device:
                     self._last_alive_time = time.time()
                     
             
-            # if device is sampling, check if sample is satisfied
-            if self._status & DeviceStatus.SAMPLING:
-                if time.time() - self._last_event_time > self._timeout:
-                    _LOGGER.debug("Device {} sample timeout, Resample".format(self.info.id))
-                    self.Sample(self._sample)
-                
-            # if device is invoking, check if invoke is satisfied
-            if self._status & DeviceStatus.INVOKING:
-                if time.time() - self._last_event_time > self._timeout:
-                    _LOGGER.debug("Device {} invoke timeout, Reinvoke".format(self.info.id))
-                    self.Invoke(self._invoke, self._fliter, self._show)
+            # if device is sampling or invoking, check if the stream is satisfied
+            if self._status & (DeviceStatus.SAMPLING | DeviceStatus.INVOKING):
+                if time.time() - self._last_event_time > self.stall_timeout:
+                    self._recover()
+
+            # poll on-device performance at a low rate
+            if self._stat_interval and self._status & DeviceStatus.READY \
+                    and time.time() - self._last_stat_time >= self._stat_interval:
+                self._last_stat_time = time.time()
+                self._fetch_stat()
             
      
 
+    @property
+    def stall_timeout(self) -> float:
+        """
+        Seconds without events after which a stream is stalled.
+
+        It is stall_factor times the expected frame interval, its EWMA mean
+        plus twice its deviation, once enough frames were seen, the fixed
+        timeout before.
+        """
+        if self._intervals.count < self._stall_warmup:
+            return self._timeout
+        expected = self._intervals.mean + 2 * self._intervals.deviation
+        return max(self._stall_min, self._stall_factor * expected)
+
+    def _recover(self):
+        """Restarts a stalled stream, escalating while it stays stalled."""
+        if self._stall_start is None:
+            self._stall_start = self._last_frame_time or self._last_event_time
+            self._stalls.inc()
+        action = self.RECOVERY_ACTIONS[self._stall_level]
+        self._stall_level = min(self._stall_level + 1, len(self.RECOVERY_ACTIONS) - 1)
+        sampling = self._status & DeviceStatus.SAMPLING
+        _LOGGER.debug("Device {} {} stalled, {}".format(
+            self.info.id, EVENT_SAMPLE if sampling else EVENT_INVOKE, action))
+
+        if action == "reset":
+            # on_connect restarts the stream
+            self.Reset()
+            return
+        if action == "restart":
+            self._restarts.inc()
+            self.Break()
+        if sampling:
+            self._resamples.inc()
+            self.Sample(self._sample)
+        else:
+            self._reinvokes.inc()
+            self.Invoke(self._invoke, self._fliter, self._show)
+
+    def _frame_received(self):
+        """Learns the frame interval, and the end of a stall."""
+        now = time.time()
+        if self._stall_start is not None:
+            self._recovery_time.observe(now - self._stall_start)
+            self._stall_start = None
+        elif self._last_frame_time is not None:
+            self._intervals.observe(now - self._last_frame_time)
+        self._stall_level = 0
+        self._last_frame_time = now
+
+    @property
+    def paced(self) -> bool:
+        """Whether a continuous invoke is paced by the host."""
+        return self._pacing
+
+    def _grant(self, filter, show):
+        """
+        Grants the device a finite number of frames with AT+INVOKE.
+
+        A new AT+INVOKE replaces the count of the running one, so the grant
+        is the number of frames the device may still send.
+        """
+        count = 1 if self._target_fps else self._credits
+        with self._pace_condition:
+            self._outstanding = count
+        response = self._client.set(CMD_AT_INVOKE, '{},{},{}'.format(
+            count, 1 if filter else 0, 0 if show else 1))
+        if response is not None and response["code"] == CMD_OK:
+            self._grants.inc()
+        return response
+
+    def _start_pacing(self):
+        with self._pace_condition:
+            self._pace_generation += 1
+            self._pacing = True
+            generation = self._pace_generation
+        Thread(target=self._pace, args=(generation,), daemon=True).start()
+
+    def _stop_pacing(self):
+        with self._pace_condition:
+            self._pace_generation += 1
+            self._pacing = False
+            self._pace_condition.notify_all()
+
+    def _consume_credit(self):
+        """Returns the credit of a frame once on_monitor is done with it."""
+        with self._pace_condition:
+            self._outstanding = max(0, self._outstanding - 1)
+            self._pace_condition.notify_all()
+        # the device waits for the host from now on, it is not stalled
+        self._last_event_time = time.time()
+
+    def _pace(self, generation):
+        """
+        Grants frames as the host consumes them.
+
+        With credits, the device is granted credits frames again once half of
+        them were consumed, so the stream stays continuous while at most
+        credits frames wait for a slow host. With target_fps, one frame is
+        granted every 1 / target_fps, once the previous one was consumed.
+        """
+        period = 1.0 / self._target_fps if self._target_fps else 0
+        low = 0 if period else self._credits // 2
+        next_grant = time.monotonic() + period
+        while True:
+            with self._pace_condition:
+                while True:
+                    if self._pace_generation != generation:
+                        return
+                    if self._outstanding > low:
+                        self._pace_condition.wait()
+                        continue
+                    delay = next_grant - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._pace_condition.wait(delay)
+            next_grant = max(next_grant + period, time.monotonic())
+
+            response = self._grant(self._fliter, self._show)
+            if response is None:
+                # the watchdog restarts a stream that stopped
+                _LOGGER.debug("Device {} grant timeout".format(self.info.id))
+            elif response["code"] != CMD_OK:
+                _LOGGER.debug("Device {} invoke error: {}".format(self.info.id, CMD_ERROR_STRINGS[response["code"]]))
+                self.Reset()
+                return
+
     def is_alive(self):
         """Return True if the device is ready."""
         return self._daemon_thread is not None and self._daemon_thread.is_alive()
@@ -126,18 +332,28 @@ class Device:
         if self._status & DeviceStatus.READY:
             return
 
+        self._stopped = False
         if hasattr(self._client, "loop_start"):
             self._client.loop_start()
         
+        self._deamon = True
         self._daemon_thread = Thread(target=self.daemon)
         self._daemon_thread.start()
 
+        ready = getattr(self._client, "ready", None)
+        if ready is not None and not ready.done():
+            # the client connects in the background, initialize once it is up
+            # and off its network thread, which delivers the responses
+            ready.add_done_callback(lambda _: Thread(target=self.initialize, daemon=True).start())
+            return
+
         self.initialize()
 
     def loop_stop(self):
         """Stop the device loop. """
         
         self._status = DeviceStatus.UNKNOWN
+        self._stopped = True
         
         if self._timer is not None:
             self._timer.cancel()
@@ -162,20 +378,24 @@ class Device:
         
         self._info = None
 
-        self._info = self._fetch_info()
+        self._update("info", self._fetch_info())
         if self._info is None:
             self._status = DeviceStatus.UNKNOWN
-            self._timer = Timer(self._heartbeat, self.initialize)
-            self._timer.start()
+            # retry until the loop is stopped, with or without loop_start
+            if not self._stopped:
+                self._timer = Timer(self._heartbeat, self.initialize)
+                self._timer.start()
             return
         
         self._last_alive_time = time.time()
         self._timer = None
+        if self._binary_images:
+            self._client.negotiate_binary()
         self._client.on_event = self._event_process
         self._client.on_log = self._log_process
-        self._wifi = self._fetch_wifi()
-        self._mqtt = self._fetch_mqtt()
-        self._model = self._fetch_model()
+        self._update("wifi", self._fetch_wifi())
+        self._update("mqtt", self._fetch_mqtt())
+        self._update("model", self._fetch_model())
     
 
         self._status |= DeviceStatus.READY
@@ -206,9 +426,34 @@ class Device:
         """Set the on_disconnect callback."""
         self._on_disconnect = value
 
+    @property
+    def on_change(self):
+        """
+        Return the on_change callback.
+
+        It is called as on_change(device, name, changes) when a fetch returns
+        a different info than the previous fetch, name being "info", "wifi",
+        "mqtt" or "model" and changes the {field: (previous value, value)}
+        returned by Info.diff. The first fetch of each info is not reported.
+        """
+        return self._on_change
+
+    @on_change.setter
+    def on_change(self, value):
+        """Set the on_change callback."""
+        self._on_change = value
+
     @property
     def on_monitor(self):
-        """Return the on_monitor callback."""
+        """
+        Return the on_monitor callback.
+
+        It is called with the device and the event data. When the event
+        carries an image, "image" holds the annotated JPEG base64 encoded
+        and "raw_image" the JPEG sent by the device as it was received: the
+        JPEG bytes of a binary frame, a base64 str otherwise. With
+        image_scale, "image" is 1/image_scale of the size of "raw_image".
+        """
         return self._on_monitor
 
     @on_monitor.setter
@@ -226,6 +471,33 @@ class Device:
         """Set the on_log callback."""
         self._on_log = value
 
+    @property
+    def tracer(self):
+        """Return the Tracer of the event pipeline."""
+        return self._tracer
+
+    @tracer.setter
+    def tracer(self, value):
+        """Set the Tracer of the event pipeline, shared with the client."""
+        self._tracer = value
+        if hasattr(self._client, "tracer"):
+            self._client.tracer = value
+
+    @property
+    def publisher(self):
+        """Return the FramePublisher of the decoded frames."""
+        return self._publisher
+
+    @publisher.setter
+    def publisher(self, value):
+        """
+        Set the FramePublisher every frame with an image is written to, None to stop.
+
+        Frames are decoded once for the publisher and on_monitor, at
+        1/image_scale of their size, with their results scaled alike.
+        """
+        self._publisher = value
+
     @property
     def status(self) -> int:
         """Return the status of the device."""
@@ -251,8 +523,7 @@ class Device:
         if self._info is not None and not skip_cache:
             return self._info
         
-        self._info = self._fetch_info()
-        return self._info
+        return self._update("info", self._fetch_info())
 
     @property
     @check_status(DeviceStatus.READY)
@@ -264,8 +535,7 @@ class Device:
         if self._wifi is not None and not skip_cache and not self._wifi_changed and (self._status & DeviceStatus.WIFI_CONNECTED or self._wifi.SSID == ""):
             return self._wifi
 
-        self._wifi = self._fetch_wifi()
-        return self._wifi
+        return self._update("wifi", self._fetch_wifi())
 
     @property
     @check_status(DeviceStatus.READY)
@@ -277,8 +547,7 @@ class Device:
         if self._mqtt is not None and not skip_cache and not self._mqtt_changed and (self._status & DeviceStatus.MQTT_CONNECTED or self._status & DeviceStatus.WIFI_CONNECTTING):
             return self._mqtt
 
-        self._mqtt = self._fetch_mqtt()
-        return self._mqtt
+        return self._update("mqtt", self._fetch_mqtt())
 
     @property
     @check_status(DeviceStatus.READY)
@@ -287,12 +556,57 @@ class Device:
         if self._model is not None and not skip_cache:
             return self._model
 
-        self._model = self._fetch_model()
+        return self._update("model", self._fetch_model())
 
-        return self._model
+    def stats(self) -> Dict:
+        """
+        Returns the runtime metrics of the device.
+
+        Returns:
+        - stats: event counters and rate, daemon recoveries, stalls and their
+          recovery time histogram, the learnt frame interval and stall timeout,
+          the invoke grants and frames still granted when paced,
+          the on_monitor execution time histogram and the client metrics
+          under "client".
+        """
+        stats = {
+            "id": self._info.id if self._info is not None else hex(id(self)),
+            "frames": self._frames.value,
+            "fps": self._frame_rate.rate(),
+            "reinvokes": self._reinvokes.value,
+            "resamples": self._resamples.value,
+            "resets": self._resets.value,
+            "restarts": self._restarts.value,
+            "stalls": self._stalls.value,
+            "recovery": self._recovery_time.snapshot(),
+            "frame_interval": self._intervals.mean,
+            "stall_timeout": self.stall_timeout,
+            "grants": self._grants.value,
+            "outstanding": self._outstanding,
+            "callback": self._callback_time.snapshot(),
+            "perf": self._perf.mean(),
+        }
+        if hasattr(self._client, "stats"):
+            stats["client"] = self._client.stats()
+        return stats
+
+    def perf(self, since: Optional[float] = None):
+        """
+        Returns the on-device performance samples, oldest first.
+
+        Every sample holds the wall clock "time" it was recorded at, its
+        "source" ("event" or "stat") and the fields reported by the device
+        among preprocess, inference and postprocess times in milliseconds
+        and load.
+
+        Args:
+        - since: only return samples recorded after this wall clock time.
+        """
+        return self._perf.samples(since)
 
     def Break(self) -> None:
         """Break the device."""
+        self._stop_pacing()
         self._client.execute(CMD_AT_BREAK)
         self._status &= ~DeviceStatus.SAMPLING
         self._status &= ~DeviceStatus.INVOKING
@@ -300,6 +614,7 @@ class Device:
     def Reset(self) -> None:
         """Reset the device."""
         _LOGGER.info("Reset device {}".format(self.info.id))
+        self._resets.inc()
         if self._on_disconnect is not None:
             self._on_disconnect(self)
         self._status = DeviceStatus.UNKNOWN
@@ -325,6 +640,9 @@ class Device:
         """
         
         self._last_event_time = time.time()
+        # the first frame of a new stream tells nothing of its interval
+        self._last_frame_time = None
+        self._stop_pacing()
         
         response = self._client.set(CMD_AT_SAMPLE, '{}'.format(value))
         
@@ -359,15 +677,25 @@ class Device:
     def Invoke(self, value, filter=False, show=True):
         """
         Sets the invoke of the device.
+
+        A continuous invoke (-1) is paced by the host when the device was
+        created with credits or target_fps, see _pace.
         """
         
         self._last_event_time = time.time()
+        # the first frame of a new stream tells nothing of its interval
+        self._last_frame_time = None
         
         # if invoke is changed, fetch model again
-        self._model = self._fetch_model()
-            
-        response = self._client.set(CMD_AT_INVOKE, '{},{},{}'.format(
-            value, 1 if filter else 0, 0 if show else 1))
+        self._update("model", self._fetch_model())
+
+        paced = value == -1 and bool(self._credits or self._target_fps)
+        self._stop_pacing()
+        if paced:
+            response = self._grant(filter, show)
+        else:
+            response = self._client.set(CMD_AT_INVOKE, '{},{},{}'.format(
+                value, 1 if filter else 0, 0 if show else 1))
         
         if response is None:
             return None
@@ -379,6 +707,8 @@ class Device:
             if value != 0:
                 self._status |= DeviceStatus.INVOKING
                 self._status &= ~DeviceStatus.SAMPLING
+            if paced:
+                self._start_pacing()
         else:
             _LOGGER.debug("Device {} invoke error: {}".format(self.info.id, CMD_ERROR_STRINGS[response["code"]]))
             self.Reset()
@@ -470,6 +800,21 @@ class Device:
         else:
             return None
 
+    def _update(self, name, value):
+        """Store a fetched info and report its changes to on_change."""
+        setattr(self, "_" + name, value)
+        if value is None:
+            return value
+        previous = self._known.get(name)
+        self._known[name] = value
+        if previous is None:
+            # the first fetch is the reference, not a change
+            return value
+        changes = value.diff(previous)
+        if changes and self._on_change is not None:
+            self._on_change(self, name, changes)
+        return value
+
     def _fetch_info(self) -> DeviceInfo:
         """Fetch device info from the device."""
         id = self._client.get(CMD_AT_ID)
@@ -521,6 +866,29 @@ class Device:
             self._mqtt_changed = False
             return self._mqtt if self._mqtt else MQTTInfo(None)
 
+    def _parse_perf(self, data) -> Dict:
+        """Extract on-device timings and load from INVOKE or STAT data."""
+        sample = {}
+        perf = data.get("perf")
+        if isinstance(perf, (list, tuple)):
+            sample.update(zip(self.PERF_FIELDS, perf))
+        elif isinstance(perf, dict):
+            sample.update({k: v for k, v in perf.items() if k in self.PERF_FIELDS})
+        for field in self.PERF_FIELDS + ("load",):
+            if isinstance(data.get(field), (int, float)):
+                sample[field] = data[field]
+        return sample
+
+    def _fetch_stat(self) -> Optional[Dict]:
+        """Poll AT+STAT and record the reported performance."""
+        response = self._client.get(CMD_AT_STATS)
+        if response is None or response["code"] != CMD_OK or not isinstance(response["data"], dict):
+            return None
+        sample = self._parse_perf(response["data"])
+        if sample:
+            self._perf.append(dict(sample, source="stat"))
+        return response["data"]
+
     def _fetch_model(self) -> ModelInfo:
         """Fetch model info from the device."""
         response = self._client.get(CMD_AT_INFO)
@@ -543,6 +911,7 @@ class Device:
         image: The image to draw the classes on.
         classes: The classes to draw.
         """
+        from PIL import Image, ImageDraw, ImageFont
 
         if image.mode != "RGBA":
             image = image.convert("RGBA")
@@ -589,6 +958,7 @@ class Device:
         image: The image to draw the boxes on.
         boxes: The boxes to draw.
         """
+        from PIL import Image, ImageDraw, ImageFont
 
         if image.mode != "RGBA":
             image = image.convert("RGBA")
@@ -643,6 +1013,8 @@ class Device:
         image: The image to draw the keypoints on.
         keypoints: The keypoints to draw.
         """
+        from PIL import ImageDraw
+
         draw = ImageDraw.Draw(image)
 
         for point in keypoints:
@@ -653,10 +1025,48 @@ class Device:
 
         return image
 
+    @staticmethod
+    def _scale_results(data, x_factor, y_factor):
+        """Return the event data with boxes and keypoints scaled down to a reduced image."""
+        if x_factor == 1 and y_factor == 1:
+            return data
+        data = dict(data)
+        if "boxes" in data:
+            data["boxes"] = [[x / x_factor, y / y_factor, w / x_factor, h / y_factor, *rest]
+                             for x, y, w, h, *rest in data["boxes"]]
+        if "keypoints" in data:
+            data["keypoints"] = [[x / x_factor, y / y_factor, *rest] for x, y, *rest in data["keypoints"]]
+        return data
+
+    def _decode_image(self, data):
+        """
+        Decodes the image of an event at 1/image_scale of its size.
+
+        Returns:
+        - (jpeg, image, data): the JPEG bytes, the BGR array and the event
+          data with its results scaled to the array.
+
+        Raises:
+        - ValueError: the image can not be decoded.
+        """
+        from sscma.utils import codec
+
+        jpeg = data["image"]
+        if not isinstance(jpeg, (bytes, bytearray)):
+            jpeg = base64.b64decode(jpeg)
+        image = codec.decode(jpeg, self._image_scale)
+        size = codec.jpeg_size(jpeg)
+        if size is not None and self._image_scale != 1:
+            data = self._scale_results(data, size[0] / image.shape[1], size[1] / image.shape[0])
+        return jpeg, image, data
+
     def _event_process(self, event):
         """Process an event."""
+        credit = False
         try:
             self._last_alive_time = time.time()
+            self._frames.inc()
+            self._frame_rate.mark()
 
             if EVENT_INVOKE in event["name"]:
 
@@ -666,8 +1076,14 @@ class Device:
                 if self._invoke == 0:
                     self._status &= ~DeviceStatus.INVOKING
                 
+                # a paced frame is consumed once on_monitor returned
+                credit = self._pacing
+
                 if event["code"] == CMD_OK:
                     self._last_event_time = time.time()
+                    self._frame_received()
+                    if "perf" in event["data"]:
+                        self._perf.append(dict(self._parse_perf(event["data"]), source="event"))
                 else:
                     _LOGGER.debug("Device {} invoke error: {}".format(self.info.id, CMD_ERROR_STRINGS[event["code"]]))
                     self.Reset()
@@ -683,11 +1099,28 @@ class Device:
                 
                 if event["code"] == CMD_OK:
                     self._last_event_time = time.time()
+                    self._frame_received()
                 else:
                     _LOGGER.debug("Device {} sample error: {}".format(self.info.id, CMD_ERROR_STRINGS[event["code"]]))
                     self.Reset()
   
 
+            tracer = self._tracer
+            # the frame bus and on_monitor share a single decode
+            decoded = None
+            if self._publisher is not None and event["code"] == CMD_OK and event["data"].get("image"):
+                if tracer is not None:
+                    start = tracer.clock()
+                try:
+                    decoded = self._decode_image(event["data"])
+                    _, frame, data = decoded
+                    self._publisher.publish(frame, data.get("boxes", ()), data.get("keypoints", ()),
+                                            data.get("classes", ()))
+                except ValueError as ex:
+                    _LOGGER.debug("Device {} publish error: {}".format(self.info.id, ex))
+                if tracer is not None and decoded is not None:
+                    tracer.record(STAGE_DECODE, start)
+
             if self._on_monitor is not None:
 
                 reply = event["data"]
@@ -695,20 +1128,58 @@ class Device:
                 #draw image
                 if "image" in event["data"] and event["data"]["image"]:
 
-                    ImageFile.LOAD_TRUNCATED_IMAGES = True
-                    image = Image.open(io.BytesIO(
-                        base64.b64decode(event["data"]["image"])))
-
-                    if "classes" in event["data"]:
+                    if tracer is not None:
+                        start = tracer.clock()
+
+                    # PIL is only needed by the callers of on_monitor
+                    from PIL import Image, ImageFile
+
+                    # binary frames carry the JPEG bytes, passed on as they are,
+                    # JSON frames base64
+                    raw_image = event["data"]["image"]
+
+                    if decoded is not None:
+                        # already decoded for the frame bus, BGR to RGB
+                        _, frame, data = decoded
+                        image = Image.fromarray(frame[:, :, ::-1])
+                    else:
+                        if isinstance(raw_image, (bytes, bytearray)):
+                            jpeg = raw_image
+                        else:
+                            jpeg = base64.b64decode(raw_image)
+                        ImageFile.LOAD_TRUNCATED_IMAGES = True
+                        image = Image.open(io.BytesIO(jpeg))
+                        data = event["data"]
+                    if decoded is None and self._image_scale != 1:
+                        # decode fewer DCT coefficients, box coordinates follow
+                        width, height = image.size
+                        scale = self._image_scale
+                        image.draft("RGB", ((width + scale - 1) // scale, (height + scale - 1) // scale))
+                        data = self._scale_results(data, width / image.size[0], height / image.size[1])
+
+                    if tracer is not None and decoded is None:
+                        # decoding is lazy, force it to time it apart from drawing
+                        image.load()
+                        tracer.record(STAGE_DECODE, start)
+                        start = tracer.clock()
+
+                    if "classes" in data:
                         image = self._draw_classes(
-                            image, event["data"]["classes"])
+                            image, data["classes"])
 
-                    if "boxes" in event["data"]:
-                        image = self._draw_boxes(image, event["data"]["boxes"])
+                    if "boxes" in data:
+                        image = self._draw_boxes(image, data["boxes"])
 
-                    if "points" in event["data"]:
+                    if "points" in data:
                         image = self._draw_keypoints(
-                            image, event["data"]["keypoints"])
+                            image, data["keypoints"])
+
+                    if tracer is not None:
+                        tracer.record(STAGE_ANNOTATE, start)
+                        start = tracer.clock()
+
+                    # keep the JPEG sent by the device untouched
+                    reply["raw_image"] = raw_image
 
                     # reconvert image to base64
                     buf = io.BytesIO()
@@ -717,13 +1188,25 @@ class Device:
                         buf.getvalue()).decode('utf-8')
                     reply["image"] = base64_image
 
+                    if tracer is not None:
+                        tracer.record(STAGE_ENCODE, start)
+
+                start = time.perf_counter()
                 self._on_monitor(self, reply)
+                end = time.perf_counter()
+                self._callback_time.observe(end - start)
+                if tracer is not None:
+                    tracer.record(STAGE_CALLBACK, start, end)
 
                 return
 
         except Exception as ex:
             _LOGGER.debug("Device {} event error: {}".format(self.info.id, ex))
 
+        finally:
+            if credit:
+                self._consume_credit()
+
         return
 
     def _log_process(self, log):
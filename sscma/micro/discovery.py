@@ -0,0 +1,240 @@
+"""Discovery of SSCMA devices on serial ports.
+
+Every candidate port is opened and probed with AT+ID?, AT+NAME? and AT+VER?
+at once, under a single deadline, so the time of a discovery is the time of
+the slowest port rather than the sum of all of them. USB ports are cached by
+VID, PID and serial number, a device already seen is not probed again, even
+when its port name changed.
+"""
+
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, List, Optional  # noqa: F401
+
+from .const import CMD_AT_ID, CMD_AT_NAME, CMD_AT_VERSION
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DiscoveredDevice:
+    """
+    A device answering on a serial port.
+
+    Attributes:
+    - id: ID reported by AT+ID?.
+    - name: name reported by AT+NAME?.
+    - port: port device the device answers on.
+    - version: dict reported by AT+VER?, with at_api, software and hardware.
+    - vid: USB vendor ID of the port, None for other ports.
+    - pid: USB product ID of the port, None for other ports.
+    - serial_number: USB serial number of the port, None if unknown.
+    """
+
+    def __init__(self, id, name, port, version=None, vid=None, pid=None, serial_number=None):
+        self.id = id
+        self.name = name
+        self.port = port
+        self.version = version or {}
+        self.vid = vid
+        self.pid = pid
+        self.serial_number = serial_number
+
+    def __repr__(self):
+        return "DiscoveredDevice(id={}, name={}, port={}, version={})".format(
+            self.id,
+            self.name,
+            self.port,
+            self.version
+        )
+
+    @property
+    def software(self) -> Optional[str]:
+        """Software version if available."""
+        return self.version.get("software")
+
+    @property
+    def hardware(self) -> Optional[str]:
+        """Hardware version if available."""
+        return self.version.get("hardware")
+
+    def to_dict(self) -> Dict:
+        """Return the attributes as a JSON serializable dict."""
+        return dict(self.__dict__)
+
+    @staticmethod
+    def from_dict(data) -> "DiscoveredDevice":
+        """Build a DiscoveredDevice from the dict returned by to_dict."""
+        return DiscoveredDevice(**data)
+
+
+def _fingerprint(port):
+    """Return the cache key of a port, None if the port can not be told apart."""
+    if getattr(port, "vid", None) is None or not getattr(port, "serial_number", None):
+        return None
+    return "{:04x}:{:04x}:{}".format(port.vid, port.pid, port.serial_number)
+
+
+class Discovery:
+    """
+    Finds the SSCMA devices connected to serial ports.
+
+    Example:
+
+        discovery = Discovery()
+        devices = discovery.discover()
+        client = SerialClient(devices["2a7b3c"].port)
+    """
+
+    def __init__(self, baudrate=921600, timeout=0.5, workers=None, cache=None):
+        """
+        Initializes the Discovery class.
+
+        Args:
+        - baudrate: baudrate of the probes.
+        - timeout: seconds a port has to answer every probe.
+        - workers: maximum number of ports probed at once, defaults to all.
+        - cache: path of a JSON file keeping the cache between processes,
+          None keeps it in memory only.
+        """
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.workers = workers
+        self.cache = os.path.expanduser(cache) if cache is not None else None
+
+        self._cache: Dict[str, DiscoveredDevice] = {}
+        self._lock = Lock()
+        if self.cache is not None and os.path.isfile(self.cache):
+            try:
+                with open(self.cache, "r") as f:
+                    self._cache = {key: DiscoveredDevice.from_dict(value) for key, value in json.load(f).items()}
+            except (OSError, ValueError, TypeError) as ex:
+                _LOGGER.warning("Discovery cache {} ignored: {}".format(cache, ex))
+
+    def clear(self):
+        """Forget every cached device."""
+        with self._lock:
+            self._cache.clear()
+        self._save()
+
+    def _save(self):
+        if self.cache is None:
+            return
+        with self._lock:
+            data = {key: device.to_dict() for key, device in self._cache.items()}
+        directory = os.path.dirname(os.path.abspath(self.cache))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.cache, "w") as f:
+            json.dump(data, f, indent=2)
+
+    def probe(self, port) -> Optional[DiscoveredDevice]:
+        """
+        Asks a port which device it is.
+
+        Args:
+        - port: port device, or a ListPortInfo as returned by comports().
+
+        Returns:
+        - device: the DiscoveredDevice, None if the port does not answer in time.
+        """
+        from .client import SerialClient
+
+        device = getattr(port, "device", port)
+        deadline = time.monotonic() + self.timeout
+        try:
+            client = SerialClient(device, self.baudrate)
+        except Exception as ex:
+            _LOGGER.debug("probe {} failed: {}".format(device, ex))
+            return None
+        # a single try, the deadline is shared by the commands
+        client._try_count = 1
+        try:
+            client.loop_start()
+            answers = []
+            for command in (CMD_AT_ID, CMD_AT_NAME, CMD_AT_VERSION):
+                remaining = deadline - time.monotonic()
+                response = client.get(command, timeout=remaining) if remaining > 0 else None
+                if response is None or response.get("data") in (None, ""):
+                    _LOGGER.debug("probe {} no answer to {}".format(device, command))
+                    return None
+                answers.append(response["data"])
+        except Exception as ex:
+            _LOGGER.debug("probe {} failed: {}".format(device, ex))
+            return None
+        finally:
+            client.loop_stop()
+            client.disconnect()
+
+        id, name, version = answers
+        return DiscoveredDevice(str(id), name, device, version if isinstance(version, dict) else {},
+                                getattr(port, "vid", None), getattr(port, "pid", None),
+                                getattr(port, "serial_number", None))
+
+    def discover(self, ports=None, refresh=False) -> Dict[str, DiscoveredDevice]:
+        """
+        Probes ports concurrently.
+
+        Args:
+        - ports: port devices or ListPortInfo to probe, defaults to every
+          serial port of the system.
+        - refresh: probe cached devices again.
+
+        Returns:
+        - devices: DiscoveredDevice by device ID.
+        """
+        if ports is None:
+            from serial.tools.list_ports import comports
+            ports = sorted(comports(), key=lambda port: port.device)
+
+        found: List[DiscoveredDevice] = []
+        pending = []
+        for port in ports:
+            key = _fingerprint(port)
+            with self._lock:
+                cached = self._cache.get(key) if key is not None and not refresh else None
+            if cached is not None:
+                # the port name of a USB device may change between plugs
+                cached.port = port.device
+                found.append(cached)
+            else:
+                pending.append(port)
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.workers or len(pending)) as executor:
+                probed = list(executor.map(self.probe, pending))
+            with self._lock:
+                for port, device in zip(pending, probed):
+                    key = _fingerprint(port)
+                    if key is not None:
+                        if device is not None:
+                            self._cache[key] = device
+                        else:
+                            self._cache.pop(key, None)
+            found.extend(device for device in probed if device is not None)
+            self._save()
+
+        devices: Dict[str, DiscoveredDevice] = {}
+        for device in found:
+            if device.id in devices:
+                _LOGGER.warning("Device {} answers on {} and {}".format(device.id, devices[device.id].port, device.port))
+                continue
+            devices[device.id] = device
+        return devices
+
+
+def discover(ports=None, baudrate=921600, timeout=0.5) -> Dict[str, DiscoveredDevice]:
+    """
+    Probes ports concurrently, without cache.
+
+    Args:
+    - ports: port devices to probe, defaults to every serial port of the system.
+    - baudrate: baudrate of the probes.
+    - timeout: seconds a port has to answer every probe.
+
+    Returns:
+    - devices: DiscoveredDevice by device ID.
+    """
+    return Discovery(baudrate, timeout).discover(ports)
@@ -0,0 +1,388 @@
+"""Shared-memory frame bus for consumers running in other processes.
+
+A FramePublisher writes decoded frames and their results into a ring of
+slots in a `multiprocessing.shared_memory` block, FrameSubscriber attach to
+it by name and read NumPy views of the slots without copying them.
+
+Every slot is guarded by two sequence numbers, written before and after its
+content, like a seqlock: a reader checks them around its reads and knows a
+frame it read was overwritten meanwhile. The publisher never waits for the
+readers, a reader lapped by the publisher skips to the oldest frame still in
+the ring and counts the frames it missed.
+"""
+
+import time
+import struct
+import logging
+from typing import Optional  # noqa: F401
+
+_LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"SSCMAFB1"
+
+# magic, slots, width, height, max_results, slot_size
+_HEADER = struct.Struct("<8sIIIIQ")
+_HEADER_SIZE = 64
+# latest published sequence, 0 before the first frame
+_WRITE_SEQ = 40
+
+# begin, end, timestamp, width, height, boxes, keypoints, classes
+_SLOT = struct.Struct("<QQdIIIII")
+_SLOT_HEADER_SIZE = 64
+
+# x, y, w, h, score, target
+BOX_FIELDS = 6
+# x, y, score, target
+KEYPOINT_FIELDS = 4
+# score, target
+CLASS_FIELDS = 2
+
+
+def _align(size, alignment=64):
+    return (size + alignment - 1) // alignment * alignment
+
+
+def _layout(width, height, max_results):
+    """Return the offsets of the image and result arrays in a slot, and the slot size."""
+    image = _SLOT_HEADER_SIZE
+    boxes = image + _align(width * height * 3)
+    keypoints = boxes + _align(max_results * BOX_FIELDS * 4)
+    classes = keypoints + _align(max_results * KEYPOINT_FIELDS * 4)
+    return image, boxes, keypoints, classes, classes + _align(max_results * CLASS_FIELDS * 4)
+
+
+def _attach(name):
+    """Attach an existing block without letting this process unlink it on exit."""
+    from multiprocessing import shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before Python 3.13 every attached block is registered for cleanup
+        memory = shared_memory.SharedMemory(name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(memory._name, "shared_memory")
+        except Exception:
+            pass
+        return memory
+
+
+class _Ring:
+    """Views of the header and the slots of a frame bus block."""
+
+    def __init__(self, memory, slots, width, height, max_results):
+        import numpy as np
+
+        self.memory = memory
+        self.slots = slots
+        self.width = width
+        self.height = height
+        self.max_results = max_results
+        image, boxes, keypoints, classes, self.slot_size = _layout(width, height, max_results)
+
+        buf = memory.buf
+        self.images, self.boxes, self.keypoints, self.classes = [], [], [], []
+        for index in range(slots):
+            base = _HEADER_SIZE + index * self.slot_size
+            self.images.append(np.ndarray((width * height * 3,), np.uint8, buf, base + image))
+            self.boxes.append(np.ndarray((max_results, BOX_FIELDS), np.float32, buf, base + boxes))
+            self.keypoints.append(np.ndarray((max_results, KEYPOINT_FIELDS), np.float32, buf, base + keypoints))
+            self.classes.append(np.ndarray((max_results, CLASS_FIELDS), np.float32, buf, base + classes))
+
+    def slot_offset(self, index):
+        return _HEADER_SIZE + index * self.slot_size
+
+    def write_seq(self):
+        return struct.unpack_from("<Q", self.memory.buf, _WRITE_SEQ)[0]
+
+    def release(self):
+        self.images = self.boxes = self.keypoints = self.classes = []
+
+
+class Frame:
+    """
+    A frame read from the bus.
+
+    The arrays are views of the shared memory, valid until the publisher
+    writes the slot again: check `valid()` after using them, or `copy()` the
+    frame first.
+
+    Attributes:
+    - seq: sequence number of the frame, starting at 1.
+    - timestamp: time.time() when the frame was published.
+    - image: BGR uint8 array of shape (height, width, 3).
+    - boxes: float32 array of shape (n, 6), x, y, w, h, score, target.
+    - keypoints: float32 array of shape (n, 4), x, y, score, target.
+    - classes: float32 array of shape (n, 2), score, target.
+    """
+
+    def __init__(self, seq, timestamp, image, boxes, keypoints, classes, check=None):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.image = image
+        self.boxes = boxes
+        self.keypoints = keypoints
+        self.classes = classes
+        self._check = check
+
+    def __repr__(self):
+        return "Frame(seq={}, shape={}, boxes={})".format(
+            self.seq,
+            self.image.shape,
+            len(self.boxes)
+        )
+
+    def valid(self) -> bool:
+        """Tells whether the views still hold this frame."""
+        return self._check is None or self._check(self.seq)
+
+    def copy(self) -> "Frame":
+        """Return a copy of the frame, independent of the shared memory."""
+        return Frame(self.seq, self.timestamp, self.image.copy(), self.boxes.copy(),
+                     self.keypoints.copy(), self.classes.copy())
+
+
+class FramePublisher:
+    """
+    Publishes frames into a shared-memory ring.
+
+    Example:
+
+        publisher = FramePublisher("camera0", width=640, height=480)
+        device.publisher = publisher
+    """
+
+    def __init__(self, name=None, slots=8, width=640, height=480, max_results=64):
+        """
+        Initializes the FramePublisher class, creating the shared memory block.
+
+        Args:
+        - name: name subscribers attach to, a random one when None.
+        - slots: frames kept in the ring, a reader more than slots frames
+          behind skips frames.
+        - width: largest image width.
+        - height: largest image height.
+        - max_results: largest number of boxes, keypoints or classes per frame.
+        """
+        from multiprocessing import shared_memory
+
+        size = _HEADER_SIZE + slots * _layout(width, height, max_results)[-1]
+        self._memory = shared_memory.SharedMemory(name, create=True, size=size)
+        self.name = self._memory.name
+        self._ring = _Ring(self._memory, slots, width, height, max_results)
+        self._seq = 0
+        self.published = 0
+        self.rejected = 0
+        struct.pack_into("<Q", self._memory.buf, _WRITE_SEQ, 0)
+        _HEADER.pack_into(self._memory.buf, 0, MAGIC, slots, width, height, max_results, self._ring.slot_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def publish(self, image, boxes=(), keypoints=(), classes=(), timestamp=None) -> int:
+        """
+        Writes a frame into the next slot, without waiting for the readers.
+
+        Args:
+        - image: BGR uint8 array of shape (height, width, 3).
+        - boxes: rows of x, y, w, h, score, target.
+        - keypoints: rows of x, y, score, target, further fields are dropped.
+        - classes: rows of score, target.
+        - timestamp: time of the frame, defaults to now.
+
+        Returns:
+        - seq: sequence number of the frame.
+
+        Raises:
+        - ValueError: the image or the results do not fit in a slot.
+        """
+        import numpy as np
+
+        ring = self._ring
+        height, width = image.shape[:2]
+        if image.ndim != 3 or image.shape[2] != 3 or width > ring.width or height > ring.height:
+            self.rejected += 1
+            raise ValueError("image of shape {} does not fit {}x{}x3".format(image.shape, ring.width, ring.height))
+        if max(len(boxes), len(keypoints), len(classes)) > ring.max_results:
+            self.rejected += 1
+            raise ValueError("more than {} results".format(ring.max_results))
+
+        seq = self._seq + 1
+        index = seq % ring.slots
+        offset = ring.slot_offset(index)
+        buf = self._memory.buf
+
+        # readers seeing begin != end know the slot is being written
+        struct.pack_into("<Q", buf, offset, seq)
+        ring.images[index][:width * height * 3].reshape(height, width, 3)[...] = image
+        for target, rows, fields in ((ring.boxes[index], boxes, BOX_FIELDS),
+                                     (ring.keypoints[index], keypoints, KEYPOINT_FIELDS),
+                                     (ring.classes[index], classes, CLASS_FIELDS)):
+            if len(rows):
+                target[:len(rows)] = np.asarray(rows, np.float32)[:, :fields]
+        _SLOT.pack_into(buf, offset, seq, 0, time.time() if timestamp is None else timestamp,
+                        width, height, len(boxes), len(keypoints), len(classes))
+        struct.pack_into("<Q", buf, offset + 8, seq)
+        struct.pack_into("<Q", buf, _WRITE_SEQ, seq)
+
+        self._seq = seq
+        self.published += 1
+        return seq
+
+    def publish_event(self, data, timestamp=None) -> Optional[int]:
+        """
+        Decodes the image of an INVOKE or SAMPLE event and publishes it with its results.
+
+        Args:
+        - data: the event data, the image being JPEG bytes or base64.
+        - timestamp: time of the frame, defaults to now.
+
+        Returns:
+        - seq: sequence number of the frame, None when the event has no image.
+        """
+        import base64
+        from sscma.utils import codec
+
+        image = data.get("image")
+        if not image:
+            return None
+        jpeg = image if isinstance(image, (bytes, bytearray)) else base64.b64decode(image)
+        return self.publish(codec.decode(jpeg), data.get("boxes", ()), data.get("keypoints", ()),
+                            data.get("classes", ()), timestamp)
+
+    def close(self):
+        """Release and remove the shared memory block, subscribers keep their mapping."""
+        if self._memory is None:
+            return
+        self._ring.release()
+        self._ring = None
+        self._memory.close()
+        try:
+            self._memory.unlink()
+        except FileNotFoundError:
+            pass
+        self._memory = None
+
+
+class FrameSubscriber:
+    """
+    Reads the frames of a FramePublisher, possibly from another process.
+
+    Example:
+
+        subscriber = FrameSubscriber("camera0")
+        while True:
+            frame = subscriber.read(timeout=1)
+            if frame is not None:
+                process(frame.image, frame.boxes)
+    """
+
+    def __init__(self, name, poll_interval=0.001):
+        """
+        Initializes the FrameSubscriber class, attaching the shared memory block.
+
+        Args:
+        - name: name of the publisher.
+        - poll_interval: seconds between checks for a new frame.
+
+        Raises:
+        - FileNotFoundError: no publisher with this name.
+        - ValueError: the block is not a frame bus.
+        """
+        self.name = name
+        self.poll_interval = poll_interval
+        self._memory = _attach(name)
+        magic, slots, width, height, max_results, slot_size = _HEADER.unpack_from(self._memory.buf, 0)
+        if magic != MAGIC:
+            self._memory.close()
+            raise ValueError("{} is not a frame bus".format(name))
+        self._ring = _Ring(self._memory, slots, width, height, max_results)
+        # new subscribers start with the next frame
+        self._next = self._ring.write_seq() + 1
+        self.received = 0
+        self.skipped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        """Number of frames published and not read yet."""
+        return max(0, self._ring.write_seq() - self._next + 1)
+
+    def _check(self, seq):
+        offset = self._ring.slot_offset(seq % self._ring.slots)
+        return struct.unpack_from("<Q", self._memory.buf, offset)[0] == seq
+
+    def _frame(self, seq):
+        """Return the views of a frame, None if its slot was written meanwhile."""
+        ring = self._ring
+        index = seq % ring.slots
+        offset = ring.slot_offset(index)
+        _, end, timestamp, width, height, boxes, keypoints, classes = _SLOT.unpack_from(self._memory.buf, offset)
+        if end != seq:
+            return None
+        frame = Frame(seq, timestamp, ring.images[index][:width * height * 3].reshape(height, width, 3),
+                      ring.boxes[index][:boxes], ring.keypoints[index][:keypoints],
+                      ring.classes[index][:classes], self._check)
+        return frame if frame.valid() else None
+
+    def read(self, timeout=None) -> Optional[Frame]:
+        """
+        Returns the next frame, skipping the ones already overwritten.
+
+        Args:
+        - timeout: seconds to wait for a frame, None waits forever, 0 does
+          not wait.
+
+        Returns:
+        - frame: the Frame, None on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            latest = self._ring.write_seq()
+            if latest >= self._next:
+                oldest = latest - self._ring.slots + 1
+                if self._next < oldest:
+                    # lapped by the publisher
+                    self.skipped += oldest - self._next
+                    self._next = oldest
+                frame = self._frame(self._next)
+                self._next += 1
+                if frame is not None:
+                    self.received += 1
+                    return frame
+                self.skipped += 1
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def latest(self) -> Optional[Frame]:
+        """Returns the newest frame, skipping every older one, None if no frame is pending."""
+        latest = self._ring.write_seq()
+        if latest < self._next:
+            return None
+        self.skipped += latest - self._next
+        self._next = latest
+        return self.read(0)
+
+    def close(self):
+        """Detach the shared memory block."""
+        if self._memory is None:
+            return
+        self._ring.release()
+        self._ring = None
+        try:
+            self._memory.close()
+        except BufferError:
+            # frames still hold views, the mapping goes with them
+            _LOGGER.debug("frame bus {} closed with frames in use".format(self.name))
+        self._memory = None
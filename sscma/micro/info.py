@@ -1,7 +1,90 @@
-from typing import Optional
+from types import MappingProxyType
+from typing import Dict, Optional, Tuple  # noqa: F401
 
 
-class DeviceInfo:
+def _freeze(value):
+    """Returns a copy of value with its dicts made read-only views."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_freeze(item) for item in value]
+    return value
+
+
+def _hashable(value):
+    if isinstance(value, MappingProxyType):
+        return frozenset((key, _hashable(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(item) for item in value)
+    return value
+
+
+class Info:
+    """
+    Immutable snapshot of a reply of the device.
+
+    The reply is parsed once: every field listed in FIELDS, by its path of
+    keys in the reply, is stored in a slot. Missing keys give None and dicts
+    are stored as read-only mappings. Infos with equal fields are equal and
+    hash alike.
+
+    Attributes:
+    - data: the reply as received.
+    """
+
+    FIELDS: Dict[str, Tuple[str, ...]] = {}
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        object.__setattr__(self, "data", data)
+        for name, path in self.FIELDS.items():
+            value = data
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            object.__setattr__(self, name, _freeze(value))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.FIELDS)
+
+    def __hash__(self):
+        return hash((type(self),) + tuple(_hashable(getattr(self, name)) for name in self.FIELDS))
+
+    @property
+    def raw(self):
+        """Raw data as returned by the device."""
+        return self.data
+
+    def __reduce__(self):
+        return type(self), (self.data,)
+
+    def diff(self, other) -> Dict[str, Tuple]:
+        """
+        Returns the fields that changed from other to this info.
+
+        Args:
+        - other: the previous info of the same type, None if there was none.
+
+        Returns:
+        - changes: {field: (previous value, value)}, empty if nothing changed.
+        """
+        changes = {}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            previous = getattr(other, name) if other is not None else None
+            if value != previous:
+                changes[name] = (previous, value)
+        return changes
+
+
+class DeviceInfo(Info):
     """
     {
         "id": "1",
@@ -13,10 +96,27 @@ class DeviceInfo:
             "hardware": "1"
         }
     }
+
+    Attributes:
+    - id: ID if available.
+    - name: Name if available.
+    - token: Token if available.
+    - version: Version if available.
+    - at_api: AT API version if available.
+    - software: Software version if available.
+    - hardware: Hardware version if available.
     """
 
-    def __init__(self, data):
-        self.data = data
+    FIELDS = {
+        "id": ("id",),
+        "name": ("name",),
+        "token": ("token",),
+        "version": ("version",),
+        "at_api": ("version", "at_api"),
+        "software": ("version", "software"),
+        "hardware": ("version", "hardware"),
+    }
+    __slots__ = tuple(FIELDS)
 
     def __repr__(self):
         return "DeviceInfo(id={}, name={}, token={}, version={})".format(
@@ -35,50 +135,30 @@ class DeviceInfo:
             "version": version,
         }
 
-    @property
-    def id(self) -> Optional[str]:
-        """ID if available."""
-        return self.data.get("id")
-
-    @property
-    def token(self) -> Optional[str]:
-        """Token if available."""
-        return self.data.get("token")
-
-    @property
-    def version(self) -> Optional[str]:
-        """Version if available."""
-        return self.data.get("version")
-
-    @property
-    def at_api(self) -> Optional[str]:
-        """AT API version if available."""
-        return self.version.get("at_api")
-
-    @property
-    def software(self) -> Optional[str]:
-        """Software version if available."""
-        return self.version.get("software")
-
-    @property
-    def hardware(self) -> Optional[str]:
-        """Hardware version if available."""
-        return self.version.get("hardware")
-
-    @property
-    def name(self) -> Optional[str]:
-        """Name if available."""
-        return self.data.get("name")
-
 
-from typing import Dict, Optional
-
-
-class ModelInfo:
+class ModelInfo(Info):
     """
     Represents information about a model.
+
+    Attributes:
+        uuid: The UUID of the model, or None if not available.
+        name: The name of the model, or None if not available.
+        version: The version of the model, or None if not available.
+        catagory: The category of the model, or None if not available.
+        model_type: The model type, or None if not available.
+        algoritm: The algorithm of the model, or None if not available.
+        description: The description of the model, or None if not available.
+        image: The image of the model, or None if not available.
+        author: The author of the model, or None if not available.
+        token: The token of the model, or None if not available.
+        classes: The classes of the model, or None if not available.
     """
 
+    FIELDS = {name: (name,) for name in (
+        "uuid", "name", "version", "catagory", "model_type", "algoritm",
+        "description", "image", "author", "token", "classes")}
+    __slots__ = tuple(FIELDS)
+
     def __init__(self, data):
         """
         Initializes a ModelInfo instance.
@@ -103,7 +183,7 @@ class ModelInfo:
                 "classes": "",
             }
 
-        self.data = data
+        super().__init__(data)
 
     def __repr__(self):
         """
@@ -117,129 +197,8 @@ class ModelInfo:
             self.version
         )
 
-    @property
-    def uuid(self) -> Optional[str]:
-        """
-        Returns the UUID of the model if available.
-
-        Returns:
-            str or None: The UUID of the model, or None if not available.
-        """
-        return self.data.get("uuid")
-
-    @property
-    def name(self) -> Optional[str]:
-        """
-        Returns the name of the model if available.
-
-        Returns:
-            str or None: The name of the model, or None if not available.
-        """
-        return self.data.get("name")
-
-    @property
-    def version(self) -> Optional[str]:
-        """
-        Returns the version of the model if available.
-
-        Returns:
-            str or None: The version of the model, or None if not available.
-        """
-        return self.data.get("version")
-
-    @property
-    def catagory(self) -> Optional[str]:
-        """
-        Returns the category of the model if available.
 
-        Returns:
-            str or None: The category of the model, or None if not available.
-        """
-        return self.data.get("catagory")
-
-    @property
-    def model_type(self) -> Optional[str]:
-        """
-        Returns the model type if available.
-
-        Returns:
-            str or None: The model type, or None if not available.
-        """
-        return self.data.get("model_type")
-
-    @property
-    def algoritm(self) -> Optional[str]:
-        """
-        Returns the algorithm of the model if available.
-
-        Returns:
-            str or None: The algorithm of the model, or None if not available.
-        """
-        return self.data.get("algoritm")
-
-    @property
-    def description(self) -> Optional[str]:
-        """
-        Returns the description of the model if available.
-
-        Returns:
-            str or None: The description of the model, or None if not available.
-        """
-        return self.data.get("description")
-
-    @property
-    def image(self) -> Optional[str]:
-        """
-        Returns the image of the model if available.
-
-        Returns:
-            str or None: The image of the model, or None if not available.
-        """
-        return self.data.get("image")
-
-    @property
-    def author(self) -> Optional[str]:
-        """
-        Returns the author of the model if available.
-
-        Returns:
-            str or None: The author of the model, or None if not available.
-        """
-        return self.data.get("author")
-
-    @property
-    def token(self) -> Optional[str]:
-        """
-        Returns the token of the model if available.
-
-        Returns:
-            str or None: The token of the model, or None if not available.
-        """
-        return self.data.get("token")
-
-    @property
-    def classes(self) -> Optional[str]:
-        """
-        Returns the classes of the model if available.
-
-        Returns:
-            str or None: The classes of the model, or None if not available.
-        """
-        return self.data.get("classes")
-
-    @property
-    def raw(self) -> Dict:
-        """
-        Returns the raw data of the model.
-
-        Returns:
-            dict: The raw data of the model.
-        """
-        return self.data
-
-from typing import Dict, Optional
-
-class MQTTInfo:
+class MQTTInfo(Info):
     """
     {
         "mqttserver": {
@@ -252,10 +211,32 @@ class MQTTInfo:
             }
         }
     }
+
+    Attributes:
+    - mqttserver: MQTT server information if available.
+    - mqttpubsub: MQTT pubsub information if available.
+    - server: MQTT server configuration if available.
+    - pubsub: MQTT pubsub configuration if available.
+    - address, port, username, password, use_ssl: MQTT server settings if available.
+    - pub_topic, pub_qos, sub_topic, sub_qos: MQTT topics and QoS if available.
     """
 
-    def __init__(self, data):
-        self.data = data
+    FIELDS = {
+        "mqttserver": ("mqttserver",),
+        "mqttpubsub": ("mqttpubsub",),
+        "server": ("mqttserver", "config"),
+        "pubsub": ("mqttpubsub", "config"),
+        "address": ("mqttserver", "config", "address"),
+        "port": ("mqttserver", "config", "port"),
+        "username": ("mqttserver", "config", "username"),
+        "password": ("mqttserver", "config", "password"),
+        "use_ssl": ("mqttserver", "config", "use_ssl"),
+        "pub_topic": ("mqttpubsub", "config", "pub_topic"),
+        "pub_qos": ("mqttpubsub", "config", "pub_qos"),
+        "sub_topic": ("mqttpubsub", "config", "sub_topic"),
+        "sub_qos": ("mqttpubsub", "config", "sub_qos"),
+    }
+    __slots__ = tuple(FIELDS)
 
     def __repr__(self):
         return "MQTTInfo(mqttserver={}, mqttpubsub={})".format(
@@ -270,91 +251,36 @@ class MQTTInfo:
             "mqttpubsub": mqttpubsub,
         }
 
-    @property
-    def mqttserver(self) -> Optional[Dict]:
-        """MQTT server information if available."""
-        return self.data.get("mqttserver")
-
-    @property
-    def mqttpubsub(self) -> Optional[Dict]:
-        """MQTT pubsub information if available."""
-        return self.data.get("mqttpubsub")
-
-    @property
-    def server(self) -> Optional[Dict]:
-        """MQTT server configuration if available."""
-        return self.mqttserver.get("config")
-
-    @property
-    def pubsub(self) -> Optional[Dict]:
-        """MQTT pubsub configuration if available."""
-        return self.mqttpubsub.get("config")
-
-    @property
-    def address(self) -> Optional[str]:
-        """MQTT server address if available."""
-        return self.server.get("address")
-
-    @property
-    def port(self) -> Optional[int]:
-        """MQTT server port if available."""
-        return self.server.get("port")
-
-    @property
-    def username(self) -> Optional[str]:
-        """MQTT server username if available."""
-        return self.server.get("username")
-
-    @property
-    def password(self) -> Optional[str]:
-        """MQTT server password if available."""
-        return self.server.get("password")
-
-    @property
-    def use_ssl(self) -> Optional[int]:
-        """MQTT server use_ssl if available."""
-        return self.server.get("use_ssl")
-
-    @property
-    def pub_topic(self) -> Optional[str]:
-        """MQTT pub_topic if available."""
-        return self.pubsub.get("pub_topic")
-
-    @property
-    def pub_qos(self) -> Optional[int]:
-        """MQTT pub_qos if available."""
-        return self.pubsub.get("pub_qos")
-
-    @property
-    def sub_topic(self) -> Optional[str]:
-        """MQTT sub_topic if available."""
-        return self.pubsub.get("sub_topic")
-
-    @property
-    def sub_qos(self) -> Optional[int]:
-        """MQTT sub_qos if available."""
-        return self.pubsub.get("sub_qos")
-
-    @property
-    def raw(self):
-        """Raw data as returned by the device."""
-        return self.data
-
-from typing import Dict, Optional
 
+class WiFiInfo(Info):
+    """
+    {
+        "status": 0, 
+        "in4_info": {"ip": "0.0.0.0", "netmask": "0.0.0.0", "gateway": "0.0.0.0"}, 
+        "in6_info": {"ip": ":::::::", "prefix": ":::::::", "gateway": ":::::::"}, 
+        "config": {"name_type": 0, "name": "xxxxxx", "security": 0, "password": "*******"}
+    }
 
-class WiFiInfo:
+    Attributes:
+    - status: Status if available.
+    - IPv4: IPv4 information if available.
+    - IPv6: IPv6 information if available.
+    - config: Configuration if available.
+    - SSID: SSID if available.
+    - password: Password if available.
+    - encryption: Encryption if available.
+    """
 
-    def __init__(self, data):
-        """
-        {
-            "status": 0, 
-            "in4_info": {"ip": "0.0.0.0", "netmask": "0.0.0.0", "gateway": "0.0.0.0"}, 
-            "in6_info": {"ip": ":::::::", "prefix": ":::::::", "gateway": ":::::::"}, 
-            "config": {"name_type": 0, "name": "xxxxxx", "security": 0, "password": "*******"}
-        }
-        """
-        self.data = data
+    FIELDS = {
+        "status": ("status",),
+        "IPv4": ("in4_info",),
+        "IPv6": ("in6_info",),
+        "config": ("config",),
+        "SSID": ("config", "name"),
+        "password": ("config", "password"),
+        "encryption": ("config", "security"),
+    }
+    __slots__ = tuple(FIELDS)
 
     def __repr__(self):
         return "WiFiInfo(status={}, IPv4={}, IPv6={}, config={})".format(
@@ -363,43 +289,3 @@ class WiFiInfo:
             self.IPv6,
             self.config
         )
-
-    @property
-    def status(self) -> Optional[int]:
-        """Status if available."""
-        return self.data.get("status")
-
-    @property
-    def IPv4(self) -> Optional[Dict]:
-        """IPv4 information if available."""
-        return self.data.get("in4_info")
-
-    @property
-    def IPv6(self) -> Optional[Dict]:
-        """IPv6 information if available."""
-        return self.data.get("in6_info")
-
-    @property
-    def config(self) -> Optional[Dict]:
-        """Configuration if available."""
-        return self.data.get("config")
-
-    @property
-    def SSID(self) -> Optional[str]:
-        """SSID if available."""
-        return self.config.get("name")
-
-    @property
-    def password(self) -> Optional[str]:
-        """Password if available."""
-        return self.config.get("password")
-
-    @property
-    def encryption(self) -> Optional[int]:
-        """Encryption if available."""
-        return self.config.get("security")
-
-    @property
-    def raw(self):
-        """Raw data as returned by the device."""
-        return self.data
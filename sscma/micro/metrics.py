@@ -0,0 +1,483 @@
+"""Runtime metrics of clients and devices.
+
+Counters, histograms and rate meters are cheap enough to be updated from the
+receive thread for every chunk and frame. `Client.stats()` and
+`Device.stats()` return plain dict snapshots of them.
+"""
+
+import time
+import bisect
+import weakref
+from collections import deque
+from threading import Lock
+from typing import Dict, Optional, Tuple  # noqa: F401
+
+# seconds, suited to command round-trips and per-frame callbacks
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                                      0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# every Device of the process, used to aggregate metrics for exporters
+DEVICES = weakref.WeakSet()
+
+
+def percentile(values, q) -> float:
+    """
+    Returns the q-th percentile of values using linear interpolation.
+
+    Args:
+    - values: sequence of numbers.
+    - q: percentile between 0 and 100.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100.0
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+class Counter:
+    """A monotonically increasing counter."""
+
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0
+        self._lock = Lock()
+
+    def inc(self, value=1):
+        """Increment the counter by value."""
+        with self._lock:
+            self._value += value
+
+    @property
+    def value(self):
+        """Return the current value."""
+        return self._value
+
+
+class Histogram:
+    """
+    A histogram of observed values with fixed upper bounds.
+
+    Attributes:
+    - buckets: upper bounds of the buckets, the last bucket is +Inf.
+    """
+
+    __slots__ = ("buckets", "_counts", "_sum", "_count", "_lock")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = Lock()
+
+    def observe(self, value):
+        """Record a single value."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self):
+        """Return the number of observed values."""
+        return self._count
+
+    @property
+    def sum(self):
+        """Return the sum of observed values."""
+        return self._sum
+
+    def snapshot(self) -> Dict:
+        """
+        Returns the histogram as a dict.
+
+        Returns:
+        - snapshot: count, sum, mean and cumulative (upper bound, count) buckets.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative, buckets = 0, []
+        for bound, value in zip(self.buckets + (float("inf"),), counts):
+            cumulative += value
+            buckets.append((bound, cumulative))
+        return {
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else 0.0,
+            "buckets": buckets,
+        }
+
+
+class Meter:
+    """
+    Measures the rate of events over a sliding window.
+
+    Events are aggregated into one second slots so marking is O(1) whatever
+    the event rate.
+    """
+
+    __slots__ = ("_window", "_slots", "_start", "_lock")
+
+    def __init__(self, window=10):
+        """
+        Initializes the Meter class.
+
+        Args:
+        - window: length of the sliding window in seconds.
+        """
+        self._window = window
+        self._slots = deque()  # [second, count]
+        self._start = time.monotonic()
+        self._lock = Lock()
+
+    def mark(self, value=1):
+        """Record value events now."""
+        second = int(time.monotonic())
+        with self._lock:
+            if self._slots and self._slots[-1][0] == second:
+                self._slots[-1][1] += value
+            else:
+                self._slots.append([second, value])
+                while self._slots[0][0] <= second - self._window:
+                    self._slots.popleft()
+
+    def rate(self) -> float:
+        """Return the events per second over the window."""
+        now = time.monotonic()
+        with self._lock:
+            total = sum(count for second, count in self._slots if second > now - self._window)
+        elapsed = min(self._window, now - self._start)
+        return total / elapsed if elapsed > 0 else 0.0
+
+
+class Ewma:
+    """
+    Exponentially weighted moving mean and variance of a series.
+
+    Used to learn the interval between the frames of a device, recent
+    samples weigh more so the estimate follows rate changes.
+    """
+
+    __slots__ = ("alpha", "count", "_mean", "_variance", "_lock")
+
+    def __init__(self, alpha=0.1):
+        """
+        Initializes the Ewma class.
+
+        Args:
+        - alpha: weight of a new sample, between 0 and 1.
+        """
+        self.alpha = alpha
+        self.count = 0
+        self._mean = 0.0
+        self._variance = 0.0
+        self._lock = Lock()
+
+    def observe(self, value):
+        """Add a sample."""
+        with self._lock:
+            if self.count == 0:
+                self._mean = value
+            else:
+                diff = value - self._mean
+                increment = self.alpha * diff
+                self._mean += increment
+                self._variance = (1 - self.alpha) * (self._variance + diff * increment)
+            self.count += 1
+
+    @property
+    def mean(self) -> float:
+        """Return the weighted mean."""
+        return self._mean
+
+    @property
+    def deviation(self) -> float:
+        """Return the weighted standard deviation."""
+        return self._variance ** 0.5
+
+
+class TimeSeries:
+    """
+    A fixed-size ring buffer of timestamped samples.
+
+    Every sample is a dict of numeric fields with a "time" key holding the
+    wall clock time it was recorded at.
+    """
+
+    __slots__ = ("_samples",)
+
+    def __init__(self, capacity=512):
+        """
+        Initializes the TimeSeries class.
+
+        Args:
+        - capacity: number of samples kept, older ones are discarded.
+        """
+        self._samples = deque(maxlen=capacity)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def append(self, sample: Dict, timestamp: Optional[float] = None):
+        """
+        Records a sample.
+
+        Args:
+        - sample: dict of numeric fields.
+        - timestamp: wall clock time of the sample, defaults to now.
+        """
+        self._samples.append(dict(sample, time=time.time() if timestamp is None else timestamp))
+
+    def samples(self, since: Optional[float] = None):
+        """
+        Returns the kept samples, oldest first.
+
+        Args:
+        - since: only return samples recorded after this wall clock time.
+        """
+        samples = list(self._samples)
+        if since is not None:
+            samples = [sample for sample in samples if sample["time"] > since]
+        return samples
+
+    def latest(self) -> Optional[Dict]:
+        """Return the most recent sample."""
+        try:
+            return self._samples[-1]
+        except IndexError:
+            return None
+
+    def mean(self, since: Optional[float] = None) -> Dict[str, float]:
+        """
+        Averages every numeric field over the samples.
+
+        Args:
+        - since: only average samples recorded after this wall clock time.
+        """
+        totals, counts = {}, {}
+        for sample in self.samples(since):
+            for key, value in sample.items():
+                if key == "time" or not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                totals[key] = totals.get(key, 0.0) + value
+                counts[key] = counts.get(key, 0) + 1
+        return {key: totals[key] / counts[key] for key in totals}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels):
+    return "{" + ",".join('{}="{}"'.format(k, _escape(v)) for k, v in labels.items()) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family:
+    """Samples of one metric in the Prometheus text format."""
+
+    def __init__(self, name, type, help):
+        self.name = name
+        self.type = type
+        self.help = help
+        self.lines = []
+
+    def add(self, labels, value):
+        self.lines.append("{}{} {}".format(self.name, _labels(labels), _format_value(value)))
+
+    def add_histogram(self, labels, snapshot):
+        for bound, count in snapshot["buckets"]:
+            self.lines.append("{}_bucket{} {}".format(
+                self.name, _labels(dict(labels, le=_format_value(bound))), count))
+        self.lines.append("{}_sum{} {}".format(self.name, _labels(labels), _format_value(snapshot["sum"])))
+        self.lines.append("{}_count{} {}".format(self.name, _labels(labels), snapshot["count"]))
+
+    def render(self):
+        return ["# HELP {} {}".format(self.name, self.help),
+                "# TYPE {} {}".format(self.name, self.type)] + self.lines
+
+
+def render_prometheus(devices=None) -> str:
+    """
+    Renders the metrics of devices in the Prometheus text format.
+
+    Device series are labelled by device. Client series are rendered once
+    per client, labelled by client, and the MQTT connection series once per
+    connection, so devices sharing them are not counted twice.
+
+    Args:
+    - devices: devices to render, defaults to every Device of the process.
+
+    Returns:
+    - text: the exposition text.
+    """
+    families = {}
+    clients = {}
+
+    def family(name, type, help):
+        if name not in families:
+            families[name] = _Family(name, type, help)
+        return families[name]
+
+    for device in list(DEVICES if devices is None else devices):
+        stats = device.stats()
+        labels = {"device": stats["id"]}
+
+        family("sscma_device_frames_total", "counter",
+               "Events received from the device.").add(labels, stats["frames"])
+        family("sscma_device_frame_rate", "gauge",
+               "Events per second over the last seconds.").add(labels, stats["fps"])
+        family("sscma_device_reinvokes_total", "counter",
+               "Invoke restarts issued by the daemon.").add(labels, stats["reinvokes"])
+        family("sscma_device_resamples_total", "counter",
+               "Sample restarts issued by the daemon.").add(labels, stats["resamples"])
+        family("sscma_device_resets_total", "counter",
+               "Device resets.").add(labels, stats["resets"])
+        family("sscma_device_restarts_total", "counter",
+               "Streams stopped and started again by the daemon.").add(labels, stats["restarts"])
+        family("sscma_device_stalls_total", "counter",
+               "Streams found stalled by the daemon.").add(labels, stats["stalls"])
+        family("sscma_device_recovery_seconds", "histogram",
+               "Time from the last frame before a stall to the next one.").add_histogram(labels, stats["recovery"])
+        family("sscma_device_stall_timeout_seconds", "gauge",
+               "Time without events after which a stream is stalled.").add(labels, stats["stall_timeout"])
+        family("sscma_device_invoke_grants_total", "counter",
+               "AT+INVOKE grants of a host-paced stream.").add(labels, stats["grants"])
+        family("sscma_device_invoke_outstanding", "gauge",
+               "Frames granted but not consumed yet.").add(labels, stats["outstanding"])
+        family("sscma_device_callback_seconds", "histogram",
+               "Execution time of the on_monitor callback.").add_histogram(labels, stats["callback"])
+        perf = family("sscma_device_perf", "gauge",
+                      "Mean on-device timings in milliseconds and load reported by the device.")
+        for field, value in sorted(stats["perf"].items()):
+            perf.add(dict(labels, field=field), value)
+
+        client = stats.get("client")
+        if client is not None:
+            clients.setdefault(client["name"], client)
+
+    connections = {}
+    for name, client in clients.items():
+        labels = {"client": name}
+        family("sscma_client_received_bytes_total", "counter",
+               "Bytes received from the transport.").add(labels, client["bytes_received"])
+        family("sscma_client_receive_rate_bytes", "gauge",
+               "Bytes per second over the last seconds.").add(labels, client["byte_rate"])
+        family("sscma_client_frames_total", "counter",
+               "Frames extracted from the stream.").add(labels, client["frames"])
+        family("sscma_client_parse_failures_total", "counter",
+               "Frames which failed to decode.").add(labels, client["parse_failures"])
+        family("sscma_client_buffer_resyncs_total", "counter",
+               "Times unframed bytes were discarded.").add(labels, client["buffer_resyncs"])
+        family("sscma_client_command_retries_total", "counter",
+               "Command retries.").add(labels, client["retries"])
+        family("sscma_client_command_timeouts_total", "counter",
+               "Commands without response.").add(labels, client["timeouts"])
+        latency = family("sscma_client_command_seconds", "histogram",
+                         "Command round-trip time by command.")
+        for command, snapshot in sorted(client["commands"].items()):
+            latency.add_histogram(dict(labels, command=command), snapshot)
+        if "mqtt" in client:
+            connections.setdefault(client["mqtt"]["connection"], client["mqtt"])
+
+    for name, mqtt in connections.items():
+        labels = {"connection": name}
+        family("sscma_mqtt_connected", "gauge",
+               "Whether the broker connection is up.").add(labels, int(mqtt["connected"]))
+        family("sscma_mqtt_connects_total", "counter",
+               "Connections to the broker.").add(labels, mqtt["connects"])
+        family("sscma_mqtt_disconnects_total", "counter",
+               "Disconnections from the broker.").add(labels, mqtt["disconnects"])
+        family("sscma_mqtt_reconnect_attempt", "gauge",
+               "Reconnects tried since the last connection.").add(labels, mqtt["reconnect_attempt"])
+        family("sscma_mqtt_queue_length", "gauge",
+               "Commands kept while the broker is unreachable.").add(labels, mqtt["queue_length"])
+        family("sscma_mqtt_queued_total", "counter",
+               "Commands kept while the broker was unreachable.").add(labels, mqtt["queued"])
+        family("sscma_mqtt_queue_dropped_total", "counter",
+               "Kept commands dropped from a full queue.").add(labels, mqtt["queue_dropped"])
+        family("sscma_mqtt_queue_expired_total", "counter",
+               "Kept commands older than the queue ttl on reconnect.").add(labels, mqtt["queue_expired"])
+        family("sscma_mqtt_reconnect_seconds", "histogram",
+               "Time from a disconnection to the next connection.").add_histogram(labels, mqtt["reconnect_time"])
+        family("sscma_mqtt_resubscribe_seconds", "histogram",
+               "Time to subscribe again on connection.").add_histogram(labels, mqtt["resubscribe_time"])
+        family("sscma_mqtt_drain_seconds", "histogram",
+               "Time to send the kept commands on connection.").add_histogram(labels, mqtt["drain_time"])
+
+    lines = []
+    for f in families.values():
+        lines.extend(f.render())
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusExporter:
+    """
+    Serves the metrics of every Device of the process over HTTP.
+
+    The exporter runs the standard library HTTP server in a daemon thread.
+    """
+
+    def __init__(self, port=9464, host="0.0.0.0", devices=None):
+        """
+        Initializes the PrometheusExporter class.
+
+        Args:
+        - port: port to listen on, 0 selects a free port.
+        - host: address to listen on.
+        - devices: devices to export, defaults to every Device of the process.
+        """
+        self.host = host
+        self.port = port
+        self._devices = devices
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Start serving /metrics."""
+        from threading import Thread
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = render_prometheus(exporter._devices).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving."""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
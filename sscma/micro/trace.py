@@ -0,0 +1,220 @@
+"""Stage-level latency tracing of the event pipeline.
+
+A `Tracer` attached to a `Client` or a `Device` timestamps every stage a
+frame goes through: reception on the transport, frame extraction, JSON
+decoding, image decoding, annotation, re-encoding and the user callback.
+Finished frames are handed to a sink. Without a tracer the pipeline only pays
+for an attribute check per stage.
+"""
+
+import os
+import json
+import time
+import itertools
+import threading
+from collections import deque
+from typing import Dict, List, Optional  # noqa: F401
+
+# stage names, in pipeline order
+STAGE_RECEIVE = "receive"
+STAGE_EXTRACT = "extract"
+STAGE_JSON = "json"
+STAGE_DISPATCH = "dispatch"
+STAGE_DECODE = "decode"
+STAGE_ANNOTATE = "annotate"
+STAGE_ENCODE = "encode"
+STAGE_CALLBACK = "callback"
+
+
+class FrameTrace:
+    """
+    The stages of a single frame.
+
+    Attributes:
+    - seq: sequence number of the frame.
+    - name: frame name, e.g. INVOKE, once decoded.
+    - thread: id of the thread which processed the frame.
+    - stages: list of (stage, start, end) tuples in perf_counter seconds.
+    """
+
+    __slots__ = ("seq", "name", "thread", "stages")
+
+    def __init__(self, seq, thread):
+        self.seq = seq
+        self.name = None
+        self.thread = thread
+        self.stages = []
+
+    def __repr__(self):
+        return "FrameTrace(seq={}, name={}, stages={})".format(
+            self.seq, self.name, [(s, round((e - b) * 1e3, 3)) for s, b, e in self.stages])
+
+    def durations(self) -> Dict[str, float]:
+        """Return the seconds spent per stage."""
+        result = {}
+        for stage, start, end in self.stages:
+            result[stage] = result.get(stage, 0.0) + end - start
+        return result
+
+
+class Tracer:
+    """
+    Collects per frame stage timestamps and hands finished frames to a sink.
+
+    A frame is bound to the thread processing it, so stages recorded by the
+    Device while the Client dispatches an event land in the same frame.
+    """
+
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, sink):
+        """
+        Initializes the Tracer class.
+
+        Args:
+        - sink: object with a `write(frame)` method receiving finished FrameTrace.
+        """
+        self.sink = sink
+        self._seq = itertools.count()
+        self._local = threading.local()
+
+    @property
+    def current(self) -> Optional[FrameTrace]:
+        """Return the frame being traced on this thread."""
+        return getattr(self._local, "frame", None)
+
+    def begin(self) -> FrameTrace:
+        """Start tracing a new frame on this thread."""
+        frame = FrameTrace(next(self._seq), threading.get_ident())
+        self._local.frame = frame
+        return frame
+
+    def end(self):
+        """Finish the frame of this thread and hand it to the sink."""
+        frame = self.current
+        if frame is None:
+            return
+        self._local.frame = None
+        if frame.stages:
+            self.sink.write(frame)
+
+    def record(self, stage, start, end=None):
+        """
+        Records a stage of the current frame.
+
+        A frame is started if none is being traced, and finished right away.
+
+        Args:
+        - stage: stage name.
+        - start: perf_counter timestamp of the stage start.
+        - end: perf_counter timestamp of the stage end, defaults to now.
+        """
+        if end is None:
+            end = self.clock()
+        frame = self.current
+        if frame is None:
+            frame = FrameTrace(next(self._seq), threading.get_ident())
+            frame.stages.append((stage, start, end))
+            self.sink.write(frame)
+            return
+        frame.stages.append((stage, start, end))
+
+    def name(self, name):
+        """Set the name of the current frame."""
+        frame = self.current
+        if frame is not None:
+            frame.name = name
+
+
+class RingBufferSink:
+    """Keeps the last traced frames in memory."""
+
+    def __init__(self, capacity=1024):
+        """
+        Initializes the RingBufferSink class.
+
+        Args:
+        - capacity: number of frames kept.
+        """
+        self._frames = deque(maxlen=capacity)
+
+    def write(self, frame):
+        self._frames.append(frame)
+
+    def frames(self) -> List[FrameTrace]:
+        """Return the kept frames, oldest first."""
+        return list(self._frames)
+
+    def clear(self):
+        self._frames.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        Aggregates the kept frames per stage.
+
+        Returns:
+        - summary: count, mean, p50, p99 and max in seconds per stage.
+        """
+        samples = {}
+        for frame in list(self._frames):
+            for stage, duration in frame.durations().items():
+                samples.setdefault(stage, []).append(duration)
+        result = {}
+        for stage, values in samples.items():
+            values.sort()
+            result[stage] = {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": values[int((len(values) - 1) * 0.50)],
+                "p99": values[int((len(values) - 1) * 0.99)],
+                "max": values[-1],
+            }
+        return result
+
+
+class ChromeTraceSink:
+    """
+    Writes frames as Chrome trace events, viewable in chrome://tracing or Perfetto.
+
+    Events are streamed to the file as they arrive, the JSON array is closed
+    by `close`.
+    """
+
+    def __init__(self, path):
+        """
+        Initializes the ChromeTraceSink class.
+
+        Args:
+        - path: the trace file to write.
+        """
+        self._file = open(path, "w")
+        self._file.write("[")
+        self._first = True
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _event(self, name, start, end, tid, args):
+        return json.dumps({"name": name, "ph": "X", "pid": self._pid, "tid": tid,
+                           "ts": start * 1e6, "dur": (end - start) * 1e6, "args": args})
+
+    def write(self, frame):
+        args = {"seq": frame.seq, "name": frame.name}
+        start = min(s for _, s, _ in frame.stages)
+        end = max(e for _, _, e in frame.stages)
+        events = [self._event(frame.name or "frame", start, end, frame.thread, args)]
+        events += [self._event(stage, s, e, frame.thread, args) for stage, s, e in frame.stages]
+        with self._lock:
+            if self._file is None:
+                return
+            for event in events:
+                self._file.write(event if self._first else ",\n" + event)
+                self._first = False
+
+    def close(self):
+        """Terminate the JSON array and close the file."""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write("]\n")
+            self._file.close()
+            self._file = None
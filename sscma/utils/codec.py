@@ -0,0 +1,362 @@
+"""JPEG decoding and encoding with the fastest backend available.
+
+The backends are tried in order: PyTurboJPEG, simplejpeg, OpenCV and Pillow.
+All of them decode to BGR numpy arrays, like cv2.imdecode, and can decode at
+1/2, 1/4 or 1/8 of the resolution by skipping DCT coefficients, which is
+several times faster than a full decode followed by a resize. Every backend
+releases the GIL while it decodes or encodes, so the batch helpers run on a
+thread pool.
+"""
+
+import struct
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, List, Optional  # noqa: F401
+
+_LOGGER = logging.getLogger(__name__)
+
+SCALES = (1, 2, 4, 8)
+
+
+class Codec(ABC):
+    """
+    A JPEG backend.
+
+    Attributes:
+    - name: name of the backend.
+    """
+
+    name = None
+
+    @staticmethod
+    @abstractmethod
+    def available() -> bool:
+        """Tells whether the backend can be used."""
+        pass
+
+    @abstractmethod
+    def decode(self, jpeg, scale=1):
+        """
+        Decodes a JPEG image.
+
+        Args:
+        - jpeg: the JPEG bytes.
+        - scale: 1, 2, 4 or 8, the image is decoded at 1/scale of its size.
+
+        Returns:
+        - image: BGR numpy array.
+
+        Raises:
+        - ValueError: the image can not be decoded.
+        """
+        pass
+
+    @abstractmethod
+    def encode(self, image, quality=90) -> bytes:
+        """
+        Encodes a BGR numpy array as JPEG.
+
+        Args:
+        - image: BGR numpy array.
+        - quality: JPEG quality, from 1 to 100.
+
+        Raises:
+        - ValueError: the image can not be encoded.
+        """
+        pass
+
+
+class TurboJPEGCodec(Codec):
+    """libjpeg-turbo through PyTurboJPEG."""
+
+    name = "turbojpeg"
+
+    @staticmethod
+    def available():
+        try:
+            from turbojpeg import TurboJPEG
+            TurboJPEG()
+        except Exception:
+            return False
+        return True
+
+    def __init__(self):
+        from turbojpeg import TurboJPEG
+        self._turbo = TurboJPEG()
+
+    def decode(self, jpeg, scale=1):
+        try:
+            return self._turbo.decode(bytes(jpeg), scaling_factor=(1, scale) if scale != 1 else None)
+        except Exception as ex:
+            raise ValueError("Failed to decode image") from ex
+
+    def encode(self, image, quality=90):
+        return self._turbo.encode(image, quality=quality)
+
+
+class SimpleJPEGCodec(Codec):
+    """libjpeg-turbo through simplejpeg."""
+
+    name = "simplejpeg"
+
+    @staticmethod
+    def available():
+        try:
+            import simplejpeg  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def decode(self, jpeg, scale=1):
+        import simplejpeg
+
+        # the factor is chosen from the smallest size allowed, not min_factor alone
+        size = jpeg_size(jpeg)
+        if size is None:
+            raise ValueError("Failed to decode image")
+        width, height = size
+        try:
+            return simplejpeg.decode_jpeg(bytes(jpeg), colorspace="BGR", min_factor=scale,
+                                          min_width=(width + scale - 1) // scale,
+                                          min_height=(height + scale - 1) // scale)
+        except Exception as ex:
+            raise ValueError("Failed to decode image") from ex
+
+    def encode(self, image, quality=90):
+        import numpy as np
+        import simplejpeg
+
+        return simplejpeg.encode_jpeg(np.ascontiguousarray(image), quality=quality, colorspace="BGR")
+
+
+class OpenCVCodec(Codec):
+    """OpenCV imdecode and imencode."""
+
+    name = "opencv"
+
+    @staticmethod
+    def available():
+        try:
+            import cv2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def decode(self, jpeg, scale=1):
+        import cv2
+        import numpy as np
+
+        flags = {
+            1: cv2.IMREAD_COLOR,
+            2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4,
+            8: cv2.IMREAD_REDUCED_COLOR_8,
+        }
+        data = np.frombuffer(jpeg, dtype=np.uint8)
+        image = cv2.imdecode(data, flags[scale]) if len(data) else None
+        if image is None:
+            raise ValueError("Failed to decode image")
+        return image
+
+    def encode(self, image, quality=90):
+        import cv2
+
+        ret, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ret:
+            raise ValueError("Failed to encode image")
+        return data.tobytes()
+
+
+class PillowCodec(Codec):
+    """Pillow, reduced-scale decode through Image.draft."""
+
+    name = "pillow"
+
+    @staticmethod
+    def available():
+        try:
+            import numpy  # noqa: F401
+            from PIL import Image  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def decode(self, jpeg, scale=1):
+        import io
+        import numpy as np
+        from PIL import Image
+
+        try:
+            image = Image.open(io.BytesIO(jpeg))
+            if scale != 1:
+                width, height = image.size
+                image.draft("RGB", ((width + scale - 1) // scale, (height + scale - 1) // scale))
+            image = image.convert("RGB")
+        except Exception as ex:
+            raise ValueError("Failed to decode image") from ex
+        return np.asarray(image)[:, :, ::-1].copy()
+
+    def encode(self, image, quality=90):
+        import io
+        from PIL import Image
+
+        buf = io.BytesIO()
+        Image.fromarray(image[:, :, ::-1]).save(buf, format="JPEG", quality=quality)
+        return buf.getvalue()
+
+
+BACKENDS = [TurboJPEGCodec, SimpleJPEGCodec, OpenCVCodec, PillowCodec]
+
+_codecs = {}  # type: Dict[Optional[str], Codec]
+_lock = Lock()
+
+
+def available_codecs() -> List[str]:
+    """Return the names of the usable backends, fastest first."""
+    return [backend.name for backend in BACKENDS if backend.available()]
+
+
+def get_codec(name=None) -> Codec:
+    """
+    Returns a backend, created once.
+
+    Args:
+    - name: name of the backend, defaults to the fastest one available.
+
+    Raises:
+    - ValueError: the backend is unknown or not installed.
+    """
+    codec = _codecs.get(name)
+    if codec is not None:
+        return codec
+    with _lock:
+        if name not in _codecs:
+            backends = BACKENDS if name is None else [backend for backend in BACKENDS if backend.name == name]
+            if not backends:
+                raise ValueError("Unknown codec {}, use one of {}".format(
+                    name, ", ".join(backend.name for backend in BACKENDS)))
+            for backend in backends:
+                if backend.available():
+                    _codecs[name] = backend()
+                    _LOGGER.debug("codec:{}".format(backend.name))
+                    break
+            else:
+                raise ValueError("Codec {} is not available".format(name or "of any kind"))
+        return _codecs[name]
+
+
+def _check_scale(scale):
+    if scale not in SCALES:
+        raise ValueError("scale must be one of {}".format(SCALES))
+
+
+def jpeg_size(jpeg):
+    """
+    Reads the size of a JPEG image from its header, without decoding it.
+
+    Returns:
+    - (width, height), None if the data is not a JPEG image.
+    """
+    jpeg = bytes(jpeg[:65536]) if len(jpeg) > 65536 else bytes(jpeg)
+    if jpeg[:2] != b"\xff\xd8":
+        return None
+    position = 2
+    while position + 4 <= len(jpeg):
+        if jpeg[position] != 0xFF:
+            return None
+        marker = jpeg[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        length = struct.unpack_from(">H", jpeg, position + 2)[0]
+        # start of frame markers, but DHT, JPG and DAC
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if position + 9 > len(jpeg):
+                return None
+            height, width = struct.unpack_from(">HH", jpeg, position + 5)
+            return width, height
+        position += 2 + length
+    return None
+
+
+def preview_scale(jpeg, width, height) -> int:
+    """
+    Returns the largest decode scale still sharp once fitted in width x height.
+
+    Args:
+    - jpeg: the JPEG bytes.
+    - width: width of the area the image is fitted in, keeping its aspect ratio.
+    - height: height of the area the image is fitted in.
+    """
+    size = jpeg_size(jpeg)
+    if size is None or not all(size):
+        return 1
+    fit = min(width / size[0], height / size[1])
+    return max(scale for scale in SCALES if scale == 1 or scale * fit <= 1)
+
+
+def decode(jpeg, scale=1, codec=None):
+    """
+    Decodes a JPEG image with the fastest backend.
+
+    Args:
+    - jpeg: the JPEG bytes.
+    - scale: 1, 2, 4 or 8, the image is decoded at 1/scale of its size.
+    - codec: name of the backend, defaults to the fastest one available.
+
+    Returns:
+    - image: BGR numpy array.
+    """
+    _check_scale(scale)
+    return get_codec(codec).decode(jpeg, scale)
+
+
+def encode(image, quality=90, codec=None) -> bytes:
+    """
+    Encodes a BGR numpy array as JPEG with the fastest backend.
+
+    Args:
+    - image: BGR numpy array.
+    - quality: JPEG quality, from 1 to 100.
+    - codec: name of the backend, defaults to the fastest one available.
+    """
+    return get_codec(codec).encode(image, quality)
+
+
+def decode_batch(jpegs, scale=1, codec=None, workers=None):
+    """
+    Decodes several JPEG images on a thread pool.
+
+    Args:
+    - jpegs: iterable of JPEG bytes.
+    - scale: 1, 2, 4 or 8, the images are decoded at 1/scale of their size.
+    - codec: name of the backend, defaults to the fastest one available.
+    - workers: number of threads, defaults to the ThreadPoolExecutor default.
+
+    Returns:
+    - images: list of BGR numpy arrays, in order.
+    """
+    _check_scale(scale)
+    backend = get_codec(codec)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda jpeg: backend.decode(jpeg, scale), jpegs))
+
+
+def encode_batch(images, quality=90, codec=None, workers=None):
+    """
+    Encodes several BGR numpy arrays as JPEG on a thread pool.
+
+    Args:
+    - images: iterable of BGR numpy arrays.
+    - quality: JPEG quality, from 1 to 100.
+    - codec: name of the backend, defaults to the fastest one available.
+    - workers: number of threads, defaults to the ThreadPoolExecutor default.
+
+    Returns:
+    - jpegs: list of JPEG bytes, in order.
+    """
+    backend = get_codec(codec)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda image: backend.encode(image, quality), images))
@@ -0,0 +1,170 @@
+import os
+import time
+import base64
+import logging
+from queue import Queue, Full, Empty
+from threading import Thread, Lock
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class FrameWriter:
+    """
+    Writes frames to disk from a bounded pool of background threads.
+
+    Producers never block: when the queue is full the frame is dropped and
+    counted. Written files are kept open and fsynced in batches, together with
+    their directories.
+
+    Attributes:
+    - directory: root directory of the written files.
+    - written: number of files written.
+    - dropped: number of frames dropped because the disk could not keep up.
+    - bytes: number of bytes written.
+    """
+
+    def __init__(self, directory, workers=2, queue_size=64, fsync_batch=32, fsync_interval=1.0):
+        """
+        Initializes the FrameWriter class.
+
+        Args:
+        - directory: root directory of the written files.
+        - workers: number of writer threads.
+        - queue_size: frames waiting to be written before new ones are dropped.
+        - fsync_batch: files written by a worker before they are fsynced.
+        - fsync_interval: seconds after which pending files are fsynced anyway,
+          0 disables fsync.
+        """
+        self.directory = directory
+        self.written = 0
+        self.dropped = 0
+        self.bytes = 0
+
+        self._fsync_batch = fsync_batch
+        self._fsync_interval = fsync_interval
+        self._queue = Queue(maxsize=queue_size)
+        self._lock = Lock()
+        self._running = True
+        self._threads = [Thread(target=self._worker, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, name, data) -> bool:
+        """
+        Queues bytes to be written to a file.
+
+        Args:
+        - name: file path relative to the root directory.
+        - data: the file content.
+
+        Returns:
+        - queued: False if the frame was dropped.
+        """
+        return self._put((name, data, False))
+
+    def submit_base64(self, name, data) -> bool:
+        """
+        Queues base64 encoded bytes, decoded by the writer thread.
+
+        Args:
+        - name: file path relative to the root directory.
+        - data: the base64 encoded file content.
+
+        Returns:
+        - queued: False if the frame was dropped.
+        """
+        return self._put((name, data, True))
+
+    def _put(self, item):
+        if not self._running:
+            return False
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    @property
+    def pending(self) -> int:
+        """Return the number of frames waiting to be written."""
+        return self._queue.qsize()
+
+    def close(self):
+        """Write the queued frames, fsync them and stop the workers."""
+        if not self._running:
+            return
+        self._running = False
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _sync(self, pending):
+        directories = set()
+        for fd, path in pending:
+            try:
+                if self._fsync_interval:
+                    os.fsync(fd)
+                directories.add(os.path.dirname(path))
+            except OSError as ex:
+                _LOGGER.warning("fsync {} failed:{}".format(path, ex))
+            finally:
+                os.close(fd)
+        if not self._fsync_interval or not hasattr(os, "O_DIRECTORY"):
+            return
+        for directory in directories:
+            try:
+                fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+
+    def _worker(self):
+        pending = []
+        last_sync = time.monotonic()
+        while True:
+            timeout = max(0.01, self._fsync_interval - (time.monotonic() - last_sync)) \
+                if pending and self._fsync_interval else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Empty:
+                item = ()
+
+            if item is None:
+                break
+
+            if item:
+                name, data, encoded = item
+                path = os.path.join(self.directory, name)
+                try:
+                    if encoded:
+                        data = base64.b64decode(data)
+                    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+                    try:
+                        view = memoryview(data)
+                        while view:
+                            view = view[os.write(fd, view):]
+                    except OSError:
+                        os.close(fd)
+                        raise
+                    if not pending:
+                        last_sync = time.monotonic()
+                    pending.append((fd, path))
+                    with self._lock:
+                        self.written += 1
+                        self.bytes += len(data)
+                except (OSError, ValueError) as ex:
+                    _LOGGER.warning("write {} failed:{}".format(path, ex))
+
+            if pending and (len(pending) >= self._fsync_batch or not self._fsync_interval
+                            or time.monotonic() - last_sync >= self._fsync_interval):
+                self._sync(pending)
+                pending = []
+                last_sync = time.monotonic()
+
+        self._sync(pending)
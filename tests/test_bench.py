@@ -0,0 +1,45 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from sscma.cli.bench import bench
+from sscma.emulator import DeviceEmulator
+
+
+def test_bench_replay(tmp_path):
+    emulator = DeviceEmulator(seed=1)
+    capture = tmp_path / "capture.bin"
+    # a corrupted frame in the capture is counted, not fatal
+    capture.write_bytes(b"".join(emulator.event_frame(count=i) for i in range(10)) + b"\r{broken}\n")
+    output = tmp_path / "report.json"
+
+    result = CliRunner().invoke(bench, ["-r", str(capture), "-n", "50", "-t", "10", "-o", str(output)])
+    assert result.exit_code == 0, result.output
+
+    report = json.loads(output.read_text())
+    device = report["devices"]["capture.bin"]
+    assert report["mode"] == "replay"
+    assert device["frames"] >= 50
+    assert device["parse_failures"] >= 5
+    assert device["bytes_per_second"] > 0
+    assert device["interval_ms"]["p50"] <= device["interval_ms"]["max"]
+
+
+@pytest.mark.parametrize("annotate", [False, True])
+def test_bench_emulator(tmp_path, annotate):
+    output = tmp_path / "report.json"
+
+    result = CliRunner().invoke(bench, ["-e", "1", "--emulator_fps", "50", "-n", "20", "-t", "10",
+                                        "--probe_interval", "0.1", "-o", str(output)]
+                                + (["--annotate"] if annotate else []))
+    assert result.exit_code == 0, result.output
+
+    report = json.loads(output.read_text())
+    device = report["devices"]["emulator0"]
+    assert report["mode"] == "invoke"
+    assert device["frames"] >= 20
+    assert device["image_bytes"]["p50"] > 0
+    assert device["rtt_ms"]["count"] > 0
+    assert device["timeouts"] == 0
+    assert report["cpu"]["seconds"] > 0
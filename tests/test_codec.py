@@ -0,0 +1,88 @@
+import time
+import base64
+import threading
+
+import pytest
+
+from sscma.emulator import DeviceEmulator, PtyTransport
+from sscma.micro.client import SerialClient
+from sscma.micro.device import Device
+from sscma.utils import codec
+from sscma.utils.image import image_from_base64
+
+
+@pytest.fixture(scope="module")
+def jpeg():
+    return base64.b64decode(DeviceEmulator(width=640, height=480)._image)
+
+
+@pytest.mark.parametrize("name", [backend.name for backend in codec.BACKENDS])
+def test_backends(jpeg, name):
+    if name not in codec.available_codecs():
+        pytest.skip("{} is not installed".format(name))
+    backend = codec.get_codec(name)
+    assert backend.name == name
+    for scale in codec.SCALES:
+        assert backend.decode(jpeg, scale).shape == (480 // scale, 640 // scale, 3)
+
+    image = backend.decode(jpeg)
+    encoded = backend.encode(image, quality=80)
+    assert codec.jpeg_size(encoded) == (640, 480)
+    # the colors survive a round trip, channels are not swapped
+    assert abs(int(backend.decode(encoded)[240, 320, 0]) - int(image[240, 320, 0])) < 16
+    with pytest.raises(ValueError):
+        backend.decode(b"\xff\xd8 not a jpeg")
+
+
+def test_helpers(jpeg):
+    assert codec.get_codec() is codec.get_codec()
+    assert codec.get_codec().name == codec.available_codecs()[0]
+    with pytest.raises(ValueError, match="Unknown codec"):
+        codec.get_codec("gif")
+    with pytest.raises(ValueError, match="scale"):
+        codec.decode(jpeg, 3)
+
+    assert codec.jpeg_size(jpeg) == (640, 480)
+    assert codec.jpeg_size(b"not a jpeg") is None
+    assert codec.preview_scale(jpeg, 640, 480) == 1
+    assert codec.preview_scale(jpeg, 320, 320) == 2
+    assert codec.preview_scale(jpeg, 100, 100) == 4
+    assert codec.preview_scale(jpeg, 16, 16) == 8
+
+    other = base64.b64decode(DeviceEmulator(width=320, height=240)._image)
+    images = codec.decode_batch([jpeg, other] * 4, scale=2, workers=3)
+    assert [image.shape[:2] for image in images] == [(240, 320), (120, 160)] * 4
+    assert [codec.jpeg_size(data) for data in codec.encode_batch(images, workers=3)] == [(320, 240), (160, 120)] * 4
+
+    assert image_from_base64(base64.b64encode(jpeg), scale=4).shape == (120, 160, 3)
+    with pytest.raises(ValueError):
+        image_from_base64("")
+
+
+def test_device_scale():
+    with pytest.raises(ValueError):
+        Device(image_scale=3)
+    data = {"boxes": [[100, 80, 40, 20, 90, 0]], "keypoints": [[10, 20, 90, 1]]}
+    assert Device._scale_results(data, 2, 4) == {"boxes": [[50, 20, 20, 5, 90, 0]], "keypoints": [[5, 5, 90, 1]]}
+    assert Device._scale_results(data, 1, 1) is data
+
+    emulator = DeviceEmulator(width=640, height=480, fps=20)
+    transport = PtyTransport(emulator)
+    transport.start()
+    frames = []
+    connected = threading.Event()
+    device = Device(SerialClient(transport.port), image_scale=2)
+    device.on_connect = lambda device: (connected.set(), device.Invoke(-1))
+    device.on_monitor = lambda device, msg: frames.append(msg)
+    try:
+        device.loop_start()
+        assert connected.wait(5)
+        deadline = time.monotonic() + 5
+        while not frames and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        device.loop_stop()
+        transport.stop()
+
+    assert codec.jpeg_size(base64.b64decode(frames[0]["image"])) == (320, 240)
+    assert codec.jpeg_size(base64.b64decode(frames[0]["raw_image"])) == (640, 480)
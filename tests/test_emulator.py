@@ -0,0 +1,526 @@
+import os
+import base64
+import time
+import threading
+
+import pytest
+
+from sscma.micro.client import Client, SerialClient, MQTTClient
+from sscma.micro.device import Device
+from sscma.micro.metrics import render_prometheus
+from sscma.micro.const import *
+from sscma.emulator import DeviceEmulator, MQTTBroker, PtyTransport, MQTTTransport
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def loopback():
+    emulator = DeviceEmulator(fps=0, seed=1)
+    client = Client(emulator.write)
+    emulator.on_write = client.on_recieve
+    emulator.start()
+    yield emulator, client
+    emulator.stop()
+
+
+def test_commands(loopback):
+    emulator, client = loopback
+
+    assert client.get(CMD_AT_ID)["data"] == emulator.id
+    assert client.get(CMD_AT_NAME)["data"] == emulator.name
+    assert client.get(CMD_AT_VERSION)["data"]["software"] == "v2024.01.01"
+    assert client.set(CMD_AT_TSCORE, 70)["data"] == 70
+    assert client.get(CMD_AT_TSCORE)["data"] == 70
+    assert client.set(CMD_AT_WIFI, '"ssid",0,"password"')["data"]["status"] == WIFI_JOINED
+    assert client.get(CMD_AT_MQTTPUBSUB)["data"]["config"]["pub_topic"] == "sscma/v0/emulator0/tx"
+    assert client.execute(CMD_AT_BREAK, wait_event=True)["code"] == CMD_OK
+
+
+def test_unknown_command(loopback):
+    emulator, client = loopback
+
+    response = client.get("UNKNOWN")
+    assert response["type"] == CMD_TYPE_LOG
+    assert response["code"] == CMD_EINVAL
+
+
+def test_invoke_events(loopback):
+    emulator, client = loopback
+    events = []
+    client.on_event = events.append
+
+    emulator.boxes = 2
+    assert client.set(CMD_AT_INVOKE, "5,0,0")["code"] == CMD_OK
+    assert wait_for(lambda: len(events) == 5)
+    assert not emulator.streaming
+    assert all(event["name"] == EVENT_INVOKE for event in events)
+    assert len(events[0]["data"]["boxes"]) == 2
+    assert events[0]["data"]["image"]
+
+    events.clear()
+    client.set(CMD_AT_INVOKE, "-1,0,1")
+    assert wait_for(lambda: len(events) > 10)
+    client.execute(CMD_AT_BREAK, wait_event=True)
+    assert "image" not in events[0]["data"]
+
+
+def test_initialize_retries():
+    emulator = DeviceEmulator(fps=0)
+    online = threading.Event()
+    # the device answers nothing until it is online
+    client = Client(lambda data: emulator.write(data) if online.is_set() else None, timeout=0.1)
+    emulator.on_write = client.on_recieve
+    emulator.start()
+    connected = threading.Event()
+    device = Device(client, heartbeat=0.1)
+    device.on_connect = lambda device: connected.set()
+    try:
+        # without loop_start, initialize keeps retrying like it always did
+        device.initialize()
+        assert not device.status & DeviceStatus.READY
+        online.set()
+        assert connected.wait(5)
+    finally:
+        device.loop_stop()
+        emulator.stop()
+
+    # until the loop is stopped
+    online.clear()
+    device = Device(client, heartbeat=0.1)
+    device.initialize()
+    device.loop_stop()
+    timer = device._timer
+    time.sleep(0.3)
+    assert device._timer is timer and not timer.is_alive()
+
+def test_serial_device():
+    emulator = DeviceEmulator(fps=50)
+    transport = PtyTransport(emulator)
+    transport.start()
+
+    frames = []
+    connected = threading.Event()
+    device = Device(SerialClient(transport.port))
+    device.on_connect = lambda device: (connected.set(), device.Invoke(-1))
+    device.on_monitor = lambda device, msg: frames.append(msg)
+    try:
+        device.loop_start()
+        assert connected.wait(5)
+        assert device.info.id == emulator.id
+        assert device.model.classes == emulator.classes
+        assert wait_for(lambda: len(frames) >= 5)
+    finally:
+        device.loop_stop()
+        transport.stop()
+
+
+def test_stall_recovery():
+    from sscma.emulator import STALL_REINVOKE, STALL_BREAK, STALL_RESET
+
+    emulator = DeviceEmulator(fps=50, width=64, height=64)
+    transport = PtyTransport(emulator)
+    transport.start()
+
+    frames = []
+    device = Device(SerialClient(transport.port))
+    device.on_connect = lambda device: device.Invoke(-1)
+    device.on_monitor = lambda device, msg: frames.append(msg)
+    try:
+        device.loop_start()
+        assert wait_for(lambda: len(frames) >= 20)
+        # learnt from a 50 fps stream instead of the fixed 5 s
+        assert device.stall_timeout < 0.5
+        assert abs(device.stats()["frame_interval"] - 0.02) < 0.01
+
+        # each stall needs one more escalation step to be cured
+        for cure, counter in ((STALL_REINVOKE, "reinvokes"), (STALL_BREAK, "restarts"), (STALL_RESET, "resets")):
+            before = device.stats()
+            emulator.stall(cure)
+            count = len(frames)
+            assert wait_for(lambda: not emulator.stalled and len(frames) > count + 5, 10)
+            stats = device.stats()
+            assert stats["stalls"] == before["stalls"] + 1
+            assert stats[counter] == before[counter] + 1
+    finally:
+        device.loop_stop()
+        transport.stop()
+
+    recovery = stats["recovery"]
+    assert recovery["count"] == 3
+    # without the reset, a few frame periods and the commands of each step
+    assert recovery["sum"] < 5
+
+
+def test_paced_invoke():
+    emulator = DeviceEmulator(fps=100, width=64, height=64)
+    transport = PtyTransport(emulator)
+    transport.start()
+
+    frames = []
+
+    def on_monitor(device, msg):
+        frames.append(msg)
+        # a host slower than the device
+        time.sleep(0.02)
+
+    device = Device(SerialClient(transport.port), credits=2)
+    device.on_connect = lambda device: device.Invoke(-1)
+    device.on_monitor = on_monitor
+    try:
+        device.loop_start()
+        assert wait_for(lambda: len(frames) >= 30)
+        assert device.paced
+        # the device never runs more than the granted frames ahead
+        assert emulator.frames - len(frames) <= 4
+        assert device.stats()["grants"] >= 10
+        assert device.stats()["reinvokes"] == 0
+    finally:
+        device.on_monitor = None
+        device.Break()
+        device.loop_stop()
+        transport.stop()
+    assert not device.paced
+
+
+def test_target_fps():
+    emulator = DeviceEmulator(fps=100, width=64, height=64)
+    transport = PtyTransport(emulator)
+    transport.start()
+
+    frames = []
+    device = Device(SerialClient(transport.port), target_fps=20)
+    device.on_connect = lambda device: device.Invoke(-1)
+    device.on_monitor = lambda device, msg: frames.append(time.monotonic())
+    try:
+        device.loop_start()
+        assert wait_for(lambda: len(frames) >= 25)
+        fps = (len(frames) - 6) / (frames[-1] - frames[5])
+        assert 15 < fps < 22
+        assert emulator.frames - len(frames) <= 2
+    finally:
+        device.Break()
+        device.loop_stop()
+        transport.stop()
+
+
+def test_mqtt_device():
+    broker = MQTTBroker()
+    broker.start()
+    emulator = DeviceEmulator(id="mqtt0", fps=50)
+    transport = MQTTTransport(emulator, broker)
+    transport.start()
+
+    frames = []
+    device = Device(MQTTClient(host=broker.host, port=broker.port,
+                               tx_topic=transport.rx_topic, rx_topic=transport.tx_topic))
+    device.on_connect = lambda device: device.Sample(-1)
+    device.on_monitor = lambda device, msg: frames.append(msg)
+    try:
+        device.loop_start()
+        assert wait_for(lambda: len(frames) >= 5)
+        assert device.info.id == "mqtt0"
+    finally:
+        device.loop_stop()
+        transport.stop()
+        broker.stop()
+
+
+def test_shared_mqtt_connection():
+    broker = MQTTBroker()
+    broker.start()
+    emulators = [DeviceEmulator(id="shared{}".format(i), fps=50) for i in range(3)]
+    transports = [MQTTTransport(emulator, broker) for emulator in emulators]
+    for transport in transports:
+        transport.start()
+
+    shared, devices, frames = None, [], {}
+    for transport in transports:
+        shared = MQTTClient(host=broker.host, port=broker.port, tx_topic=transport.rx_topic,
+                            rx_topic=transport.tx_topic, shared=shared)
+        device = Device(shared)
+        device.on_connect = lambda device: device.Invoke(-1)
+        device.on_monitor = lambda device, msg: frames.setdefault(device.info.id, []).append(msg)
+        devices.append(device)
+    try:
+        for device in devices:
+            device.loop_start()
+        assert wait_for(lambda: len(frames) == 3 and all(len(f) >= 5 for f in frames.values()))
+        assert len(set(device._client._client for device in devices)) == 1
+        devices[0].loop_stop()
+        assert devices[1]._client.is_connected
+
+        # a stopped client of the connection receives nothing more
+        devices[2].loop_stop()
+        received = devices[2]._client.stats()["bytes_received"]
+        emulators[2].on_write(emulators[2].event_frame())
+        count = len(frames["shared1"])
+        assert wait_for(lambda: len(frames["shared1"]) > count + 5)
+        assert devices[2]._client.stats()["bytes_received"] == received
+        assert devices[1]._client.stats()["bytes_received"] > 0
+
+        # one series per client, the connection they share is rendered once
+        text = render_prometheus(devices)
+        assert text.count("sscma_client_frames_total{") == 3
+        assert text.count("sscma_mqtt_connects_total{") == 1
+    finally:
+        for device in devices[1:2]:
+            device.loop_stop()
+        for transport in transports:
+            transport.stop()
+        broker.stop()
+
+
+def test_mqtt_reconnect():
+    from sscma.micro.client import backoff_delay
+
+    broker = MQTTBroker()
+    broker.start()
+    port = broker.port
+    emulator = DeviceEmulator(id="mqtt1", fps=0)
+    transport = MQTTTransport(emulator, broker)
+    transport.start()
+
+    client = MQTTClient(host=broker.host, port=port, tx_topic=transport.rx_topic, rx_topic=transport.tx_topic,
+                        qos=1, reconnect_min=0.1, reconnect_max=0.5)
+    client.loop_start()
+    try:
+        assert wait_for(lambda: client.is_connected)
+        assert client.get(CMD_AT_ID)["data"] == "mqtt1"
+
+        transport.stop()
+        broker.stop()
+        assert wait_for(lambda: not client.is_connected)
+
+        # a command sent while the broker is down is kept and sent on reconnect,
+        # identical ones included
+        client.execute(CMD_AT_BREAK)
+        client.execute(CMD_AT_BREAK)
+        assert client.stats()["mqtt"]["queue_length"] == 2
+        responses = []
+        thread = threading.Thread(target=lambda: responses.append(client.get(CMD_AT_NAME, timeout=3)))
+        thread.start()
+        time.sleep(0.3)
+        broker = MQTTBroker(port=port)
+        broker.start()
+        transport = MQTTTransport(emulator, broker)
+        transport.start()
+        thread.join(10)
+        assert responses[0]["data"] == emulator.name
+
+        stats = client.stats()["mqtt"]
+        assert (stats["connects"], stats["queued"], stats["queue_length"]) == (2, 3, 0)
+        assert stats["reconnect_time"]["count"] == 1 and stats["reconnect_time"]["sum"] < 3
+        assert stats["resubscribe_time"]["count"] == 2 and stats["drain_time"]["count"] == 2
+    finally:
+        client.loop_stop()
+        transport.stop()
+        broker.stop()
+
+    # a disconnect asked for locally schedules no reconnect
+    stats = client.stats()["mqtt"]
+    assert stats["disconnects"] == 2 and stats["reconnect_attempt"] == 0
+
+    delays = [backoff_delay(attempt, 1, 60) for attempt in range(10) for _ in range(50)]
+    assert all(0 <= delay <= 60 for delay in delays)
+    assert max(delays[:50]) <= 1 and max(delays[-50:]) > 30
+    assert len(set(delays[-50:])) == 50
+
+
+def test_mqtt_lazy_connect():
+    broker = MQTTBroker()
+    broker.start()
+    port = broker.port
+    broker.stop()
+
+    # the broker is down, neither construction nor loop_start waits for it
+    start = time.monotonic()
+    emulators = [DeviceEmulator(id="lazy{}".format(i), fps=0) for i in range(20)]
+    clients = [MQTTClient(host=broker.host, port=port, tx_topic="sscma/v0/{}/rx".format(emulator.id),
+                          rx_topic="sscma/v0/{}/tx".format(emulator.id), reconnect_min=0.1, reconnect_max=0.2)
+               for emulator in emulators]
+    ready = []
+    clients[0].on_ready = ready.append
+    devices = [Device(client, heartbeat=0.2) for client in clients]
+    connected = []
+    for device in devices:
+        device.on_connect = connected.append
+        device.loop_start()
+    assert time.monotonic() - start < 1
+    assert not clients[0].wait_ready(0.2) and not ready and not connected
+
+    broker = MQTTBroker(port=port)
+    broker.start()
+    transports = [MQTTTransport(emulator, broker) for emulator in emulators]
+    for transport in transports:
+        transport.start()
+    try:
+        assert all(client.ready.result(10) is client for client in clients)
+        assert ready == [clients[0]]
+        assert wait_for(lambda: len(connected) == len(devices), 10)
+        assert clients[0].stats()["mqtt"]["connect_time"] > 0.2
+    finally:
+        for device in devices:
+            device.loop_stop()
+        for transport in transports:
+            transport.stop()
+        broker.stop()
+
+
+def test_discovery(tmp_path):
+    from serial.tools.list_ports_common import ListPortInfo
+    from sscma.micro import Discovery
+
+    transports = [PtyTransport(DeviceEmulator(id="probe{}".format(i), fps=0)) for i in range(4)]
+    for transport in transports:
+        transport.start()
+    ports = []
+    for index, transport in enumerate(transports):
+        port = ListPortInfo(transport.port, skip_link_detection=True)
+        port.vid, port.pid, port.serial_number = 0x1a86, 0x55d3, "SN{}".format(index)
+        ports.append(port)
+    master, slave = os.openpty()
+
+    cache = str(tmp_path / "discovery.json")
+    try:
+        start = time.monotonic()
+        devices = Discovery(timeout=0.5, cache=cache).discover(ports + [os.ttyname(slave)])
+        elapsed = time.monotonic() - start
+    finally:
+        for transport in transports:
+            transport.stop()
+        os.close(master)
+        os.close(slave)
+
+    assert sorted(devices) == ["probe{}".format(i) for i in range(4)]
+    assert devices["probe2"].port == transports[2].port
+    assert devices["probe2"].software == "v2024.01.01"
+    # probed at once, the silent port only costs one deadline
+    assert elapsed < 1.5
+
+    # a new process finds the devices in the cache, without probing them
+    start = time.monotonic()
+    cached = Discovery(timeout=0.5, cache=cache).discover(ports)
+    assert time.monotonic() - start < 0.1
+    assert sorted(cached) == sorted(devices)
+    assert Discovery(timeout=0.1, cache=cache).discover(ports, refresh=True) == {}
+
+
+def test_info_changes():
+    from sscma.micro.info import DeviceInfo
+
+    emulator = DeviceEmulator(fps=0)
+    transport = PtyTransport(emulator)
+    transport.start()
+
+    changes = []
+    connected = threading.Event()
+    device = Device(SerialClient(transport.port))
+    device.on_connect = lambda device: connected.set()
+    device.on_change = lambda device, name, diff: changes.append((name, diff))
+    try:
+        device.loop_start()
+        assert connected.wait(5)
+        # the first fetch is not a change
+        assert changes == []
+
+        # a refetch returning the same values is not a change
+        changes.clear()
+        device.Invoke(-1)
+        device._status &= ~DeviceStatus.READY
+        device.initialize()
+        assert changes == []
+
+        emulator.version["software"] = "v2024.02.01"
+        device._status &= ~DeviceStatus.READY
+        device.initialize()
+        assert changes == [("info", {"version": (dict(emulator.version, software="v2024.01.01"), emulator.version),
+                                     "software": ("v2024.01.01", "v2024.02.01")})]
+    finally:
+        device.loop_stop()
+        transport.stop()
+
+    info = device.info
+    with pytest.raises(AttributeError):
+        info.id = "other"
+    assert info == DeviceInfo(info.data) and info.diff(DeviceInfo(info.data)) == {}
+    assert {info: 1}[DeviceInfo(info.data)] == 1
+    # nested values are frozen too
+    with pytest.raises(TypeError):
+        info.version["software"] = "other"
+
+
+def test_binary_frames(loopback):
+    import struct
+
+    emulator, client = loopback
+    events = []
+    client.on_event = events.append
+
+    assert client.negotiate_binary()
+    assert emulator.binary_images
+    assert client.set(CMD_AT_INVOKE, "2,0,0")["code"] == CMD_OK
+    assert wait_for(lambda: len(events) == 2)
+    assert events[0]["data"]["image"] == emulator._jpeg
+
+    # JPEG bytes looking like a JSON frame, fed in small chunks between JSON frames
+    jpeg = b"\xff\xd8" + b'\r{"type": 0}\n' + os.urandom(300) + b"\xff\xd9"
+    payload = b'{"type": 1, "name": "INVOKE", "code": 0, "data": {"boxes": []}}'
+    binary = BINARY_PREFIX + struct.pack("<II", len(payload), len(jpeg)) + payload + jpeg
+    stream = emulator.event_frame(count=3) + b"noise" + binary + emulator.event_frame(count=4, binary=True)
+    events.clear()
+    before = client.stats()
+    for i in range(0, len(stream), 7):
+        client.on_recieve(stream[i:i + 7])
+    assert [type(event["data"]["image"]) for event in events] == [str, bytes, bytes]
+    assert base64.b64decode(events[0]["data"]["image"]) == emulator._jpeg
+    assert events[1]["data"]["image"] == jpeg
+    assert client.stats()["frames"] - before["frames"] == 3
+    assert client.stats()["buffer_resyncs"] - before["buffer_resyncs"] == 1
+
+
+def test_binary_fallback():
+    emulator = DeviceEmulator(fps=50, binary=False)
+    transport = PtyTransport(emulator)
+    transport.start()
+
+    frames = []
+    connected = threading.Event()
+    device = Device(SerialClient(transport.port), binary_images=True)
+    device.on_connect = lambda device: (connected.set(), device.Invoke(-1))
+    device.on_monitor = lambda device, msg: frames.append(msg)
+    try:
+        device.loop_start()
+        assert connected.wait(5)
+        assert not device._client.binary_images
+        assert wait_for(lambda: len(frames) >= 3)
+        assert isinstance(frames[0]["raw_image"], str)
+    finally:
+        device.loop_stop()
+        transport.stop()
+
+    emulator = DeviceEmulator(fps=50)
+    transport = PtyTransport(emulator)
+    transport.start()
+    frames.clear()
+    connected.clear()
+    device = Device(SerialClient(transport.port), binary_images=True)
+    device.on_connect = lambda device: (connected.set(), device.Invoke(-1))
+    device.on_monitor = lambda device, msg: frames.append(msg)
+    try:
+        device.loop_start()
+        assert connected.wait(5)
+        assert device._client.binary_images and emulator.binary_images
+        assert wait_for(lambda: len(frames) >= 3)
+        # the JPEG bytes of binary frames are passed through untouched
+        assert frames[0]["raw_image"] == emulator._jpeg
+    finally:
+        device.loop_stop()
+        transport.stop()
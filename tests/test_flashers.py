@@ -0,0 +1,423 @@
+import os
+import gzip
+import json
+import time
+import zipfile
+import tracemalloc
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+from sscma.emulator import BootloaderEmulator, DeviceEmulator, PtyTransport
+from sscma.flashers.base import BaseFlasher
+from sscma.cli.flahser import flasher
+from sscma.flashers.bundle import Bundle
+from sscma.flashers.source import Source
+from sscma.flashers.core import HimaxFlasher, SN_OFFSET
+from sscma.flashers.expect import Expect
+from sscma.flashers.parallel import ParallelFlasher
+from sscma.micro.info import DeviceInfo
+
+
+class SlowFlasher(BaseFlasher):
+    """Writes nothing, in fixed size steps, failing on ports named 'bad'."""
+
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, port, baudrate=921600):
+        self.port = port
+
+    def name():
+        return "Slow Flasher"
+
+    def match(port):
+        return False
+
+    def write(self, data, offset=0, callback=None):
+        with SlowFlasher.lock:
+            SlowFlasher.active += 1
+            SlowFlasher.peak = max(SlowFlasher.peak, SlowFlasher.active)
+        try:
+            for written in range(0, len(data) + 1, 256):
+                time.sleep(0.01)
+                if self.port == "bad":
+                    raise Exception("no bootloader")
+                if callback is not None:
+                    callback(written, len(data))
+        finally:
+            with SlowFlasher.lock:
+                SlowFlasher.active -= 1
+
+    def write_sn(self, callback=None):
+        self.write(bytes(256), 0x003DF000, callback)
+        return "sn-{}".format(self.port)
+
+
+def test_parallel_write():
+    ports = ["port{}".format(i) for i in range(8)] + ["bad"]
+    progress = {}
+    SlowFlasher.peak = 0
+
+    results = ParallelFlasher(ports, flasher=SlowFlasher).write(
+        bytes(1024), callback=lambda port, written, total: progress.__setitem__(port, (written, total)))
+
+    assert [result.port for result in results] == ports
+    assert all(result.ok for result in results[:-1])
+    assert not results[-1].ok and results[-1].error == "no bootloader"
+    assert all(progress[port] == (1024, 1024) for port in ports[:-1])
+    assert SlowFlasher.peak == len(ports)
+    assert max(result.elapsed for result in results) < 0.05 * len(ports)
+
+
+def test_parallel_workers():
+    SlowFlasher.peak = 0
+    results = ParallelFlasher([(SlowFlasher, "port{}".format(i)) for i in range(4)], workers=2).write_sn()
+
+    assert SlowFlasher.peak == 2
+    assert [result.value for result in results] == ["sn-port{}".format(i) for i in range(4)]
+
+
+
+class BytesFlasher(BaseFlasher):
+    """Records the images it is given, with the original write and write_sn signatures."""
+
+    def __init__(self, port, baudrate=921600):
+        self.port = port
+        self.images = []
+
+    def name():
+        return "Bytes Flasher"
+
+    def match(port):
+        return False
+
+    def write(self, data, offset=0):
+        assert isinstance(data, bytes)
+        self.images.append((offset, data))
+
+    def write_sn(self):
+        self.images.append((SN_OFFSET, b"sn"))
+        return "sn"
+
+
+def test_flasher_options():
+    from sscma.flashers.base import flasher_options
+
+    # flashers of other packages need not take the options of the built-in one
+    assert flasher_options(SlowFlasher, {"mode": "xmodem1k"}) == {}
+    assert flasher_options(HimaxFlasher, {"mode": "xmodem1k"}) == {"mode": "xmodem1k"}
+    results = ParallelFlasher(["port0"], flasher=SlowFlasher, mode="xmodem1k").write(bytes(256))
+    assert results[0].ok
+
+@pytest.mark.parametrize("support_1k", [True, False])
+def test_himax_xmodem1k(support_1k):
+    bootloader = BootloaderEmulator(support_1k=support_1k)
+    transport = PtyTransport(bootloader)
+    transport.start()
+    data = os.urandom(10 * 1024 + 100)
+    progress = []
+    try:
+        flasher = HimaxFlasher(transport.port, mode="xmodem1k")
+        flasher.write(data, 0x200000, callback=lambda written, total: progress.append((written, total)))
+    finally:
+        transport.stop()
+
+    offset, image = bootloader.images[0]
+    assert offset == 0x200000
+    assert image[:len(data)] == data
+    assert bootloader.sessions == 1
+    assert progress[-1] == (len(data), len(data))
+    if support_1k:
+        assert bootloader.packets[1024] == 11
+        assert flasher.mode == "xmodem1k"
+    else:
+        assert bootloader.packets == {128: 1 + 81, 1024: 0}
+        assert flasher.mode == "xmodem"
+
+
+@pytest.fixture
+def line():
+    import pty
+    import tty
+    import serial
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    port = serial.Serial(os.ttyname(slave), timeout=1)
+    yield master, port
+    port.close()
+    os.close(master)
+    os.close(slave)
+
+
+def test_expect(line):
+    master, port = line
+    expect = Expect(port, window=64)
+
+    # a pattern split across reads, bytes after the match are kept
+    threading.Timer(0.05, os.write, (master, b"noise Do you want")).start()
+    threading.Timer(0.1, os.write, (master, b" to end? CC")).start()
+    assert expect.expect([b"reboot", b"Do you want to end"], 2) == 1
+    assert expect.expect(b"C", 0.1) == 0
+    assert expect.expect(b"C", 0.1) == 0
+
+    # old bytes fall out of the window
+    os.write(master, b"MARK" + b"." * 100)
+    with pytest.raises(TimeoutError):
+        expect.expect(b"MARK", 0.1)
+
+    start = time.monotonic()
+    with pytest.raises(TimeoutError, match="no prompt"):
+        expect.expect(b"prompt", 0.3, send=b"1", interval=0.05, error="no prompt")
+    assert 0.3 <= time.monotonic() - start < 0.5
+    assert port.timeout == 1
+    assert 5 <= len(os.read(master, 100)) <= 8
+
+
+def test_expect_idle(line):
+    master, port = line
+    expect = Expect(port)
+
+    # waiting without input nor send blocks in read instead of spinning
+    start = time.process_time()
+    with pytest.raises(TimeoutError):
+        expect.expect(b"prompt", 1)
+    assert time.process_time() - start < 0.2
+    assert port.timeout == 1
+
+
+def test_wait_for_flash(line):
+    master, port = line
+    flasher = HimaxFlasher(os.ttyname(master))
+    flasher.serial = port
+    flasher.expect = Expect(port)
+
+    # a 'C' in banner text is not the XMODEM handshake
+    os.write(master, b"Copyright\r\nCore ready\r\n")
+    with pytest.raises(TimeoutError):
+        flasher.wait_for_flash(300)
+
+    threading.Timer(0.1, os.write, (master, b"C")).start()
+    threading.Timer(0.2, os.write, (master, b"C")).start()
+    flasher.wait_for_flash(2000)
+
+    # a reset input buffer leaves no stale prompt behind
+    os.write(master, HimaxFlasher._PROMPT)
+    assert flasher.expect.read(1, 0.5) == HimaxFlasher._PROMPT[:1]
+    flasher.reset_input_buffer()
+    with pytest.raises(TimeoutError):
+        flasher.wait_for_config_done(200)
+
+
+def make_bundle(path, images, archive=False, versions=None):
+    manifest = {"name": "board", "version": "v1",
+                "images": [{"file": name, "offset": hex(offset)} for name, offset, _ in images]}
+    for entry, version in zip(manifest["images"], versions or []):
+        entry.update(version)
+    if archive:
+        with zipfile.ZipFile(path, "w") as f:
+            f.writestr("bundle.json", json.dumps(manifest))
+            for name, _, data in images:
+                f.writestr(name, data)
+    else:
+        path.write_text(json.dumps(manifest))
+        for name, _, data in images:
+            (path.parent / name).write_bytes(data)
+    return path
+
+
+def test_bundle_load(tmp_path):
+    images = [("firmware.img", 0, os.urandom(3000)), ("model.tflite", 0x400000, os.urandom(5000))]
+    for archive in (False, True):
+        bundle = Bundle.load(make_bundle(tmp_path / ("b.zip" if archive else "b.json"), images, archive))
+        assert (bundle.name, bundle.version, bundle.size) == ("board", "v1", 8000)
+        assert [(offset, source.read()) for offset, source in bundle.segments()] == \
+            [(offset, data) for _, offset, data in images]
+
+    with pytest.raises(ValueError, match="overlap"):
+        Bundle.load(make_bundle(tmp_path / "c.json", [("a", 0, bytes(10)), ("b", 5, bytes(10))]))
+    with pytest.raises(ValueError, match="missing"):
+        (tmp_path / "d.json").write_text(json.dumps({"images": [{"file": "missing"}]}))
+        Bundle.load(tmp_path / "d.json")
+
+
+def test_flash_bundle(tmp_path):
+    images = [("firmware.img", 0, os.urandom(3000)), ("model.tflite", 0x400000, os.urandom(5000))]
+    bundle = make_bundle(tmp_path / "bundle.zip", images, archive=True)
+    bootloaders = [BootloaderEmulator() for _ in range(2)]
+    transports = [PtyTransport(bootloader) for bootloader in bootloaders]
+    for transport in transports:
+        transport.start()
+    try:
+        args = ["--bundle", str(bundle), "--sn"]
+        for transport in transports:
+            args += ["-p", transport.port]
+        result = CliRunner().invoke(flasher, args)
+    finally:
+        for transport in transports:
+            transport.stop()
+
+    assert result.exit_code == 0, result.output
+    assert "2 passed, 0 failed" in result.output
+    for bootloader in bootloaders:
+        assert bootloader.sessions == 1
+        assert [(offset, data[:len(image)]) for (offset, data), (_, _, image) in
+                zip(bootloader.images, images)] == [(offset, data) for _, offset, data in images]
+        assert bootloader.images[2][0] == SN_OFFSET
+
+
+def test_bytes_flasher_bundle(tmp_path):
+    images = [("firmware.img", 0, os.urandom(3000)), ("model.tflite", 0x400000, os.urandom(5000))]
+    bundle = Bundle.load(make_bundle(tmp_path / "bundle.zip", images, archive=True))
+    flasher = BytesFlasher("port0")
+    progress = []
+
+    # images of the bundle are read into bytes, the callback is not passed on
+    assert flasher.write_bundle(bundle, lambda written, total: progress.append(written), sn=True) == ("sn", [])
+    assert flasher.images == [(offset, data) for _, offset, data in images] + [(SN_OFFSET, b"sn")]
+    assert progress == []
+
+
+def test_bytes_flasher_skip_identical(tmp_path):
+    images = [("firmware.img", 0, os.urandom(3000)), ("model.tflite", 0x400000, os.urandom(5000))]
+    versions = [{"software": "v2024.01.01", "hardware": "1"}]
+    bundle = Bundle.load(make_bundle(tmp_path / "bundle.json", images, versions=versions))
+    flashers = []
+
+    class VersionedFlasher(BytesFlasher):
+        def __init__(self, port, baudrate=921600):
+            super().__init__(port, baudrate)
+            flashers.append(self)
+
+        def identify(self):
+            version = {"software": "v2024.01.01" if self.port == "current" else "v2023.12.01", "hardware": "1"}
+            return DeviceInfo(DeviceInfo.construct("1", "board", None, version)), None
+
+    results = ParallelFlasher(["current", "outdated"], flasher=VersionedFlasher).write_bundle(bundle, skip_identical=True)
+    assert all(result.ok for result in results), [result.error for result in results]
+    assert [[image.name for image in result.skipped] for result in results] == [["firmware.img"], []]
+    written = {flasher.port: flasher.images for flasher in flashers}
+    assert written["current"] == [(0x400000, images[1][2])]
+    assert written["outdated"] == [(offset, data) for _, offset, data in images]
+
+    # the other operations of the parallel flasher go through write_images as well
+    results = ParallelFlasher(["port0"], flasher=VersionedFlasher).write(Source.parse(str(tmp_path / "model.tflite")), 0x400000)
+    assert results[0].ok and flashers[-1].images == [(0x400000, images[1][2])]
+    results = ParallelFlasher(["port0"], flasher=VersionedFlasher).write_sn(lambda port, written, total: None)
+    assert results[0].value == "sn"
+
+
+def test_sources(tmp_path):
+    data = os.urandom(200 * 1024)
+    (tmp_path / "image.bin").write_bytes(data)
+    (tmp_path / "image.bin.gz").write_bytes(gzip.compress(data))
+    with zipfile.ZipFile(tmp_path / "one.zip", "w", zipfile.ZIP_DEFLATED) as f:
+        f.writestr("image.bin", data)
+    with zipfile.ZipFile(tmp_path / "two.zip", "w", zipfile.ZIP_DEFLATED) as f:
+        f.writestr("image.bin", data)
+        f.writestr("other.bin", b"other")
+
+    for spec in ("image.bin", "image.bin.gz", "one.zip", "two.zip#image.bin"):
+        source = Source.parse(str(tmp_path / spec))
+        assert source.size == len(data)
+        assert source.name == "image.bin" or spec.endswith(".gz")
+        with source.open() as stream:
+            # the XMODEM sender rewinds the stream when it falls back to 128 bytes
+            stream.read(1000)
+            stream.seek(0)
+            assert stream.read() == data
+
+    with pytest.raises(ValueError, match="holds 2 files"):
+        Source(str(tmp_path / "two.zip"))
+    with pytest.raises(ValueError, match="has no"):
+        Source.parse(str(tmp_path / "two.zip#missing"))
+
+
+def test_source_memory(tmp_path):
+    data = os.urandom(8 * 1024 * 1024)
+    (tmp_path / "image.bin").write_bytes(data)
+    (tmp_path / "image.bin.gz").write_bytes(gzip.compress(data, compresslevel=1))
+    del data
+
+    for name in ("image.bin", "image.bin.gz"):
+        source = Source(str(tmp_path / name))
+        tracemalloc.start()
+        try:
+            with source.open() as stream:
+                read = 0
+                while True:
+                    chunk = stream.read(1024)
+                    if not chunk:
+                        break
+                    read += len(chunk)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        assert read == source.size
+        assert peak < 1024 * 1024
+
+
+def test_flash_compressed(tmp_path):
+    data = os.urandom(20 * 1024)
+    path = tmp_path / "firmware.img.gz"
+    path.write_bytes(gzip.compress(data))
+    bootloader = BootloaderEmulator()
+    transport = PtyTransport(bootloader)
+    transport.start()
+    progress = []
+    try:
+        HimaxFlasher(transport.port).write(Source(str(path)), 0x10000,
+                                           callback=lambda written, total: progress.append((written, total)))
+    finally:
+        transport.stop()
+
+    assert bootloader.images[0][0] == 0x10000
+    assert bootloader.images[0][1][:len(data)] == data
+    assert progress[-1] == (len(data), len(data))
+
+
+def test_skip_identical(tmp_path):
+    images = [("firmware.img", 0, os.urandom(3000)), ("model.tflite", 0x400000, os.urandom(5000))]
+    versions = [{"software": "v2024.01.01", "hardware": "1"}, {"model": {"uuid": 1, "version": "1.0.0"}}]
+    bundle = make_bundle(tmp_path / "bundle.json", images, versions=versions)
+    transports = [PtyTransport(DeviceEmulator(id="emulator{}".format(i), fps=0)) for i in range(2)]
+    for transport in transports:
+        transport.start()
+    try:
+        info, model = HimaxFlasher(transports[0].port).identify()
+        result = CliRunner().invoke(flasher, ["--bundle", str(bundle), "--skip_identical",
+                                              "-p", transports[0].port, "-p", transports[1].port])
+    finally:
+        for transport in transports:
+            transport.stop()
+
+    assert (info.software, model.uuid) == ("v2024.01.01", 1)
+    assert [image.name for image in Bundle.load(bundle).plan(info, model)[1]] == ["firmware.img", "model.tflite"]
+    # the bootloader is not entered when every image is already there
+    assert result.exit_code == 0, result.output
+    assert result.output.count("skipped: firmware.img, model.tflite") == 2
+
+    versions = [{"software": "v2024.02.01", "hardware": "1"}, {"model": {"uuid": 1, "version": "1.0.0"}}]
+    pending, skipped = Bundle.load(make_bundle(tmp_path / "newer.json", images, versions=versions)).plan(info, model)
+    assert ([image.name for image in pending], [image.name for image in skipped]) == (["firmware.img"], ["model.tflite"])
+    assert Bundle.load(make_bundle(tmp_path / "plain.json", images)).plan(info, model)[1] == []
+    assert Bundle.load(bundle).plan(None, None)[1] == []
+
+
+def test_lossy_line():
+    bootloader = BootloaderEmulator(error_rate=0.05, drop_rate=0.02, jitter=0.001, seed=3)
+    transport = PtyTransport(bootloader)
+    transport.start()
+    data = os.urandom(32 * 1024)
+    try:
+        flasher = HimaxFlasher(transport.port, ack_timeout=0.2, reset_delay=0.05)
+        flasher.write(data, 0x10000, callback=lambda written, total: None)
+    finally:
+        transport.stop()
+
+    assert bootloader.images[-1] == (0x10000, data)
+    assert bootloader.naks > 0 and bootloader.drops > 0
+    assert flasher.retries == bootloader.naks + bootloader.drops
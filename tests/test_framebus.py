@@ -0,0 +1,127 @@
+import time
+import threading
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from sscma.emulator import DeviceEmulator, PtyTransport
+from sscma.micro.client import SerialClient
+from sscma.micro.device import Device
+from sscma.micro.framebus import FramePublisher, FrameSubscriber
+
+
+def make_image(seq, width=64, height=48):
+    return np.full((height, width, 3), seq % 256, np.uint8)
+
+
+def consume(name, count, results):
+    with FrameSubscriber(name) as subscriber:
+        results.put("ready")
+        frames = []
+        while len(frames) < count:
+            frame = subscriber.read(timeout=5)
+            if frame is None:
+                break
+            ok = frame.valid() and int(frame.image[0, 0, 0]) == frame.seq % 256 and \
+                frame.boxes.tolist() == [[frame.seq, 2, 3, 4, 0.5, 1]]
+            frames.append((frame.seq, frame.image.shape, ok))
+        results.put(frames)
+
+
+def test_publish_subscribe():
+    with FramePublisher(slots=4, width=64, height=48, max_results=8) as publisher:
+        subscriber = FrameSubscriber(publisher.name)
+        assert subscriber.read(0) is None
+
+        publisher.publish(make_image(1, 32, 16), boxes=[[1, 2, 3, 4, 0.5, 1]], keypoints=[[5, 6, 0.9, 0, 7]])
+        frame = subscriber.read(0)
+        assert (frame.seq, frame.image.shape) == (1, (16, 32, 3))
+        assert frame.keypoints.tolist() == [[5, 6, pytest.approx(0.9), 0]]
+        assert len(frame.classes) == 0
+        copy = frame.copy()
+
+        # a slow reader is lapped, the publisher never waits for it
+        for seq in range(2, 8):
+            publisher.publish(make_image(seq))
+        assert not frame.valid() and copy.valid() and copy.image[0, 0, 0] == 1
+        assert subscriber.pending == 6
+        assert [subscriber.read(0).seq for _ in range(4)] == [4, 5, 6, 7]
+        assert subscriber.skipped == 2 and subscriber.received == 5
+
+        for seq in range(8, 11):
+            publisher.publish(make_image(seq))
+        assert subscriber.latest().seq == 10 and subscriber.read(0) is None
+
+        with pytest.raises(ValueError):
+            publisher.publish(make_image(0, 65, 48))
+        with pytest.raises(ValueError):
+            publisher.publish(make_image(0), boxes=[[0] * 6] * 9)
+        assert publisher.rejected == 2
+        del frame
+        subscriber.close()
+
+
+def test_other_process():
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    with FramePublisher(slots=64, width=64, height=48) as publisher:
+        process = context.Process(target=consume, args=(publisher.name, 20, results))
+        process.start()
+        assert results.get(timeout=30) == "ready"
+        for seq in range(1, 21):
+            publisher.publish(make_image(seq), boxes=[[seq, 2, 3, 4, 0.5, 1]])
+            time.sleep(0.005)
+        frames = results.get(timeout=30)
+        process.join(10)
+
+    assert [seq for seq, _, _ in frames] == list(range(1, 21))
+    assert all(shape == (48, 64, 3) and ok for _, shape, ok in frames)
+    assert process.exitcode == 0
+
+
+def wait_frames(frames, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not frames and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return bool(frames)
+
+
+def test_device_publisher(monkeypatch):
+    from PIL import Image
+    from sscma.utils import codec
+
+    # the frame bus and on_monitor share one decode per frame
+    decodes = []
+    decode = codec.decode
+    monkeypatch.setattr(codec, "decode", lambda *args: decodes.append(1) or decode(*args))
+    monkeypatch.setattr(Image, "open", None)
+
+    emulator = DeviceEmulator(width=160, height=120, fps=30, boxes=2)
+    transport = PtyTransport(emulator)
+    transport.start()
+    publisher = FramePublisher(width=160, height=120)
+    subscriber = FrameSubscriber(publisher.name)
+    connected = threading.Event()
+    frame = None
+    device = Device(SerialClient(transport.port))
+    device.publisher = publisher
+    frames = []
+    device.on_monitor = lambda device, msg: frames.append(msg)
+    device.on_connect = lambda device: (connected.set(), device.Invoke(-1))
+    try:
+        device.loop_start()
+        assert connected.wait(5)
+        frame = subscriber.read(timeout=5)
+        assert frame is not None
+        assert frame.image.shape == (120, 160, 3)
+        assert frame.boxes.shape == (2, 6)
+        assert wait_frames(frames)
+        assert frames[0]["image"] and frames[0]["raw_image"]
+    finally:
+        device.loop_stop()
+        transport.stop()
+        del frame
+        subscriber.close()
+        publisher.close()
+    assert len(decodes) == len(frames)
@@ -0,0 +1,41 @@
+import sys
+import subprocess
+from importlib.metadata import EntryPoint
+
+import pytest
+
+from sscma.flashers import registry
+from sscma.flashers.core import HimaxFlasher
+
+HEAVY = ("cv2", "numpy", "PIL", "paho", "serial", "xmodem", "tqdm")
+
+
+def loaded_after(code):
+    script = "import sys\n{}\nprint(' '.join(sorted(name for name in {!r} if name in sys.modules)))".format(code, HEAVY)
+    return subprocess.run([sys.executable, "-c", script], check=True,
+                          capture_output=True, text=True).stdout.split()
+
+
+@pytest.mark.parametrize("code, allowed", [
+    ("import sscma", []),
+    ("import sscma.micro", []),
+    ("from sscma.micro import Device, SerialClient, MQTTClient", []),
+    ("import sscma.flashers", []),
+    ("from sscma.flashers import HimaxFlasher, ParallelFlasher, Bundle", ["serial", "xmodem"]),
+    ("from sscma.cli.cli import cli", []),
+    ("from sscma.cli.cli import cli; cli.get_command(None, 'flasher')", ["serial", "tqdm", "xmodem"]),
+])
+def test_lazy_imports(code, allowed):
+    assert set(loaded_after(code)) <= set(allowed)
+
+
+def test_flasher_plugins(monkeypatch):
+    plugins = [
+        EntryPoint("slow", "tests.test_flashers:SlowFlasher", registry.GROUP),
+        EntryPoint("broken", "tests.missing:Flasher", registry.GROUP),
+        EntryPoint("himax", "sscma.flashers.core:HimaxFlasher", registry.GROUP),
+    ]
+    monkeypatch.setattr(registry, "_entry_points", lambda group: plugins)
+
+    from tests.test_flashers import SlowFlasher
+    assert registry.load_flashers() == [HimaxFlasher, SlowFlasher]
@@ -0,0 +1,115 @@
+import time
+import urllib.request
+
+from sscma.micro.client import Client
+from sscma.micro.device import Device
+from sscma.micro.metrics import Histogram, Meter, PrometheusExporter, render_prometheus
+from sscma.micro.const import *
+from sscma.emulator import DeviceEmulator
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == 6.05
+    assert snapshot["buckets"] == [(0.1, 1), (1.0, 3), (float("inf"), 4)]
+
+
+def test_meter():
+    meter = Meter(window=10)
+    meter.mark(100)
+    assert meter.rate() > 0
+
+
+def test_client_stats():
+    emulator = DeviceEmulator(fps=0)
+    client = Client(emulator.write)
+    emulator.on_write = client.on_recieve
+
+    client.get(CMD_AT_ID)
+    client.get(CMD_AT_ID)
+    client.on_recieve(b'garbage\r{"type": 0, "name": "X"}\n\r{broken}\n')
+    client.get("UNKNOWN", timeout=0.01)
+
+    stats = client.stats()
+    assert stats["commands"]["ID?"]["count"] == 2
+    assert stats["frames"] == 5
+    assert stats["parse_failures"] == 1
+    assert stats["buffer_resyncs"] == 1
+    assert stats["bytes_received"] > 0
+    assert stats["timeouts"] == 0
+
+
+def test_client_timeouts():
+    client = Client(lambda msg: None, timeout=0.01, try_count=3)
+    assert client.get(CMD_AT_ID) is None
+    stats = client.stats()
+    assert stats["retries"] == 2
+    assert stats["timeouts"] == 1
+
+
+def test_prometheus_exporter():
+    emulator = DeviceEmulator(fps=0)
+    client = Client(emulator.write)
+    emulator.on_write = client.on_recieve
+    device = Device(client)
+    device.on_monitor = lambda device, msg: None
+    emulator.start()
+    try:
+        device.initialize()
+        device.Invoke(5)
+        deadline = time.monotonic() + 5
+        while device.stats()["frames"] < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        emulator.stop()
+
+    stats = device.stats()
+    assert stats["id"] == emulator.id
+    assert stats["frames"] == 5
+    assert stats["callback"]["count"] == 5
+    assert 'sscma_device_frames_total{device="emulator0"} 5' in render_prometheus([device])
+
+    exporter = PrometheusExporter(port=0, host="127.0.0.1")
+    exporter.start()
+    try:
+        with urllib.request.urlopen("http://127.0.0.1:{}/metrics".format(exporter.port)) as response:
+            body = response.read().decode("utf-8")
+    finally:
+        exporter.stop()
+    assert 'sscma_client_command_seconds_count{{client="{}",command="INVOKE"}} 1'.format(client.name) in body
+    assert 'sscma_device_stalls_total{device="emulator0"} 0' in body
+    assert 'sscma_device_invoke_grants_total{device="emulator0"} 0' in body
+
+    # a client shared by several devices is rendered once
+    other = Device(client)
+    text = render_prometheus([device, other])
+    assert text.count('sscma_client_frames_total{{client="{}"}}'.format(client.name)) == 1
+    assert text.count("sscma_device_frames_total{") == 2
+
+
+def test_device_perf():
+    emulator = DeviceEmulator(fps=0)
+    client = Client(emulator.write)
+    emulator.on_write = client.on_recieve
+    device = Device(client, stat_interval=1)
+    emulator.start()
+    try:
+        device.initialize()
+        device.Invoke(3)
+        deadline = time.monotonic() + 5
+        while len(device.perf()) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        device._fetch_stat()
+    finally:
+        emulator.stop()
+
+    samples = device.perf()
+    assert [sample["source"] for sample in samples] == ["event"] * 3 + ["stat"]
+    assert set(samples[0]) >= {"preprocess", "inference", "postprocess", "time"}
+    assert "load" in samples[-1]
+    assert device.perf(since=samples[-1]["time"]) == []
+    assert 40 <= device.stats()["perf"]["inference"] <= 60
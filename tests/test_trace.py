@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from sscma.micro.device import Device
+from sscma.micro.trace import Tracer, RingBufferSink, ChromeTraceSink
+from sscma.micro.const import *
+from sscma.emulator import DeviceEmulator, LoopbackTransport
+
+
+@pytest.fixture
+def make_device():
+    # the device is initialized by the emulator, events are fed by the tests
+    transports = []
+
+    def make(tracer):
+        transport = LoopbackTransport(DeviceEmulator(fps=0))
+        transport.start()
+        transports.append(transport)
+        device = Device(transport.client)
+        device.initialize()
+        assert device.status & DeviceStatus.READY
+        device.on_monitor = lambda device, msg: None
+        device.tracer = tracer
+        return device
+
+    yield make
+    for transport in transports:
+        transport.stop()
+
+
+def test_stages(make_device):
+    sink = RingBufferSink(capacity=2)
+    device = make_device(Tracer(sink))
+    frame = DeviceEmulator().event_frame(EVENT_INVOKE)
+
+    # split the frame to trace the reception over several chunks
+    for _ in range(3):
+        device._client.on_recieve(frame[:100])
+        device._client.on_recieve(frame[100:])
+
+    frames = sink.frames()
+    assert len(frames) == 2
+    assert frames[-1].name == EVENT_INVOKE
+    assert [stage for stage, _, _ in frames[-1].stages] == [
+        "receive", "extract", "json", "decode", "annotate", "encode", "callback", "dispatch"]
+    assert all(end >= start for _, start, end in frames[-1].stages)
+    assert sink.summary()["callback"]["count"] == 2
+
+
+def test_disabled(make_device):
+    device = make_device(None)
+    assert device._client.tracer is None
+    device._client.on_recieve(DeviceEmulator().event_frame(EVENT_INVOKE))
+    assert device.stats()["frames"] == 1
+
+
+def test_chrome_trace(make_device, tmp_path):
+    path = tmp_path / "trace.json"
+    sink = ChromeTraceSink(str(path))
+    device = make_device(Tracer(sink))
+    device._client.on_recieve(DeviceEmulator().event_frame(EVENT_INVOKE) * 2)
+    sink.close()
+
+    events = json.loads(path.read_text())
+    assert len([e for e in events if e["name"] == EVENT_INVOKE]) == 2
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
@@ -0,0 +1,43 @@
+import os
+import base64
+import threading
+
+from sscma.utils.writer import FrameWriter
+
+
+def test_write(tmp_path):
+    os.makedirs(tmp_path / "raw")
+    writer = FrameWriter(str(tmp_path), workers=2, fsync_batch=4)
+    for i in range(10):
+        assert writer.submit(os.path.join("raw", "{}.jpg".format(i)), b"\xff\xd8" + bytes([i]))
+    writer.submit_base64("frame.jpg", base64.b64encode(b"jpeg").decode("utf-8"))
+    writer.close()
+
+    assert writer.written == 11
+    assert writer.dropped == 0
+    assert (tmp_path / "raw" / "3.jpg").read_bytes() == b"\xff\xd8\x03"
+    assert (tmp_path / "frame.jpg").read_bytes() == b"jpeg"
+    assert not writer.submit("late.jpg", b"")
+
+
+def test_drop(tmp_path, monkeypatch):
+    blocked = threading.Event()
+    release = threading.Event()
+    write = os.write
+
+    def slow_write(fd, data):
+        blocked.set()
+        release.wait()
+        return write(fd, data)
+
+    monkeypatch.setattr(os, "write", slow_write)
+    writer = FrameWriter(str(tmp_path), workers=1, queue_size=2)
+    writer.submit("0.jpg", b"0")
+    assert blocked.wait(5)
+    results = [writer.submit("{}.jpg".format(i), b"x") for i in range(1, 6)]
+    release.set()
+    writer.close()
+
+    assert results == [True, True, False, False, False]
+    assert writer.dropped == 3
+    assert writer.written == 3